@@ -0,0 +1,115 @@
+import os
+import shutil
+import threading
+from itertools import zip_longest
+
+
+def link_into(source, folder):
+    # Puts a finished file into another playlist folder, as a hard link when the
+    # filesystem allows it and as a copy otherwise.
+    dest = os.path.join(folder, os.path.basename(source))
+    if os.path.abspath(dest) == os.path.abspath(source) or os.path.exists(dest):
+        return dest
+    os.makedirs(folder, exist_ok=True)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+    return dest
+
+
+class PlaylistJob:
+    def __init__(self, playlist_id, name, folder, tracks, manifest=None, snapshot_id=None, all_tracks=None):
+        self.playlist_id = playlist_id
+        self.name = name
+        self.folder = folder
+        self.tracks = tracks
+        self.all_tracks = all_tracks if all_tracks is not None else tracks
+        self.manifest = manifest
+        self.snapshot_id = snapshot_id
+        self.total = len(tracks)
+        self.completed = 0
+        self.lock = threading.Lock()
+
+    def advance(self):
+        with self.lock:
+            self.completed += 1
+            return self.completed
+
+
+class Batch:
+    # One download request covering one or more playlists. A track that appears
+    # in several playlists is scheduled once and shared by all of its jobs.
+    def __init__(self, progress_callback=None, job_progress_callback=None, track_callback=None):
+        self.progress_callback = progress_callback
+        self.job_progress_callback = job_progress_callback
+        self.track_callback = track_callback
+        self.jobs = []
+        self.tracks = {}
+        self.job_tracks = []
+        self.cancelled = threading.Event()
+        self.condition = threading.Condition()
+        self.submitted = 0
+        self.completed = 0
+        self.failures = []
+
+    @property
+    def total(self):
+        return len(self.tracks)
+
+    def add_job(self, job, make_track, track_key):
+        self.jobs.append(job)
+        own = []
+        for song in job.tracks:
+            key = track_key(song)
+            track = self.tracks.get(key)
+            if track is None:
+                track = self.tracks[key] = make_track(song, job)
+                track["batch"] = self
+                track["jobs"] = []
+                own.append(track)
+            track["jobs"].append(job)
+        self.job_tracks.append(own)
+
+    def interleaved(self):
+        # Round-robin across playlists so one large playlist does not starve the
+        # others.
+        for group in zip_longest(*self.job_tracks):
+            for track in group:
+                if track is not None:
+                    yield track
+
+    def mark_submitted(self):
+        with self.condition:
+            self.submitted += 1
+
+    def track_done(self, track):
+        for job in track["jobs"]:
+            completed = job.advance()
+            if self.job_progress_callback:
+                self.job_progress_callback(job.name, completed, job.total)
+        # Before the count goes up, so wait() only returns once every callback ran.
+        if self.track_callback:
+            self.track_callback(track)
+        with self.condition:
+            self.completed += 1
+            completed = self.completed
+            self.condition.notify_all()
+        if self.progress_callback:
+            self.progress_callback(completed, self.total)
+
+    def record_failure(self, track, failure):
+        with self.condition:
+            self.failures.append((track["jobs"], failure))
+
+    def failures_for(self, job):
+        with self.condition:
+            return [failure for jobs, failure in self.failures if job in jobs]
+
+    def wait(self):
+        with self.condition:
+            while self.completed < self.submitted:
+                self.condition.wait()
+
+    def cancel(self):
+        self.cancelled.set()
@@ -0,0 +1,628 @@
+import os
+import io
+import sys
+import json
+import math
+import time
+import wave
+import random
+import struct
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing import get_context
+from urllib.parse import urlparse, parse_qs
+
+# Offline benchmarks for the download and export engines. Spotify is replaced
+# by a local HTTP server speaking the parts of the Web API the app uses, and
+# yt-dlp by a backend that serves synthetic WAV files; both have tunable
+# latency and error rates. Each scenario runs in its own process so peak RSS
+# and CPU time belong to that scenario alone.
+
+REPORT_VERSION = 1
+
+SCENARIOS = {
+    "download": {
+        "kind": "download", "playlists": 1, "tracks": 200, "shared": 0.0,
+        "search_latency": 0.02, "download_latency": 0.1, "error_rate": 0.0, "permanent_error_rate": 0.0,
+    },
+    "download-batch": {
+        "kind": "download", "playlists": 3, "tracks": 300, "shared": 0.3,
+        "search_latency": 0.02, "download_latency": 0.1, "error_rate": 0.02, "permanent_error_rate": 0.01,
+    },
+    "download-flaky": {
+        "kind": "download", "playlists": 1, "tracks": 200, "shared": 0.0,
+        "search_latency": 0.05, "download_latency": 0.2, "error_rate": 0.15, "permanent_error_rate": 0.05,
+    },
+    "download-transcode": {
+        "kind": "download", "playlists": 1, "tracks": 100, "shared": 0.0, "output_format": "mp3",
+        "search_latency": 0.02, "download_latency": 0.05, "error_rate": 0.0, "permanent_error_rate": 0.0,
+    },
+    "download-distributed": {
+        "kind": "distributed", "playlists": 3, "tracks": 300, "shared": 0.3, "nodes": 3,
+        "search_latency": 0.02, "download_latency": 0.1, "error_rate": 0.02, "permanent_error_rate": 0.01,
+        "lease_seconds": 10.0, "kill_node": 0, "kill_after": 0.0,
+    },
+    "export": {"kind": "export", "tracks": 2000, "search_latency": 0.02, "error_rate": 0.0, "engine": "async"},
+    "export-threads": {"kind": "export", "tracks": 2000, "search_latency": 0.02, "error_rate": 0.0, "engine": "threads"},
+    "export-stream": {"kind": "export-stream", "tracks": 2000, "search_latency": 0.02, "error_rate": 0.0},
+    "startup": {"kind": "startup", "budget_ms": 800, "repeats": 5},
+}
+DEFAULTS = {
+    "api_latency": 0.01, "host_rate": 1000.0, "file_size_kb": 256, "workers": 8, "adaptive": True, "retry_delay": 0.1, "seed": 1,
+    "output_format": "keep",
+}
+
+
+class BenchServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections when hundreds of
+    # lookups connect at once.
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def synthetic_wav(size_kb):
+    # A quiet 440 Hz tone, 8 kHz mono, padded to roughly size_kb.
+    frames = max(1, size_kb * 1024 // 2)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"".join(
+            struct.pack("<h", int(2000 * math.sin(2 * math.pi * 440 * i / 8000))) for i in range(min(frames, 8000))
+        ) * (frames // 8000 + 1))
+    return buffer.getvalue()
+
+
+def playlist_tracks(playlist_id, index, count, shared):
+    # The first `shared` share of every playlist is the same set of tracks.
+    shared_count = int(count * shared)
+    tracks = []
+    for i in range(count):
+        track_id = f"shared{i:06d}" if i < shared_count else f"{playlist_id}{i:06d}"
+        tracks.append({
+            "id": track_id,
+            "name": f"Song {track_id}",
+            "artists": [{"name": f"Artist {i % 97}"}],
+            "duration_ms": 180000 + (i % 60) * 1000,
+            "external_ids": {"isrc": f"BENCH{i:07d}"},
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+        })
+    return tracks
+
+
+class FakeSpotifyAPI:
+    # Token endpoint plus /playlists/{id} and paginated /playlists/{id}/tracks.
+    def __init__(self, playlists, latency=0.0, host="127.0.0.1"):
+        self.playlists = playlists
+        self.latency = latency
+        self.server = BenchServer((host, 0), self.handler())
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+
+    @property
+    def api_url(self):
+        return self.base_url + "/v1"
+
+    @property
+    def token_url(self):
+        return self.base_url + "/api/token"
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send_json(self, data, status=200):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self.send_json({"access_token": "bench", "token_type": "Bearer", "expires_in": 3600})
+
+            def do_GET(self):
+                time.sleep(api.latency)
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                if len(parts) < 3 or parts[:2] != ["v1", "playlists"] or parts[2] not in api.playlists:
+                    self.send_json({"error": {"status": 404, "message": "Not found"}}, 404)
+                    return
+                tracks = api.playlists[parts[2]]
+                if len(parts) == 3:
+                    self.send_json({"name": f"Bench {parts[2]}", "snapshot_id": "bench-1"})
+                    return
+                query = parse_qs(url.query)
+                offset = int(query.get("offset", ["0"])[0])
+                limit = int(query.get("limit", ["100"])[0])
+                items = [{"track": track} for track in tracks[offset:offset + limit]]
+                self.send_json({"items": items, "total": len(tracks), "offset": offset, "limit": limit})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeBackend:
+    # Stands in for yt-dlp behind YoutubeDLPool: `factory(opts)` returns a
+    # FakeYoutubeDL that shares this backend's latencies, error rates and audio.
+    def __init__(self, search_latency=0.0, download_latency=0.0, error_rate=0.0, permanent_error_rate=0.0,
+                 file_size_kb=256, seed=1):
+        self.search_latency = search_latency
+        self.download_latency = download_latency
+        self.error_rate = error_rate
+        self.permanent_error_rate = permanent_error_rate
+        self.audio = synthetic_wav(file_size_kb)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self):
+        with self.lock:
+            return self.random.random()
+
+    def factory(self, opts):
+        return FakeYoutubeDL(opts, self)
+
+
+class FakeYoutubeDL:
+    def __init__(self, params, backend):
+        self.params = params
+        self.backend = backend
+
+    def extract_info(self, url, download=False, process=True):
+        if url.startswith("ytsearch"):
+            time.sleep(self.backend.search_latency)
+            prefix, query = url.split(":", 1)
+            count = int(prefix[len("ytsearch"):] or 1)
+            slug = "".join(c if c.isalnum() else "_" for c in query)[:40]
+            return {"entries": [
+                {
+                    "id": f"{slug}_{k}",
+                    "url": f"https://www.youtube.com/watch?v={slug}_{k}",
+                    "title": query if k == 0 else f"{query} (live)",
+                    "duration": 180,
+                    "channel": "Bench - Topic" if k == 0 else "Someone",
+                }
+                for k in range(count)
+            ]}
+        video_id = url.rsplit("=", 1)[-1]
+        return {"id": video_id, "title": video_id, "webpage_url": url, "extractor": "bench"}
+
+    def process_ie_result(self, ie_result, download=True):
+        from yt_dlp.utils import DownloadError
+
+        roll = self.backend.roll()
+        if roll < self.backend.permanent_error_rate:
+            raise DownloadError("ERROR: [bench] Video unavailable")
+        if roll < self.backend.permanent_error_rate + self.backend.error_rate:
+            raise DownloadError("ERROR: [bench] Connection reset by peer")
+        # HLS so the downloader never tries to stream it through urlopen.
+        info = dict(ie_result, ext="wav", acodec="pcm_s16le", protocol="m3u8_native", url=ie_result["webpage_url"])
+        if not download:
+            return info
+        time.sleep(self.backend.download_latency)
+        path = self.prepare_filename(info)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".part", "wb") as f:
+            f.write(self.backend.audio)
+        os.replace(path + ".part", path)
+        size = len(self.backend.audio)
+        for hook in self.params.get("progress_hooks", []):
+            hook({"status": "finished", "filename": path, "downloaded_bytes": size, "total_bytes": size})
+        info["requested_downloads"] = [{"filepath": path}]
+        return info
+
+    def prepare_filename(self, info):
+        return self.params["outtmpl"] % {"id": info["id"], "title": info["title"], "ext": info.get("ext", "wav")}
+
+    def urlopen(self, request):
+        raise OSError("the benchmark backend does not stream")
+
+    def close(self):
+        pass
+
+
+# Modules that must not be loaded before the first download, export or scrape.
+STARTUP_HEAVY_MODULES = ("yt_dlp", "requests")
+# Builds the main window offscreen and reports how long that took and what got
+# imported. Without PyQt6 it imports the engine modules the window loads on
+# first use instead, which still catches an eager yt_dlp/requests import.
+STARTUP_PROBE = """
+import os, sys, json, time
+started = time.perf_counter()
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+try:
+    from PyQt6.QtWidgets import QApplication
+except ImportError:
+    import downloader, export, scrapper
+    target = "engine modules"
+else:
+    import ui
+    app = QApplication(sys.argv)
+    window = ui.SpotifyDownloaderUI()
+    window.show()
+    app.processEvents()
+    target = "window"
+print(json.dumps({"target": target, "ready_ms": (time.perf_counter() - started) * 1000, "modules": sorted(sys.modules)}))
+"""
+
+
+def parse_importtime(stderr, top=10):
+    # `python -X importtime` lines: "import time: self [us] | cumulative | name".
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        imports.append((int(cumulative) / 1000, name))
+    imports.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for ms, name in imports[:top]]
+
+
+def run_startup(params):
+    # Cold start as the user sees it: interpreter launch to an interactive
+    # window, median of a few runs, plus an import-time profile of one run.
+    root = os.path.dirname(os.path.abspath(__file__))
+    timings, probe = [], None
+    for _ in range(params["repeats"]):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=root, capture_output=True, text=True, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+        probe = json.loads(output.stdout.splitlines()[-1])
+    profile = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_PROBE], cwd=root,
+                             capture_output=True, text=True, check=True)
+    heavy = [name for name in STARTUP_HEAVY_MODULES if name in probe["modules"]]
+    startup_ms = percentile(timings, 0.5)
+    return {
+        "target": probe["target"],
+        "startup_ms": round(startup_ms, 1),
+        "ready_ms": round(probe["ready_ms"], 1),
+        "budget_ms": params["budget_ms"],
+        "heavy_modules": heavy,
+        "within_budget": startup_ms <= params["budget_ms"] and not heavy,
+        "slowest_imports": parse_importtime(profile.stderr),
+    }
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(count, done, failed, wall, cpu, latencies, extra=None):
+    result = {
+        "tracks": count,
+        "done": done,
+        "failed": failed,
+        "wall_seconds": round(wall, 3),
+        "tracks_per_minute": round(done / wall * 60, 1) if wall else None,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_ms_per_track": round(cpu / count * 1000, 2) if count else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    result.update(extra or {})
+    return result
+
+
+def bench_downloader(params, workdir, seed):
+    # A SpotifyDownloader backed by FakeBackend, with its databases and
+    # library in `workdir`, and the config to run it with.
+    from console import ConsoleLogger
+    from downloader import SpotifyDownloader
+
+    backend = FakeBackend(params["search_latency"], params["download_latency"], params["error_rate"],
+                          params["permanent_error_rate"], params["file_size_kb"], seed)
+    downloader = SpotifyDownloader(ConsoleLogger(quiet=True), cache_dir=workdir)
+    downloader.ydl_pool.factory = backend.factory
+    config = {
+        "client_id": "bench",
+        "client_secret": "bench",
+        "output_format": params["output_format"],
+        "store_dir": os.path.join(workdir, "library"),
+        "max_threads": params["workers"],
+        "adaptive_threads": params["adaptive"],
+        "retry_delay": params["retry_delay"],
+    }
+    return downloader, config
+
+
+def run_download(params, workdir):
+    playlists = {
+        f"bench{p}": playlist_tracks(f"bench{p}", p, params["tracks"], params["shared"])
+        for p in range(params["playlists"])
+    }
+    api = FakeSpotifyAPI(playlists, params["api_latency"]).start()
+    downloader, config = bench_downloader(params, workdir, params["seed"])
+    config.update(spotify_api_url=api.api_url, spotify_token_url=api.token_url)
+    events = downloader.metrics.subscribe(maxsize=0)
+    pipelines = []
+    acquire = downloader.acquire_pipeline
+
+    def keep_pipeline(config):
+        # The pipeline is dropped when the batch ends; keep it for its stats.
+        pipelines.append(acquire(config))
+        return pipelines[-1]
+
+    downloader.acquire_pipeline = keep_pipeline
+
+    started, cpu_started = time.perf_counter(), time.process_time()
+    downloader.download_batch(config, list(playlists), lambda completed, total: None, lambda: None)
+    wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    api.stop()
+
+    first_seen, latencies, states = {}, [], {}
+    while not events.empty():
+        event = events.get_nowait()
+        if event["type"] != "state":
+            continue
+        if event["state"] == "searching":
+            first_seen.setdefault(event["track"], event["time"])
+        elif event["state"] in ("done", "failed", "skipped"):
+            states[event["track"]] = event["state"]
+            if event["track"] in first_seen:
+                latencies.append(event["time"] - first_seen[event["track"]])
+    snapshot = downloader.metrics.snapshot()
+    done = sum(1 for state in states.values() if state == "done")
+    failed = sum(1 for state in states.values() if state == "failed")
+    return summarize(len(states), done, failed, wall, cpu, latencies, {
+        "retries": sum(snapshot["retries"].values()),
+        "bytes_downloaded": snapshot["bytes_downloaded"],
+        "stages": {name: {"throughput": round(s["throughput"], 2), "utilization": round(s["utilization"], 3)}
+                   for name, s in (pipelines[0].stats() if pipelines else {}).items()},
+    })
+
+
+NODE_PROBE = "import sys, json, benchmark; benchmark.run_node(*json.loads(sys.argv[1]))"
+
+
+def run_node(url, params, workdir, index):
+    # Entry point of one worker process in the distributed scenario. Node
+    # `kill_node` exits abruptly after `kill_after` seconds, leaving its leases
+    # to expire.
+    from distributed import CoordinatorClient, DistributedWorker
+
+    os.makedirs(workdir, exist_ok=True)
+    downloader, config = bench_downloader(params, workdir, params["seed"] + index)
+    worker = DistributedWorker(downloader, CoordinatorClient(url), config, worker_id=f"node{index}",
+                               output_dir=workdir, poll_interval=0.2, exit_when_done=True)
+    if index == params["kill_node"] and params["kill_after"]:
+        threading.Timer(params["kill_after"], os._exit, (1,)).start()
+    worker.run()
+
+
+def run_distributed(params, workdir):
+    from catalog import Catalog
+    from distributed import TaskQueue, enqueue_playlists, serve_coordinator
+    from spotify_api import SpotifyClient
+
+    playlists = {
+        f"bench{p}": playlist_tracks(f"bench{p}", p, params["tracks"], params["shared"])
+        for p in range(params["playlists"])
+    }
+    api = FakeSpotifyAPI(playlists, params["api_latency"]).start()
+    queue = TaskQueue(os.path.join(workdir, "coordinator.sqlite3"), lease_seconds=params["lease_seconds"])
+    spotify = SpotifyClient("bench", "bench", api_url=api.api_url, token_url=api.token_url)
+    enqueue_playlists(queue, spotify, Catalog(path=os.path.join(workdir, "catalog.sqlite3")), list(playlists),
+                      None, lambda message, color: None)
+    spotify.close()
+    api.stop()
+    server = serve_coordinator(queue, 0)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Separate interpreters, as on separate hosts. (The scenario process is a
+    # pool worker and may not fork children through multiprocessing.)
+    root = os.path.dirname(os.path.abspath(__file__))
+    started, times_started = time.perf_counter(), os.times()
+    nodes = [
+        subprocess.Popen([sys.executable, "-c", NODE_PROBE, json.dumps([url, params, os.path.join(workdir, f"node{i}"), i])],
+                         cwd=root)
+        for i in range(params["nodes"])
+    ]
+    for node in nodes:
+        node.wait()
+    wall, times = time.perf_counter() - started, os.times()
+    server.shutdown()
+
+    # Coordinator and node processes together.
+    cpu = sum(times[:4]) - sum(times_started[:4])
+    status = queue.status()
+    latencies = [row[0] for row in queue.connection().execute(
+        "SELECT updated - started FROM tasks WHERE state IN ('done', 'failed') AND started IS NOT NULL")]
+    states = status["states"]
+    return summarize(status["total"], states["done"], states["failed"], wall, cpu, latencies, {
+        "nodes": {w["worker"]: w["done"] for w in status["workers"]},
+        "left_in_queue": states["queued"] + states["leased"],
+    })
+
+
+def run_export(params, workdir, streaming):
+    from console import ConsoleLogger
+    from export import Exporter
+    from resolver import AsyncResolver
+
+    input_path = os.path.join(workdir, "bench.json")
+    with open(input_path, "w", encoding="utf-8") as f:
+        tracks = [
+            {"id": t["id"], "title": t["name"], "artist": t["artists"][0]["name"], "duration_ms": t["duration_ms"]}
+            for t in playlist_tracks("export", 0, params["tracks"], 0)
+        ]
+        json.dump({"playlist_name": "Bench", "total_tracks": len(tracks), "tracks": tracks}, f)
+        del tracks
+
+    backend = FakeBackend(search_latency=params["search_latency"], error_rate=params["error_rate"], seed=params["seed"])
+    exporter = Exporter(ConsoleLogger(quiet=True), cache_dir=workdir)
+    exporter.ydl_pool.factory = backend.factory
+    exporter.engine = params.get("engine", "threads")
+    exporter.host_rate = params["host_rate"]
+    latencies = []
+    resolve = exporter.get_first_youtube_url
+
+    def timed_resolve(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return resolve(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    search_async = AsyncResolver.search
+
+    async def timed_search(self, *args, **kwargs):
+        # Timed once a lookup holds a concurrency slot, like a thread worker.
+        started = time.perf_counter()
+        try:
+            return await search_async(self, *args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    exporter.get_first_youtube_url = timed_resolve
+    AsyncResolver.search = timed_search
+    started, cpu_started = time.perf_counter(), time.process_time()
+    options = {"max_workers": params["workers"], "adaptive": params["adaptive"]}
+    if streaming:
+        exporter.stream_export(input_path, "ndjson", workdir, **options)
+    else:
+        exporter.export_playlist(input_path, "json", workdir, **options)
+    wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    return summarize(params["tracks"], len(latencies), 0, wall, cpu, latencies)
+
+
+def run_scenario(params):
+    # Entry point of the scenario process.
+    workdir = tempfile.mkdtemp(prefix="spotify-bench-")
+    os.chdir(workdir)
+    if params["kind"] == "download":
+        return run_download(params, workdir)
+    if params["kind"] == "distributed":
+        return run_distributed(params, workdir)
+    return run_export(params, workdir, streaming=params["kind"] == "export-stream")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names, overrides):
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scenarios": {},
+    }
+    context = get_context("spawn")
+    for name in names:
+        if SCENARIOS[name]["kind"] == "startup":
+            params = dict(SCENARIOS[name], **{key: overrides[key] for key in SCENARIOS[name] if overrides.get(key)})
+            results = run_startup(params)
+            report["scenarios"][name] = {"params": params, "results": results}
+            print(f"{name}: {results['target']} ready in {results['startup_ms']} ms (budget {results['budget_ms']} ms)"
+                  + (f", loaded {', '.join(results['heavy_modules'])}" if results["heavy_modules"] else ""),
+                  file=sys.stderr)
+            continue
+        params = dict(DEFAULTS, **SCENARIOS[name])
+        params.update({key: value for key, value in overrides.items() if value is not None})
+        with context.Pool(1) as pool:
+            results = pool.apply(run_scenario, (params,))
+        report["scenarios"][name] = {"params": params, "results": results}
+        print(f"{name}: {results['tracks_per_minute']} tracks/min, p50 {results['latency_p50']:.3f}s, "
+              f"p99 {results['latency_p99']:.3f}s, {results['cpu_ms_per_track']} CPU ms/track, "
+              f"peak RSS {results['peak_rss_mb']} MB", file=sys.stderr)
+    return report
+
+
+def compare(baseline, report):
+    # Relative change of the headline numbers for scenarios present in both.
+    lines = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for key in ("tracks_per_minute", "latency_p50", "latency_p99", "cpu_ms_per_track", "peak_rss_mb", "startup_ms"):
+            old, new = previous["results"].get(key), current["results"].get(key)
+            if old and new is not None:
+                lines.append(f"{name:16} {key:18} {old:>10.3f} -> {new:>10.3f} ({(new - old) / old:+.1%})")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput and startup benchmarks")
+    parser.add_argument("scenarios", nargs="*", choices=[[], *SCENARIOS], default=[], metavar="scenario",
+                        help=f"any of: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--tracks", type=int)
+    parser.add_argument("--playlists", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--fixed-workers", dest="adaptive", action="store_const", const=False)
+    parser.add_argument("--engine", choices=("async", "threads"), help="export resolution engine")
+    parser.add_argument("--host-rate", type=float, help="async export requests per second per host")
+    parser.add_argument("--api-latency", type=float)
+    parser.add_argument("--search-latency", type=float)
+    parser.add_argument("--download-latency", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--permanent-error-rate", type=float)
+    parser.add_argument("--file-size-kb", type=int)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--budget-ms", type=float, help="startup budget; exit with status 1 when it is exceeded")
+    parser.add_argument("--nodes", type=int, help="worker processes in the distributed scenario")
+    parser.add_argument("--kill-after", type=float, help="kill one distributed worker after this many seconds")
+    args = parser.parse_args(argv)
+
+    overrides = {key: value for key, value in vars(args).items() if key not in ("scenarios", "output", "compare")}
+    report = run_benchmarks(args.scenarios or list(SCENARIOS), overrides)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print(compare(json.load(f), report))
+    over_budget = [name for name, scenario in report["scenarios"].items()
+                   if scenario["results"].get("within_budget") is False]
+    if over_budget:
+        print(f"Over the startup budget: {', '.join(over_budget)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import os
+import time
+from database import Database
+from search_cache import CACHE_DIR, make_key
+from spotify_api import track_record
+
+CATALOG_NAME = "catalog.sqlite3"
+DEFAULT_CATALOG_PATH = os.path.join(CACHE_DIR, CATALOG_NAME)
+TRACK_FIELDS = ("id", "title", "artist", "url", "duration_ms", "isrc")
+
+
+def catalog_key(track):
+    # Same key the downloader and the journal use for a track.
+    return track.get("id") or make_key(track["title"], track["artist"])
+
+
+class Catalog(Database):
+    # Every playlist, album or liked-songs listing the app has fetched, and
+    # every track in them, in one SQLite file. A listing is replaced page by
+    # page as it is fetched; tracks are shared between listings and keep what
+    # is known about them locally (the YouTube video and the downloaded file).
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        super().__init__(path)
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS playlists ("
+                "playlist_id TEXT PRIMARY KEY, name TEXT NOT NULL, kind TEXT NOT NULL, snapshot_id TEXT, "
+                "total INTEGER, complete INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "track_key TEXT PRIMARY KEY, track_id TEXT, title TEXT NOT NULL, artist TEXT NOT NULL, url TEXT, "
+                "duration_ms INTEGER, isrc TEXT, video_id TEXT, video_url TEXT, file TEXT, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS playlist_tracks ("
+                "playlist_id TEXT NOT NULL, position INTEGER NOT NULL, track_key TEXT NOT NULL, "
+                "PRIMARY KEY (playlist_id, position))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS playlists_name ON playlists (name)")
+
+    def begin_playlist(self, playlist_id, name, kind="playlist", snapshot_id=None):
+        # Drops the stored listing; add_tracks() then writes the new one.
+        with self.connection() as conn:
+            conn.execute("DELETE FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO playlists (playlist_id, name, kind, snapshot_id, total, complete, updated) "
+                "VALUES (?, ?, ?, ?, NULL, 0, ?)",
+                (playlist_id, name, kind, snapshot_id, time.time()),
+            )
+
+    def add_tracks(self, playlist_id, tracks, position=0):
+        # One transaction per page. Returns the position after the last track.
+        now = time.time()
+        rows = [(catalog_key(t), t.get("id"), t["title"], t["artist"], t.get("url"), t.get("duration_ms"),
+                 t.get("isrc"), now) for t in tracks]
+        with self.connection() as conn:
+            conn.executemany(
+                "INSERT INTO tracks (track_key, track_id, title, artist, url, duration_ms, isrc, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (track_key) DO UPDATE SET "
+                "track_id = excluded.track_id, title = excluded.title, artist = excluded.artist, url = excluded.url, "
+                "duration_ms = COALESCE(excluded.duration_ms, tracks.duration_ms), "
+                "isrc = COALESCE(excluded.isrc, tracks.isrc), updated = excluded.updated",
+                rows,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO playlist_tracks (playlist_id, position, track_key) VALUES (?, ?, ?)",
+                [(playlist_id, position + i, row[0]) for i, row in enumerate(rows)],
+            )
+        return position + len(rows)
+
+    def finish_playlist(self, playlist_id, total):
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE playlists SET total = ?, complete = 1, updated = ? WHERE playlist_id = ?",
+                (total, time.time(), playlist_id),
+            )
+
+    def playlist(self, playlist_id):
+        row = self.connection().execute(
+            "SELECT playlist_id, name, kind, snapshot_id, total, complete FROM playlists WHERE playlist_id = ?",
+            (playlist_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("playlist_id", "name", "kind", "snapshot_id", "total", "complete"), row))
+
+    def find_playlist(self, name_or_id):
+        row = self.connection().execute(
+            "SELECT playlist_id FROM playlists WHERE playlist_id = ? OR name = ? ORDER BY updated DESC LIMIT 1",
+            (name_or_id, name_or_id),
+        ).fetchone()
+        return self.playlist(row[0]) if row else None
+
+    def cached_listing(self, playlist_id, snapshot_id):
+        # The stored tracks when the listing is complete and still at this
+        # snapshot, so the API does not have to be paged again; else None.
+        playlist = self.playlist(playlist_id)
+        if not playlist or not playlist["complete"] or not snapshot_id or playlist["snapshot_id"] != snapshot_id:
+            return None
+        return list(self.iter_tracks(playlist_id))
+
+    def fetch_playlist(self, spotify, playlist_id, name, snapshot_id=None, market=None):
+        # (tracks, cached): the stored listing when it is unchanged, otherwise
+        # the API's, written into the catalog page by page as it arrives.
+        tracks = self.cached_listing(playlist_id, snapshot_id)
+        if tracks is not None:
+            return tracks, True
+        self.begin_playlist(playlist_id, name, "playlist", snapshot_id)
+        tracks = []
+        for page in spotify.iter_playlist_tracks(playlist_id, market):
+            # Podcast episodes and unavailable entries have no artists.
+            records = [track_record(track) for track in page if track.get("artists")]
+            self.add_tracks(playlist_id, records, len(tracks))
+            tracks.extend(records)
+        self.finish_playlist(playlist_id, len(tracks))
+        return tracks, False
+
+    def iter_tracks(self, playlist_id, batch_size=1000):
+        # Track records in playlist order, shaped like spotify_api.track_record.
+        cursor = self.connection().execute(
+            "SELECT t.track_id, t.title, t.artist, t.url, t.duration_ms, t.isrc FROM playlist_tracks p "
+            "JOIN tracks t ON t.track_key = p.track_key WHERE p.playlist_id = ? ORDER BY p.position",
+            (playlist_id,),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(TRACK_FIELDS, row))
+
+    def set_videos(self, rows):
+        # Records the resolved video for (video_url, track_key) rows.
+        now = time.time()
+        with self.connection() as conn:
+            conn.executemany(
+                "UPDATE tracks SET video_url = ?, updated = ? WHERE track_key = ?",
+                [(video_url, now, track_key) for video_url, track_key in rows],
+            )
+
+    def set_file(self, track_key, path, video_id=None, video_url=None):
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE tracks SET file = ?, video_id = COALESCE(?, video_id), video_url = COALESCE(?, video_url), "
+                "updated = ? WHERE track_key = ?",
+                (os.path.abspath(path), video_id, video_url, time.time(), track_key),
+            )
@@ -0,0 +1,312 @@
+import os
+import sys
+import time
+import argparse
+from console import ConsoleLogger, ConsoleProgress
+
+# Headless entry point. Nothing here (or in the modules it loads) imports Qt,
+# so it can run on servers, in cron or as many small worker processes.
+
+
+def add_spotify_args(parser):
+    parser.add_argument("--client-id", default=os.environ.get("SPOTIFY_CLIENT_ID", ""))
+    parser.add_argument("--client-secret", default=os.environ.get("SPOTIFY_CLIENT_SECRET", ""))
+    parser.add_argument("--market", default=os.environ.get("SPOTIFY_MARKET", "ES"))
+
+
+def add_concurrency_args(parser):
+    parser.add_argument("--min-workers", type=int, default=2, help="lowest worker count under throttling")
+    parser.add_argument("--max-workers", type=int, default=32, help="highest worker count on a fast link")
+    parser.add_argument("--fixed-workers", action="store_true", help="keep --workers constant")
+
+
+def add_store_args(parser):
+    parser.add_argument("--store-dir", default=".library", help="shared audio store all playlists link into")
+    parser.add_argument("--link-mode", choices=("hardlink", "symlink", "m3u"), default="hardlink")
+    parser.add_argument("--no-store", action="store_true", help="download into each playlist folder separately")
+
+
+def add_pipeline_args(parser):
+    parser.add_argument("--ffmpeg", default="", help="path to the ffmpeg executable")
+    parser.add_argument("--workers", type=int, default=8, help="search/download workers to start with")
+    add_concurrency_args(parser)
+    parser.add_argument("--transcode-workers", type=int, default=None)
+    parser.add_argument("--output-format", choices=("mp3", "auto", "remux", "keep"), default="mp3")
+    parser.add_argument("--streaming", action="store_true", help="pipe audio straight into ffmpeg")
+    add_store_args(parser)
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this port")
+
+
+def add_download_args(parser):
+    add_spotify_args(parser)
+    parser.add_argument("playlists", nargs="+", help="Spotify playlist URLs or IDs")
+    add_pipeline_args(parser)
+    parser.add_argument("--prune", action="store_true", help="delete tracks removed from the playlist")
+
+
+def download_config(args, sync):
+    stage_workers = {}
+    if args.transcode_workers:
+        stage_workers["transcode"] = args.transcode_workers
+    return {
+        # Workers get their tracks from a coordinator and have no Spotify options.
+        "client_id": getattr(args, "client_id", ""),
+        "client_secret": getattr(args, "client_secret", ""),
+        "market": getattr(args, "market", "ES"),
+        "ffmpeg_path": args.ffmpeg,
+        "max_threads": args.workers,
+        "min_threads": args.min_workers,
+        "thread_ceiling": args.max_workers,
+        "adaptive_threads": not args.fixed_workers,
+        "stage_workers": stage_workers,
+        "output_format": args.output_format,
+        "streaming": args.streaming,
+        "sync": sync,
+        "prune": getattr(args, "prune", False),
+        "use_store": not args.no_store,
+        "store_dir": args.store_dir,
+        "link_mode": args.link_mode,
+    }
+
+
+def log_summary(logger, snapshot):
+    states = snapshot["states"]
+    logger.log_signal.emit(
+        f"[Metrics] done={states['done']} failed={states['failed']} skipped={states['skipped']} "
+        f"retries={sum(snapshot['retries'].values())} "
+        f"{snapshot['bytes_downloaded'] / 1024 / 1024:.1f} MB in {snapshot['elapsed']:.1f}s",
+        "cyan",
+    )
+
+
+def run_download(args, logger, sync=False):
+    from downloader import SpotifyDownloader
+
+    downloader = SpotifyDownloader(logger)
+    config = download_config(args, sync)
+    if args.metrics_port:
+        from metrics import serve_prometheus
+
+        serve_prometheus(downloader.metrics, args.metrics_port)
+    while True:
+        try:
+            downloader.download_batch(config, args.playlists, ConsoleProgress(label="Download"), lambda: None)
+        except KeyboardInterrupt:
+            # download_batch has already cancelled the batch on its way out.
+            return 130
+        log_summary(logger, downloader.metrics.snapshot())
+        if not getattr(args, "interval", None):
+            return 0
+        time.sleep(args.interval)
+
+
+def run_coordinator(args, logger):
+    from catalog import Catalog
+    from distributed import DEFAULT_QUEUE_PATH, TaskQueue, enqueue_playlists, serve_coordinator
+    from spotify_api import SpotifyClient, parse_spotify_id
+
+    queue = TaskQueue(args.queue or DEFAULT_QUEUE_PATH, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+    if args.playlists:
+        spotify = SpotifyClient(args.client_id, args.client_secret)
+        try:
+            playlist_ids = [parse_spotify_id(url, "playlist") for url in args.playlists]
+            enqueue_playlists(queue, spotify, Catalog(), playlist_ids, args.market, logger.log_signal.emit)
+        except Exception as e:
+            logger.log_signal.emit(f"[Error] Could not queue playlists: {e}", "red")
+            return 1
+        finally:
+            spotify.close()
+    server = serve_coordinator(queue, args.port, args.host, args.token or None)
+    logger.log_signal.emit(f"[Coordinator] Serving on http://{args.host}:{server.server_address[1]}", "#5cb3ff")
+    progress = ConsoleProgress(label="Coordinator", interval=args.status_interval)
+    shown = None
+    try:
+        while True:
+            status = queue.status()
+            states = status["states"]
+            finished = (states["done"] + states["failed"], status["total"])
+            if finished != shown:
+                progress(*finished)
+                shown = finished
+            if status["drained"] and not args.keep_running:
+                break
+            time.sleep(1)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        server.shutdown()
+    failures = queue.failures()
+    for failure in failures:
+        logger.log_signal.emit(f"[Coordinator] Failed: {failure['title']} - {failure['artist']}: {failure['error']}", "yellow")
+    logger.log_signal.emit(f"[Coordinator] {states['done']} done, {states['failed']} failed", "cyan")
+    return 1 if failures else 0
+
+
+def run_worker(args, logger):
+    from downloader import SpotifyDownloader
+    from distributed import CoordinatorClient, DistributedWorker
+
+    downloader = SpotifyDownloader(logger)
+    config = download_config(args, sync=False)
+    if args.metrics_port:
+        from metrics import serve_prometheus
+
+        serve_prometheus(downloader.metrics, args.metrics_port)
+    worker = DistributedWorker(
+        downloader,
+        CoordinatorClient(args.coordinator, args.token or None),
+        config,
+        worker_id=args.worker_id or None,
+        output_dir=args.output_dir,
+        lease_size=args.lease_size,
+        exit_when_done=args.exit_when_done,
+    )
+    worker.run()
+    log_summary(logger, downloader.metrics.snapshot())
+    return 1 if worker.error else 0
+
+
+def run_gc(args, logger):
+    from store import AudioStore
+
+    store = AudioStore(args.store_dir)
+    removed, freed = store.gc(dry_run=args.dry_run)
+    verb = "Would remove" if args.dry_run else "Removed"
+    logger.log_signal.emit(f"[Store] {verb} {removed} unused files ({freed / 1024 / 1024:.1f} MB)", "white")
+    return 0
+
+
+def run_scrape(args, logger):
+    from scrapper import SpotifyScrapper
+
+    config = {
+        "client_id": args.client_id,
+        "client_secret": args.client_secret,
+        "playlist_url": args.playlist,
+        "market": args.market,
+        "access_token": args.access_token or None,
+    }
+    return 0 if SpotifyScrapper(logger).scrap(config, save_as=args.format) else 1
+
+
+def run_export(args, logger):
+    from export import CATALOG_PREFIX, EXPORT_INPUTS, STREAM_INPUTS, Exporter
+
+    stream = args.stream or args.format == "ndjson"
+    if not args.input.startswith(CATALOG_PREFIX):
+        supported = STREAM_INPUTS if stream else EXPORT_INPUTS
+        if not args.input.endswith(supported):
+            logger.log_signal.emit(f"[Error] Unsupported input file: {args.input} (expected {', '.join(supported)})", "red")
+            return 1
+        if not os.path.isfile(args.input):
+            logger.log_signal.emit(f"[Error] Input file not found: {args.input}", "red")
+            return 1
+    exporter = Exporter(logger)
+    exporter.engine = args.engine
+    exporter.concurrency = args.concurrency
+    options = dict(
+        max_workers=args.workers,
+        progress_callback=ConsoleProgress(label="Export"),
+        min_workers=args.min_workers,
+        worker_ceiling=args.max_workers,
+        adaptive=not args.fixed_workers,
+    )
+    if stream:
+        output = exporter.stream_export(
+            args.input,
+            export_type=args.format,
+            output_dir=args.output_dir,
+            window=args.window,
+            ordered=not args.unordered,
+            resume=not args.no_resume,
+            **options,
+        )
+        return 0 if output else 1
+    output = exporter.export_playlist(args.input, export_type=args.format, output_dir=args.output_dir, **options)
+    return 0 if output else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="spotify-downloader", description="Headless Spotify playlist downloader")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser("download", help="download one or more playlists")
+    add_download_args(download)
+
+    sync = commands.add_parser("sync", help="download only tracks that are not on disk yet")
+    add_download_args(sync)
+    sync.add_argument("--interval", type=float, default=None, help="keep running, re-syncing every N seconds")
+
+    gc = commands.add_parser("gc", help="delete stored audio no playlist links to any more")
+    gc.add_argument("--store-dir", default=".library")
+    gc.add_argument("--dry-run", action="store_true")
+
+    scrape = commands.add_parser("scrape", help="save playlist, album or liked-songs metadata to Scrapper/")
+    add_spotify_args(scrape)
+    scrape.add_argument("playlist", help="Spotify playlist or album URL/ID, or 'liked' for your liked songs")
+    scrape.add_argument("--access-token", default=os.environ.get("SPOTIFY_ACCESS_TOKEN", ""),
+                        help="user token with user-library-read, needed for liked songs")
+    scrape.add_argument("--format", choices=("json", "csv"), default="json")
+
+    coordinator = commands.add_parser("coordinator", help="queue playlists and hand their tracks out to workers")
+    add_spotify_args(coordinator)
+    coordinator.add_argument("playlists", nargs="*", help="Spotify playlist URLs or IDs to queue")
+    coordinator.add_argument("--host", default="127.0.0.1", help="address to listen on (0.0.0.0 for other hosts)")
+    coordinator.add_argument("--port", type=int, default=8765)
+    coordinator.add_argument("--token", default=os.environ.get("COORDINATOR_TOKEN", ""),
+                             help="shared secret workers must send")
+    coordinator.add_argument("--queue", default=None, help="task queue database (default cache/coordinator.sqlite3)")
+    coordinator.add_argument("--lease-seconds", type=float, default=120.0,
+                             help="how long a worker may hold a track without a heartbeat")
+    coordinator.add_argument("--max-attempts", type=int, default=3, help="leases per track before it counts as failed")
+    coordinator.add_argument("--keep-running", action="store_true", help="keep serving after the queue is drained")
+    coordinator.add_argument("--status-interval", type=float, default=5.0)
+
+    worker = commands.add_parser("worker", help="download tracks handed out by a coordinator")
+    worker.add_argument("coordinator", help="coordinator URL, e.g. http://host:8765")
+    worker.add_argument("--token", default=os.environ.get("COORDINATOR_TOKEN", ""))
+    worker.add_argument("--worker-id", default="", help="name shown by the coordinator (default host-pid)")
+    worker.add_argument("--output-dir", default=".", help="where playlist folders are created")
+    worker.add_argument("--lease-size", type=int, default=None, help="tracks leased at a time")
+    worker.add_argument("--exit-when-done", action="store_true", help="stop once the coordinator's queue is drained")
+    add_pipeline_args(worker)
+
+    export = commands.add_parser("export", help="resolve YouTube URLs for a scraped playlist")
+    export.add_argument("input", help="scraped .json, .ndjson or .csv file, or catalog:<playlist name or ID>")
+    export.add_argument("--format", choices=("json", "csv", "ndjson"), default="json")
+    export.add_argument("--output-dir", default="Scrapper")
+    export.add_argument("--workers", type=int, default=5)
+    export.add_argument("--engine", choices=("threads", "async"), default="threads",
+                        help="resolve with a pool of yt-dlp searches or drive them from one event loop")
+    export.add_argument("--concurrency", type=int, default=32, help="searches in flight with --engine async")
+    export.add_argument("--stream", action="store_true", help="write results as they resolve, in constant memory")
+    export.add_argument("--window", type=int, default=64, help="tracks in flight while streaming")
+    export.add_argument("--unordered", action="store_true", help="write streamed results in completion order")
+    export.add_argument("--no-resume", action="store_true", help="start a streamed export over instead of resuming")
+    add_concurrency_args(export)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logger = ConsoleLogger(quiet=args.quiet)
+    if args.command == "download":
+        return run_download(args, logger)
+    if args.command == "sync":
+        return run_download(args, logger, sync=True)
+    if args.command == "gc":
+        return run_gc(args, logger)
+    if args.command == "scrape":
+        return run_scrape(args, logger)
+    if args.command == "export":
+        return run_export(args, logger)
+    if args.command == "coordinator":
+        return run_coordinator(args, logger)
+    if args.command == "worker":
+        return run_worker(args, logger)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
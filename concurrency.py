@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import contextmanager
+from statistics import median
+from retry import THROTTLED, classify
+
+DEFAULT_FLOOR = 2
+DEFAULT_CEILING = 32
+MIN_WINDOW = 4
+MAX_ERROR_RATE = 0.5
+
+
+def is_throttled(error):
+    return classify(error) == THROTTLED
+
+
+class AIMDController:
+    # Additive-increase / multiplicative-decrease limit on how many tasks run at
+    # once. Completions are grouped into windows of about `limit` tasks; a window
+    # that keeps throughput up without inflating latency adds one slot, while a
+    # throttling error (429, "Sign in to confirm") halves the limit at once and
+    # a window with many errors or with latency well above the best seen so far
+    # and no throughput gain halves it at the end of that window.
+    def __init__(self, floor=DEFAULT_FLOOR, ceiling=DEFAULT_CEILING, initial=None, name="",
+                 increase=1, decrease=0.5, latency_tolerance=2.0, cooldown=5.0, on_change=None):
+        self.floor = max(1, int(floor))
+        self.ceiling = max(self.floor, int(ceiling))
+        self.name = name
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.on_change = on_change
+        self.limit = min(max(int(initial or self.floor), self.floor), self.ceiling)
+        self.active = 0
+        self.condition = threading.Condition()
+        self.baseline_latency = None
+        self.last_rate = None
+        self.last_decrease = 0.0
+        self.throttled = 0
+        self.increases = 0
+        self.decreases = 0
+        self.reset_window()
+
+    def reset_window(self):
+        self.window_started = time.monotonic()
+        self.window_done = 0
+        self.window_errors = 0
+        self.window_bytes = 0
+        self.window_latency = []
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release()
+            self.record(time.monotonic() - started)
+
+    def add_bytes(self, count):
+        with self.condition:
+            self.window_bytes += count
+
+    def record(self, latency=None):
+        changes = []
+        with self.condition:
+            self.window_done += 1
+            if latency is not None:
+                self.window_latency.append(latency)
+            if self.window_done >= max(self.limit, MIN_WINDOW):
+                changes = self.adjust()
+        self.notify(changes)
+
+    def record_error(self, error):
+        changes = []
+        with self.condition:
+            if is_throttled(error):
+                self.throttled += 1
+                changes = self.shrink("throttled")
+            else:
+                self.window_errors += 1
+        self.notify(changes)
+
+    def adjust(self):
+        elapsed = max(time.monotonic() - self.window_started, 1e-6)
+        # Bytes/s when the stage reports them, completed tasks/s otherwise.
+        rate = (self.window_bytes or self.window_done) / elapsed
+        error_rate = self.window_errors / self.window_done
+        latency = median(self.window_latency) if self.window_latency else None
+        if latency is not None and (self.baseline_latency is None or latency < self.baseline_latency):
+            self.baseline_latency = latency
+        slower = self.last_rate is not None and rate <= self.last_rate
+
+        if error_rate > MAX_ERROR_RATE:
+            return self.shrink("errors")
+        if slower and latency is not None and latency > self.baseline_latency * self.latency_tolerance:
+            return self.shrink("latency")
+        changes = []
+        if self.last_rate is None or rate >= self.last_rate * 0.9:
+            changes = self.grow()
+        self.last_rate = rate
+        self.reset_window()
+        return changes
+
+    def grow(self):
+        if self.limit >= self.ceiling:
+            return []
+        old = self.limit
+        self.limit = min(self.ceiling, self.limit + self.increase)
+        self.increases += 1
+        self.condition.notify_all()
+        return [(old, self.limit, "increase")]
+
+    def shrink(self, reason):
+        now = time.monotonic()
+        self.last_rate = None
+        self.reset_window()
+        if now - self.last_decrease < self.cooldown or self.limit <= self.floor:
+            return []
+        self.last_decrease = now
+        old = self.limit
+        self.limit = max(self.floor, int(self.limit * self.decrease))
+        self.decreases += 1
+        return [(old, self.limit, reason)]
+
+    def notify(self, changes):
+        if self.on_change:
+            for old, new, reason in changes:
+                self.on_change(self.name, old, new, reason)
+
+    def stats(self):
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "floor": self.floor,
+                "ceiling": self.ceiling,
+                "throttled": self.throttled,
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
@@ -0,0 +1,55 @@
+import sys
+import time
+import threading
+from datetime import datetime
+
+
+class Signal:
+    # Minimal stand-in for a pyqtSignal so the core modules can log through
+    # `logger.log_signal.emit(message, color)` without importing Qt.
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self, *args):
+        for slot in self.slots:
+            slot(*args)
+
+
+class ConsoleLogger:
+    def __init__(self, stream=None, quiet=False):
+        self.stream = stream or sys.stderr
+        self.quiet = quiet
+        self.lock = threading.Lock()
+        self.log_signal = Signal()
+        self.log_signal.connect(self.write)
+
+    def write(self, message, color="white"):
+        if self.quiet and color not in ("red", "yellow"):
+            return
+        timestamp = datetime.now().strftime("[%H:%M:%S]")
+        with self.lock:
+            self.stream.write(f"{timestamp} {message}\n")
+            self.stream.flush()
+
+
+class ConsoleProgress:
+    # Progress callback for terminals; redraws at most every `interval` seconds.
+    def __init__(self, stream=None, interval=0.5, label="Progress"):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.label = label
+        self.lock = threading.Lock()
+        self.last_draw = 0.0
+
+    def __call__(self, completed, total):
+        now = time.monotonic()
+        with self.lock:
+            if completed < total and now - self.last_draw < self.interval:
+                return
+            self.last_draw = now
+            percentage = int((completed / total) * 100) if total else 100
+            self.stream.write(f"[{self.label}] {completed}/{total} ({percentage}%)\n")
+            self.stream.flush()
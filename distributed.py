@@ -0,0 +1,542 @@
+import os
+import hmac
+import json
+import time
+import socket
+import threading
+from batch import Batch, PlaylistJob
+from catalog import catalog_key
+from database import Database
+from search_cache import CACHE_DIR
+from sync import SyncManifest
+
+# Coordinator/worker mode. The coordinator lists the playlists once and owns
+# the track queue; headless workers on any number of hosts lease tracks over
+# HTTP, run them through their own SpotifyDownloader pipeline and report each
+# result. A lease that is not renewed by heartbeats expires and the track goes
+# back to the queue, so a worker that dies only delays its tracks.
+
+DEFAULT_QUEUE_PATH = os.path.join(CACHE_DIR, "coordinator.sqlite3")
+DEFAULT_PORT = 8765
+LEASE_SECONDS = 120.0
+MAX_ATTEMPTS = 3
+# Workers post finished tracks this often, at most REPORT_BATCH per request.
+REPORT_INTERVAL = 0.5
+REPORT_BATCH = 500
+
+
+class CoordinatorError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class TaskQueue(Database):
+    # One row per unique track. A track in several playlists is downloaded once
+    # and linked into each of them by the worker that gets it. State goes
+    # queued -> leased -> done | failed; expired leases go back to queued until
+    # a track has been leased `max_attempts` times. Everything is in SQLite, so
+    # a restarted coordinator carries on where it stopped.
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        super().__init__(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Leasing reads then updates; the lock keeps two workers from getting
+        # the same rows.
+        self.lock = threading.Lock()
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "track_key TEXT PRIMARY KEY, song TEXT NOT NULL, position INTEGER NOT NULL, "
+                "state TEXT NOT NULL, worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "output TEXT, error TEXT, started REAL, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_playlists ("
+                "playlist_id TEXT NOT NULL, track_key TEXT NOT NULL, name TEXT NOT NULL, "
+                "PRIMARY KEY (playlist_id, track_key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                "worker TEXT PRIMARY KEY, last_seen REAL NOT NULL, done INTEGER NOT NULL DEFAULT 0, "
+                "failed INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, position)")
+            conn.execute("CREATE INDEX IF NOT EXISTS task_playlists_track ON task_playlists (track_key)")
+
+    def add_playlist(self, playlist_id, name, songs):
+        # Queues the playlist's tracks. Tracks that are already done stay done,
+        # failed ones get a fresh set of attempts. Returns how many are queued.
+        now = time.time()
+        rows = [(catalog_key(song), json.dumps(song, ensure_ascii=False), position, now)
+                for position, song in enumerate(songs)]
+        with self.lock, self.connection() as conn:
+            conn.executemany(
+                "INSERT INTO tasks (track_key, song, position, state, updated) VALUES (?, ?, ?, 'queued', ?) "
+                "ON CONFLICT (track_key) DO UPDATE SET song = excluded.song, "
+                "state = CASE WHEN tasks.state = 'failed' THEN 'queued' ELSE tasks.state END, "
+                "attempts = CASE WHEN tasks.state = 'failed' THEN 0 ELSE tasks.attempts END, "
+                "updated = excluded.updated",
+                rows,
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO task_playlists (playlist_id, track_key, name) VALUES (?, ?, ?)",
+                [(playlist_id, row[0], name) for row in rows],
+            )
+            return conn.execute(
+                "SELECT COUNT(*) FROM task_playlists p JOIN tasks t ON t.track_key = p.track_key "
+                "WHERE p.playlist_id = ? AND t.state = 'queued'",
+                (playlist_id,),
+            ).fetchone()[0]
+
+    def seen(self, conn, worker, now, done=0, failed=0):
+        conn.execute(
+            "INSERT INTO workers (worker, last_seen, done, failed) VALUES (?, ?, ?, ?) ON CONFLICT (worker) "
+            "DO UPDATE SET last_seen = excluded.last_seen, done = workers.done + excluded.done, "
+            "failed = workers.failed + excluded.failed",
+            (worker, now, done, failed),
+        )
+
+    def requeue_expired(self, conn, now):
+        conn.execute(
+            "UPDATE tasks SET state = 'failed', worker = NULL, error = 'lease expired', updated = ? "
+            "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, self.max_attempts),
+        )
+        return conn.execute(
+            "UPDATE tasks SET state = 'queued', worker = NULL, updated = ? WHERE state = 'leased' AND lease_expires < ?",
+            (now, now),
+        ).rowcount
+
+    def lease(self, worker, count):
+        # Up to `count` queued tracks in playlist order, each with the
+        # playlists it belongs to.
+        now = time.time()
+        with self.lock, self.connection() as conn:
+            self.seen(conn, worker, now)
+            self.requeue_expired(conn, now)
+            rows = conn.execute(
+                "SELECT track_key, song, attempts FROM tasks WHERE state = 'queued' ORDER BY position, rowid LIMIT ?",
+                (count,),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "started = COALESCE(started, ?), updated = ? WHERE track_key = ?",
+                [(worker, now + self.lease_seconds, now, now, key) for key, _, _ in rows],
+            )
+        tasks = []
+        for key, song, attempts in rows:
+            playlists = self.connection().execute(
+                "SELECT playlist_id, name FROM task_playlists WHERE track_key = ? ORDER BY playlist_id", (key,),
+            ).fetchall()
+            tasks.append({
+                "key": key,
+                "song": json.loads(song),
+                "attempt": attempts + 1,
+                "playlists": [{"playlist_id": playlist_id, "name": name} for playlist_id, name in playlists],
+            })
+        return tasks
+
+    def heartbeat(self, worker, keys):
+        # Renews the worker's leases on `keys`; returns the keys it no longer
+        # holds (expired and handed to someone else).
+        now = time.time()
+        keys = list(keys)
+        with self.lock, self.connection() as conn:
+            self.seen(conn, worker, now)
+            conn.executemany(
+                "UPDATE tasks SET lease_expires = ? WHERE track_key = ? AND worker = ? AND state = 'leased'",
+                [(now + self.lease_seconds, key, worker) for key in keys],
+            )
+            held = set()
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                held.update(key for (key,) in conn.execute(
+                    f"SELECT track_key FROM tasks WHERE worker = ? AND state = 'leased' "
+                    f"AND track_key IN ({','.join('?' * len(chunk))})",
+                    [worker, *chunk],
+                ))
+        return [key for key in keys if key not in held]
+
+    def complete(self, worker, results):
+        # Results for tracks whose lease the worker has lost are dropped; the
+        # track is someone else's now. A result that carries its lease's
+        # "attempt" is also dropped once the track has been leased again, even
+        # to the same worker. A skipped track (the worker was stopped) goes
+        # back to the queue.
+        now = time.time()
+        accepted = 0
+        done = failed = 0
+        with self.lock, self.connection() as conn:
+            for result in results:
+                state = result.get("state")
+                attempt = result.get("attempt")
+                if state == "skipped":
+                    cursor = conn.execute(
+                        "UPDATE tasks SET state = 'queued', worker = NULL, attempts = MAX(attempts - 1, 0), "
+                        "updated = ? WHERE track_key = ? AND worker = ? AND state = 'leased' "
+                        "AND (? IS NULL OR attempts = ?)",
+                        (now, result["key"], worker, attempt, attempt),
+                    )
+                else:
+                    cursor = conn.execute(
+                        "UPDATE tasks SET state = ?, worker = ?, output = ?, error = ?, updated = ? "
+                        "WHERE track_key = ? AND worker = ? AND state = 'leased' AND (? IS NULL OR attempts = ?)",
+                        ("done" if state == "done" else "failed", worker, result.get("output"),
+                         result.get("error"), now, result["key"], worker, attempt, attempt),
+                    )
+                if cursor.rowcount:
+                    accepted += 1
+                    done += state == "done"
+                    failed += state not in ("done", "skipped")
+            self.seen(conn, worker, now, done, failed)
+        return accepted
+
+    def release(self, worker):
+        # Puts a departing worker's leases back without counting the attempt.
+        with self.lock, self.connection() as conn:
+            return conn.execute(
+                "UPDATE tasks SET state = 'queued', worker = NULL, attempts = MAX(attempts - 1, 0), updated = ? "
+                "WHERE worker = ? AND state = 'leased'",
+                (time.time(), worker),
+            ).rowcount
+
+    def status(self):
+        now = time.time()
+        with self.lock, self.connection() as conn:
+            self.requeue_expired(conn, now)
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+            workers = conn.execute(
+                "SELECT w.worker, w.last_seen, w.done, w.failed, "
+                "(SELECT COUNT(*) FROM tasks t WHERE t.worker = w.worker AND t.state = 'leased') "
+                "FROM workers w ORDER BY w.worker"
+            ).fetchall()
+        states = {state: counts.get(state, 0) for state in ("queued", "leased", "done", "failed")}
+        return {
+            "states": states,
+            "total": sum(states.values()),
+            "drained": not states["queued"] and not states["leased"],
+            "workers": [
+                {"worker": worker, "idle_seconds": round(now - last_seen, 1), "done": done, "failed": failed,
+                 "leased": leased}
+                for worker, last_seen, done, failed, leased in workers
+            ],
+        }
+
+    def failures(self):
+        rows = self.connection().execute(
+            "SELECT song, attempts, error FROM tasks WHERE state = 'failed' ORDER BY position"
+        ).fetchall()
+        return [dict(json.loads(song), attempts=attempts, error=error) for song, attempts, error in rows]
+
+
+def serve_coordinator(queue, port=DEFAULT_PORT, host="127.0.0.1", token=None):
+    # JSON over HTTP, one POST per operation, GET /status for monitoring. With
+    # a token, every request must carry "Authorization: Bearer <token>".
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    routes = {
+        "/lease": lambda body: {"tasks": queue.lease(body["worker"], int(body.get("count", 1))),
+                                "lease_seconds": queue.lease_seconds},
+        "/heartbeat": lambda body: {"lost": queue.heartbeat(body["worker"], body.get("keys", []))},
+        "/complete": lambda body: {"accepted": queue.complete(body["worker"], body.get("results", []))},
+        "/release": lambda body: {"released": queue.release(body["worker"])},
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def authorized(self):
+            if not token:
+                return True
+            return hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}")
+
+        def reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if not self.authorized():
+                return self.reply(401, {"error": "unauthorized"})
+            if self.path != "/status":
+                return self.reply(404, {"error": "not found"})
+            self.reply(200, queue.status())
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not self.authorized():
+                return self.reply(401, {"error": "unauthorized"})
+            route = routes.get(self.path)
+            if route is None:
+                return self.reply(404, {"error": "not found"})
+            try:
+                payload = route(json.loads(body or b"{}"))
+            except (KeyError, TypeError, ValueError) as e:
+                return self.reply(400, {"error": f"bad request: {e}"})
+            self.reply(200, payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def enqueue_playlists(queue, spotify, catalog, playlist_ids, market, log):
+    # Lists each playlist through the catalog and queues its tracks. Returns
+    # the number of tracks queued.
+    queued = 0
+    for playlist_id in playlist_ids:
+        playlist = spotify.get_playlist(playlist_id, fields="name,snapshot_id")
+        name = playlist["name"].strip()
+        tracks, cached = catalog.fetch_playlist(spotify, playlist_id, name, playlist.get("snapshot_id"), market)
+        added = queue.add_playlist(playlist_id, name, tracks)
+        queued += added
+        source = "catalog" if cached else "Spotify"
+        log(f"[Coordinator] {name}: {len(tracks)} tracks from {source}, {added} queued", "#ff6de3")
+    return queued
+
+
+class CoordinatorClient:
+    def __init__(self, url, token=None, timeout=30):
+        import requests
+
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def call(self, path, payload=None):
+        import requests
+
+        try:
+            if payload is None:
+                response = self.session.get(self.url + path, timeout=self.timeout)
+            else:
+                response = self.session.post(self.url + path, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise CoordinatorError(f"{self.url}{path}: {e}") from e
+        if response.status_code != 200:
+            raise CoordinatorError(f"{self.url}{path}: HTTP {response.status_code} {response.text[:200]}",
+                                   response.status_code)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise CoordinatorError(f"{self.url}{path}: invalid response ({e})") from e
+
+    def close(self):
+        self.session.close()
+
+
+class DistributedWorker:
+    # Pulls tracks from a coordinator and runs them through `downloader`.
+    # `slots` lease loops run side by side, each with one leased batch in the
+    # pipeline at a time, so the pipeline keeps working while the next batch is
+    # leased. Finished tracks are queued locally and posted in batches by the
+    # heartbeat thread, never from a pipeline worker. Playlist folders go under
+    # `output_dir`, with the same manifest, store and journal handling as a
+    # local download.
+    def __init__(self, downloader, client, config, worker_id=None, output_dir=".", lease_size=None, slots=2,
+                 poll_interval=2.0, exit_when_done=False):
+        self.downloader = downloader
+        self.client = client
+        self.config = config
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.output_dir = output_dir
+        self.lease_size = lease_size or max(4, 2 * config.get("max_threads", 8))
+        self.slots = slots
+        self.poll_interval = poll_interval
+        self.exit_when_done = exit_when_done
+        self.lease_seconds = LEASE_SECONDS
+        self.stopped = threading.Event()
+        self.error = None
+        self.lock = threading.Lock()
+        # Leased track key -> attempt, echoed back with the result.
+        self.in_flight = {}
+        self.results = []
+        self.manifests = {}
+        self.started_jobs = set()
+        self.completed = 0
+
+    def log(self, message, color="white"):
+        self.downloader.log(message, color)
+
+    def run(self):
+        self.log(f"[Worker] {self.worker_id} pulling from {self.client.url}", "#5cb3ff")
+        # Held for the whole run, so the pipeline (and what its adaptive
+        # controllers have learned) survives between leased batches.
+        self.downloader.acquire_pipeline(self.config)
+        heartbeat = threading.Thread(target=self.heartbeat_loop, daemon=True)
+        heartbeat.start()
+        loops = [threading.Thread(target=self.lease_loop, daemon=True) for _ in range(self.slots)]
+        try:
+            for loop in loops:
+                loop.start()
+            for loop in loops:
+                while loop.is_alive():
+                    loop.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for loop in loops:
+                loop.join()
+        finally:
+            self.stopped.set()
+            self.downloader.release_pipeline()
+            heartbeat.join()
+            for attempt in range(3):
+                if self.flush():
+                    break
+                time.sleep(1 + attempt)
+            else:
+                # Their leases expire and the tracks are downloaded again elsewhere.
+                self.log(f"[Worker] Could not report {len(self.results)} results", "yellow")
+            try:
+                self.client.call("/release", {"worker": self.worker_id})
+            except CoordinatorError as e:
+                self.log(f"[Worker] Could not release leases: {e}", "yellow")
+        self.log(f"[Worker] {self.worker_id} finished {self.completed} tracks", "#00ffaa")
+        return self.completed
+
+    def stop(self):
+        self.stopped.set()
+        self.downloader.cancel()
+
+    def lease_loop(self):
+        while not self.stopped.is_set():
+            try:
+                reply = self.client.call("/lease", {"worker": self.worker_id, "count": self.lease_size})
+            except CoordinatorError as e:
+                if e.status in (401, 404):
+                    # Wrong token or not a coordinator; retrying will not help.
+                    self.log(f"[Error] {e}", "red")
+                    self.error = e
+                    self.stopped.set()
+                    return
+                self.log(f"[Worker] {e}", "yellow")
+                self.stopped.wait(self.poll_interval)
+                continue
+            self.lease_seconds = reply.get("lease_seconds", self.lease_seconds)
+            if not reply["tasks"]:
+                if self.exit_when_done and self.drained():
+                    self.stopped.set()
+                    return
+                self.stopped.wait(self.poll_interval)
+                continue
+            try:
+                self.run_tasks(reply["tasks"])
+            except Exception as e:
+                # The leases expire and the tracks go to another worker.
+                self.log(f"[Error] Leased batch failed: {e}", "red")
+
+    def drained(self):
+        try:
+            return self.client.call("/status")["drained"]
+        except CoordinatorError:
+            return False
+
+    def manifest_for(self, folder):
+        with self.lock:
+            if folder not in self.manifests:
+                self.manifests[folder] = SyncManifest(folder)
+            return self.manifests[folder]
+
+    def start_job(self, playlist_id, name, folder):
+        # The playlist spans many leased batches, so its journal job is opened
+        # once per worker and left running: the coordinator knows when it is done.
+        with self.lock:
+            if playlist_id in self.started_jobs:
+                return
+            self.started_jobs.add(playlist_id)
+        self.downloader.journal.start_job(playlist_id, name, folder)
+
+    def run_tasks(self, tasks):
+        songs = {}
+        names = {}
+        for task in tasks:
+            for playlist in task["playlists"]:
+                songs.setdefault(playlist["playlist_id"], []).append(task["song"])
+                names[playlist["playlist_id"]] = playlist["name"]
+        batch = Batch(track_callback=self.report)
+        for playlist_id, playlist_songs in songs.items():
+            folder = os.path.join(self.output_dir, names[playlist_id])
+            os.makedirs(folder, exist_ok=True)
+            self.start_job(playlist_id, names[playlist_id], folder)
+            job = PlaylistJob(playlist_id, names[playlist_id], folder, playlist_songs, self.manifest_for(folder))
+            batch.add_job(job, lambda song, job: self.downloader.make_track(song, job, self.config),
+                          self.downloader.track_key)
+        with self.lock:
+            self.in_flight.update((task["key"], task.get("attempt")) for task in tasks)
+        with self.downloader.lock:
+            self.downloader.batches.append(batch)
+        try:
+            self.downloader.run_batch(batch, self.config)
+        finally:
+            with self.downloader.lock:
+                self.downloader.batches.remove(batch)
+            for job in batch.jobs:
+                job.manifest.save()
+            with self.lock:
+                # Whatever was never submitted (the worker is stopping) goes back.
+                unsent = [key for key in self.in_flight if key in batch.tracks]
+                self.results.extend({"key": key, "state": "skipped", "attempt": self.in_flight.pop(key)}
+                                    for key in unsent)
+
+    def report(self, track):
+        # Called from the pipeline as each track finishes: only queues the result.
+        result = track.get("result") or {"state": "failed"}
+        outputs = track.get("outputs") or {}
+        payload = {
+            "key": track["key"],
+            "state": result["state"],
+            "output": next(iter(outputs.values()), None),
+            "error": result.get("error"),
+        }
+        with self.lock:
+            payload["attempt"] = self.in_flight.pop(track["key"], None)
+            self.results.append(payload)
+            if result["state"] == "done":
+                self.completed += 1
+
+    def flush(self):
+        # Posts the queued results. Returns False if some could not be sent;
+        # they stay queued for the next call.
+        while True:
+            with self.lock:
+                results = self.results[:REPORT_BATCH]
+            if not results:
+                return True
+            try:
+                self.client.call("/complete", {"worker": self.worker_id, "results": results})
+            except CoordinatorError as e:
+                self.log(f"[Worker] Could not report {len(results)} results: {e}", "yellow")
+                return False
+            with self.lock:
+                del self.results[:len(results)]
+
+    def heartbeat_loop(self):
+        # Posts finished tracks every REPORT_INTERVAL and renews the leases of
+        # the others every third of the lease time.
+        renewed = time.monotonic()
+        while not self.stopped.wait(REPORT_INTERVAL):
+            self.flush()
+            if time.monotonic() - renewed < max(1.0, self.lease_seconds / 3):
+                continue
+            renewed = time.monotonic()
+            with self.lock:
+                keys = list(self.in_flight)
+            if not keys:
+                continue
+            try:
+                lost = self.client.call("/heartbeat", {"worker": self.worker_id, "keys": keys})["lost"]
+            except CoordinatorError as e:
+                self.log(f"[Worker] Heartbeat failed: {e}", "yellow")
+                continue
+            if lost:
+                self.log(f"[Worker] {len(lost)} leases expired and were handed to other workers", "yellow")
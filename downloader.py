@@ -1,9 +1,27 @@
 import os
-import requests
-import base64
-import yt_dlp
 import threading
-import time
+import copy
+import sqlite3
+from scheduler import Scheduler, JobCancelled
+from search_cache import CACHE_DIR, CACHE_NAME, SearchCache, make_key
+from ranking import rank_candidates
+from sync import SyncManifest
+from journal import JOURNAL_NAME, PARTIAL_GRACE, JobJournal, remove_partials
+from catalog import CATALOG_NAME, Catalog
+from ydl_pool import YoutubeDLPool
+from batch import Batch, PlaylistJob, link_into
+from store import AudioStore, DEFAULT_STORE_DIR
+from metrics import Metrics
+from concurrency import AIMDController, DEFAULT_CEILING, DEFAULT_FLOOR
+from retry import PERMANENT, RetryPolicy, RetryQueue, classify, write_failure_report
+from spotify_api import API_URL, TOKEN_URL, SpotifyClient, parse_spotify_id
+from ffmpeg_manager import get_ffmpeg_path
+from transcode import (
+    COPY_ARGS, CODECS, DEFAULT_ALLOWED_CODECS, TranscodeError, TranscodePool, can_stream, codec_name,
+    format_selector, iter_http_chunks, output_action, write_stream,
+)
+
+BYTES_REPORT_SIZE = 1024 * 1024
 
 class SilentLogger:
     def debug(self, msg):
@@ -13,164 +31,751 @@ class SilentLogger:
     def error(self, msg):
         print(msg)
 
+SILENT_LOGGER = SilentLogger()
+
+STAGES = ("search", "download", "transcode")
+ADAPTIVE_STAGES = ("search", "download")
+
+class DownloadPipeline:
+    # search -> download -> transcode, each stage with its own worker pool and
+    # bounded queue. The I/O stages get many threads; the transcode stage is
+    # sized to the CPU count because each of its workers drives one ffmpeg process.
+    # Stages with a controller resize themselves between its floor and ceiling.
+    # Failed tasks wait out their backoff in the retry queue, not in a worker.
+    def __init__(self, stage_workers=None, queue_size=None, controllers=None, retry_policy=None):
+        workers = {"search": 8, "download": 8, "transcode": os.cpu_count() or 2}
+        workers.update(stage_workers or {})
+        self.controllers = controllers or {}
+        self.stages = {
+            name: Scheduler(max_workers=workers[name], queue_size=queue_size, name=name, controller=self.controllers.get(name))
+            for name in STAGES
+        }
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retries = RetryQueue()
+
+    def start(self):
+        for stage in self.stages.values():
+            stage.start()
+        self.retries.start()
+
+    def submit(self, stage, fn, *args, **kwargs):
+        return self.stages[stage].submit(fn, *args, **kwargs)
+
+    def submit_later(self, delay, stage, fn, *args, cancelled=None):
+        # Goes to the back of the stage queue once the delay is over.
+        self.retries.schedule(delay, lambda: self.submit(stage, fn, *args), cancelled)
+
+    def shutdown(self):
+        self.retries.shutdown()
+        for stage in self.stages.values():
+            stage.shutdown()
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    def add_bytes(self, count):
+        controller = self.controllers.get("download")
+        if controller is not None:
+            controller.add_bytes(count)
+
+    def record_error(self, stage, error):
+        controller = self.controllers.get(stage)
+        if controller is not None:
+            controller.record_error(error)
+
 class SpotifyDownloader:
-    def __init__(self, logger):
+    def __init__(self, logger, cache_dir=CACHE_DIR):
         self.logger = logger
-        self.total_tracks = 0
-        self.completed_tracks = 0
         self.lock = threading.Lock()
-        self.active_threads = []
+        self.pipeline = None
+        self.pipeline_users = 0
+        self.batches = []
+        self.search_cache = SearchCache(os.path.join(cache_dir, CACHE_NAME))
+        self.ydl_pool = YoutubeDLPool()
+        self.metrics = Metrics()
+        self.journal = JobJournal(os.path.join(cache_dir, JOURNAL_NAME))
+        self.catalog = Catalog(os.path.join(cache_dir, CATALOG_NAME))
+        self.stores = {}
+        self.transcoders = {}
+        self.transcoders_lock = threading.Lock()
+        # (store, video, variant) -> Event set once the track downloading it is done.
+        self.claims = {}
+        self.claims_lock = threading.Lock()
+        self.current = threading.local()
 
     def log(self, message, color="white"):
         self.logger.log_signal.emit(message, color)
 
+    def cancel(self):
+        with self.lock:
+            batches = list(self.batches)
+        if batches:
+            self.log("[Cancel] Cancelling download...", "yellow")
+        for batch in batches:
+            batch.cancel()
+
+    def stats(self):
+        return self.pipeline.stats() if self.pipeline else {}
+
     def start_download(self, config, progress_callback, finished_callback):
         thread = threading.Thread(target=self.download_playlist, args=(config, progress_callback, finished_callback), daemon=True)
         thread.start()
 
+    def start_batch(self, config, playlist_urls, progress_callback, finished_callback, job_progress_callback=None):
+        thread = threading.Thread(target=self.download_batch, args=(config, playlist_urls, progress_callback, finished_callback, job_progress_callback), daemon=True)
+        thread.start()
+
     def download_playlist(self, config, progress_callback, finished_callback):
+        self.download_batch(config, [config.get("playlist_url")], progress_callback, finished_callback)
+
+    def download_batch(self, config, playlist_urls, progress_callback, finished_callback, job_progress_callback=None):
         CLIENT_ID = config.get("client_id")
         CLIENT_SECRET = config.get("client_secret")
-        PLAYLIST_URL = config.get("playlist_url")
-        MARKET = config.get("market", "ES")
-        FFMPEG_PATH = config.get("ffmpeg_path")
-        OUTPUT_JSON = "playlist.json"
-
-        if "playlist/" in PLAYLIST_URL:
-            PLAYLIST_ID = PLAYLIST_URL.split("playlist/")[1].split("?")[0]
-        else:
-            PLAYLIST_ID = PLAYLIST_URL
+        spotify = SpotifyClient(CLIENT_ID, CLIENT_SECRET, access_token=config.get("access_token"),
+                                api_url=config.get("spotify_api_url", API_URL), token_url=config.get("spotify_token_url", TOKEN_URL))
 
         try:
             self.log("[Token] Requesting token from Spotify...", "#ffca4e")
-            auth_str = f"{CLIENT_ID}:{CLIENT_SECRET}"
-            b64_auth_str = base64.b64encode(auth_str.encode()).decode()
-            token_url = "https://accounts.spotify.com/api/token"
-            headers = {"Authorization": f"Basic {b64_auth_str}"}
-            data = {"grant_type": "client_credentials"}
-            response = requests.post(token_url, headers=headers, data=data)
-            response.raise_for_status()
-            access_token = response.json()["access_token"]
+            spotify.token()
             self.log("[Token] Successfully obtained access token", "#ffca4e")
         except Exception as e:
             self.log(f"[Error] Token request failed: {e}", "red")
+            spotify.close()
             finished_callback()
             return
 
+        batch = Batch(progress_callback, job_progress_callback)
+        with self.lock:
+            if not self.batches:
+                self.metrics.reset()
+            self.batches.append(batch)
         try:
-            self.log("[Playlist] Fetching playlist details...", "#ff6de3")
-            playlist_url = f"https://api.spotify.com/v1/playlists/{PLAYLIST_ID}"
-            headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(playlist_url, headers=headers)
-            response.raise_for_status()
-            playlist_data = response.json()
-
-            playlist_name = playlist_data["name"].strip()
-            if not os.path.exists(playlist_name):
-                os.makedirs(playlist_name)
-
-            tracks = []
-            url = f"https://api.spotify.com/v1/playlists/{PLAYLIST_ID}/tracks"
-            params = {"market": MARKET, "limit": 100}
-
-            while url:
-                r = requests.get(url, headers=headers, params=params)
-                r.raise_for_status()
-                data = r.json()
-                for item in data["items"]:
-                    track = item["track"]
-                    if track:
-                        tracks.append({
-                            "title": track["name"],
-                            "artist": ", ".join(a["name"] for a in track["artists"]),
-                            "url": track["external_urls"]["spotify"]
-                        })
-                url = data["next"]
-                params = None
-
-            with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-                import json
-                json.dump({"playlist_id": PLAYLIST_ID, "playlist_name": playlist_name, "total_tracks": len(tracks), "tracks": tracks}, f, ensure_ascii=False, indent=4)
-            self.log(f"[Playlist] Saved metadata to {OUTPUT_JSON}", "#ff6de3")
-
-            self.total_tracks = len(tracks)
-            self.completed_tracks = 0
-            progress_callback(self.completed_tracks, self.total_tracks)
-
-            MAX_THREADS = 5
-            self.active_threads = []
+            for playlist_url in playlist_urls:
+                if batch.cancelled.is_set():
+                    break
+                try:
+                    job = self.fetch_job(spotify, parse_spotify_id(playlist_url, "playlist"), config)
+                except Exception as e:
+                    self.log(f"[Error] Playlist {playlist_url} failed: {e}", "red")
+                    continue
+                if job is not None:
+                    batch.add_job(job, lambda song, job: self.make_track(song, job, config), self.track_key)
 
-            for song in tracks:
-                query = f"{song['title']} {song['artist']}"
-                # Wait until threads < MAX_THREADS
-                while True:
-                    self.active_threads = [t for t in self.active_threads if t.is_alive()]
-                    if len(self.active_threads) < MAX_THREADS:
-                        break
-                    time.sleep(0.5)
+            if len(batch.jobs) > 1:
+                shared = sum(job.total for job in batch.jobs) - batch.total
+                self.log(f"[Batch] {batch.total} unique tracks across {len(batch.jobs)} playlists ({shared} shared)", "#ff6de3")
+            progress_callback(0, batch.total)
 
-                t = threading.Thread(target=self.download_first_audio_mp3, args=(query, playlist_name, FFMPEG_PATH, progress_callback))
-                t.start()
-                self.active_threads.append(t)
+            if batch.total:
+                self.run_batch(batch, config)
 
-            for t in self.active_threads:
-                t.join()
+            for job in batch.jobs:
+                if all(job.manifest.is_synced(t["id"]) for t in job.all_tracks if t.get("id")):
+                    job.manifest.snapshot_id = job.snapshot_id
+                job.manifest.save()
+                if not batch.cancelled.is_set():
+                    # A cancelled job stays open in the journal and resumes on
+                    # the next run.
+                    self.journal.finish_job(job.playlist_id)
+                    remove_partials(job.folder)
+                store = self.store_for(config)
+                if store:
+                    entries = (job.manifest.tracks.get(t.get("id")) for t in job.all_tracks)
+                    store.write_m3u(job.folder, [os.path.join(job.folder, e["file"]) for e in entries if e])
+                report = write_failure_report(job.folder, batch.failures_for(job))
+                if report:
+                    self.log(f"[Report] {len(batch.failures_for(job))} failed tracks listed in {report}", "yellow")
 
+            with self.lock:
+                alone = self.batches == [batch]
+            store = self.store_for(config)
+            if store and alone and not batch.cancelled.is_set():
+                # Downloads and conversions go into the store, so their leftovers
+                # are there too. Other batches and other processes may still be
+                # writing to it, so only stale partials are removed.
+                remove_partials(store.objects_dir, recursive=True, older_than=PARTIAL_GRACE)
+            if config.get("sync") and config.get("prune") and alone:
+                # Pruned tracks may have been the last link to a stored file.
+                self.collect_garbage(config)
+
+            if batch.cancelled.is_set():
+                self.log("[Cancel] Download cancelled", "yellow")
             finished_callback()
 
         except Exception as e:
             self.log(f"[Error] Playlist download failed: {e}", "red")
             finished_callback()
+        finally:
+            with self.lock:
+                self.batches.remove(batch)
+            spotify.close()
 
-    def download_first_audio_mp3(self, query, folder, ffmpeg_path, progress_callback):
+    def run_batch(self, batch, config):
+        # Feeds the batch's tracks into the shared pipeline and waits until
+        # every submitted track is done, failed or skipped.
+        pipeline = self.acquire_pipeline(config)
         try:
-            self.log(f"[Search] Looking for: {query}", "#5cb3ff")
-            ydl_opts_search = {'quiet': True, 'extract_flat': True, 'default_search': 'ytsearch'}
-            with yt_dlp.YoutubeDL(ydl_opts_search) as ydl:
-                result = ydl.extract_info(f"ytsearch10:{query}", download=False)  # search up to 10 results
-                video_url = None
-
-                for entry in result.get('entries', []):
-                    try:
-                        # Try to download this video
-                        ydl.extract_info(entry['url'], download=False)
-                        video_url = entry['url']
-                        break
-                    except yt_dlp.utils.DownloadError as e:
-                        if "DRM protected" in str(e):
-                            self.log(f"[Skip] Video DRM protected: {entry['title']}", "yellow")
-                            continue
-                        else:
-                            self.log(f"[Skip] Other error: {e}", "yellow")
-                            continue
-
-                if video_url is None:
-                    self.log(f"[Error] {query}: No downloadable videos found", "red")
+            for track in batch.interleaved():
+                self.transition(track, "queued", query=track["query"])
+                if batch.cancelled.is_set():
+                    break
+                pipeline.submit("search", self.search_stage, track)
+                batch.mark_submitted()
+            batch.wait()
+        except KeyboardInterrupt:
+            # Skip the queued tracks before the pipeline is released; the jobs
+            # stay open in the journal and resume on the next run.
+            batch.cancel()
+            raise
+        finally:
+            self.release_pipeline()
+
+    def collect_garbage(self, config, dry_run=False):
+        store = self.store_for(config)
+        if store is None:
+            return 0, 0
+        removed, freed = store.gc(dry_run=dry_run)
+        verb = "Would remove" if dry_run else "Removed"
+        self.log(f"[Store] {verb} {removed} unused files ({freed / 1024 / 1024:.1f} MB)", "gray")
+        return removed, freed
+
+    def fetch_job(self, spotify, playlist_id, config):
+        MARKET = config.get("market", "ES")
+        SYNC = config.get("sync", False)
+        PRUNE = config.get("prune", False)
+
+        self.log("[Playlist] Fetching playlist details...", "#ff6de3")
+        playlist_data = spotify.get_playlist(playlist_id, fields="name,snapshot_id")
+
+        playlist_name = playlist_data["name"].strip()
+        if not os.path.exists(playlist_name):
+            os.makedirs(playlist_name)
+
+        manifest = SyncManifest(playlist_name)
+        snapshot_id = playlist_data.get("snapshot_id")
+        if SYNC and not PRUNE and manifest.is_complete(snapshot_id):
+            self.log(f"[Sync] {playlist_name} is up to date", "#00ffaa")
+            return None
+        resumed = self.journal.start_job(playlist_id, playlist_name, playlist_name)
+
+        tracks, cached = self.catalog.fetch_playlist(spotify, playlist_id, playlist_name, snapshot_id, MARKET)
+        if cached:
+            self.log(f"[Playlist] Loaded {len(tracks)} tracks from the catalog (playlist unchanged)", "#ff6de3")
+        else:
+            self.log(f"[Playlist] Saved {len(tracks)} tracks to the catalog", "#ff6de3")
+
+        all_tracks = tracks
+        if resumed:
+            finished = self.journal.completed(playlist_id)
+            pending = []
+            for song in tracks:
+                key = self.track_key(song)
+                if key not in finished:
+                    pending.append(song)
+                    continue
+                if not manifest.is_synced(song.get("id")):
+                    manifest.record(song.get("id"), finished[key], song)
+                self.metrics.transition(key, "skipped", query=f"{song['title']} {song['artist']}")
+            self.log(f"[Resume] {playlist_name}: {len(tracks) - len(pending)} tracks already finished, {len(pending)} left", "#ff6de3")
+            tracks = pending
+
+        if SYNC:
+            if PRUNE:
+                # Against the whole playlist: tracks finished before a resume
+                # are still in it.
+                for path in manifest.prune(manifest.removed(all_tracks)):
+                    self.log(f"[Sync] Removed: {os.path.basename(path)}", "yellow")
+            pending = manifest.missing(tracks)
+            for song in tracks:
+                if manifest.is_synced(song.get("id")):
+                    self.metrics.transition(self.track_key(song), "skipped", query=f"{song['title']} {song['artist']}")
+            self.log(f"[Sync] {len(tracks) - len(pending)} tracks already downloaded, {len(pending)} to download", "#ff6de3")
+            tracks = pending
+
+        return PlaylistJob(playlist_id, playlist_name, playlist_name, tracks, manifest, snapshot_id, all_tracks)
+
+    def track_key(self, song):
+        return song.get("id") or make_key(song["title"], song["artist"])
+
+    def make_track(self, song, job, config):
+        output_format = config.get("output_format", "mp3")
+        allowed_codecs = tuple(config.get("allowed_codecs") or DEFAULT_ALLOWED_CODECS)
+        store = self.store_for(config)
+        # Store files are keyed by video and by what the output policy made of it.
+        variant = output_format if output_format != "auto" else "auto:" + ",".join(allowed_codecs)
+        outtmpl = store.output_template(variant) if store else os.path.join(job.folder, '%(title)s.%(ext)s')
+        return {
+            "key": self.track_key(song),
+            "query": f"{song['title']} {song['artist']}",
+            "song": song,
+            "track_id": song.get("id"),
+            "ydl_opts": self.download_options(outtmpl, config.get("ffmpeg_path"), format_selector(output_format, allowed_codecs)),
+            "stream": config.get("streaming", False),
+            "output_format": output_format,
+            "allowed_codecs": allowed_codecs,
+            "store": store,
+            "variant": variant,
+        }
+
+    def store_for(self, config):
+        if not config.get("use_store", True):
+            return None
+        root = os.path.abspath(config.get("store_dir") or DEFAULT_STORE_DIR)
+        link_mode = config.get("link_mode", "hardlink")
+        with self.lock:
+            store = self.stores.get((root, link_mode))
+            if store is None:
+                store = self.stores[(root, link_mode)] = AudioStore(root, link_mode)
+            return store
+
+    def acquire_pipeline(self, config):
+        # All running batches share one pipeline so their tracks go through the
+        # same queues and worker limits.
+        with self.lock:
+            if self.pipeline is None:
+                stage_workers = {"search": config.get("max_threads", 8), "download": config.get("max_threads", 8)}
+                stage_workers.update(config.get("stage_workers") or {})
+                controllers = {}
+                if config.get("adaptive_threads", True):
+                    # max_threads is where the network stages start; they then
+                    # move between min_threads and thread_ceiling.
+                    controllers = {
+                        name: AIMDController(
+                            floor=config.get("min_threads", DEFAULT_FLOOR),
+                            ceiling=config.get("thread_ceiling", DEFAULT_CEILING),
+                            initial=stage_workers[name],
+                            name=name,
+                            on_change=self.concurrency_changed,
+                        )
+                        for name in ADAPTIVE_STAGES
+                    }
+                retry_policy = RetryPolicy(
+                    max_attempts=config.get("max_attempts", 4),
+                    base_delay=config.get("retry_delay", 2.0),
+                )
+                self.pipeline = DownloadPipeline(stage_workers, queue_size=config.get("queue_size"),
+                                                 controllers=controllers, retry_policy=retry_policy)
+                self.pipeline.start()
+            self.pipeline_users += 1
+            return self.pipeline
+
+    def release_pipeline(self):
+        with self.lock:
+            self.pipeline_users -= 1
+            if self.pipeline_users:
+                return
+            pipeline, self.pipeline = self.pipeline, None
+        pipeline.shutdown()
+        self.ydl_pool.close_all()
+        for name, stats in pipeline.stats().items():
+            self.log(f"[Stats] {name}: {stats['processed']} done, {stats['throughput']:.2f}/s, {stats['utilization']:.0%} busy ({stats['workers']} workers)", "gray")
+
+    def concurrency_changed(self, stage, old, new, reason):
+        color = "yellow" if new < old else "gray"
+        self.log(f"[Concurrency] {stage}: {old} -> {new} workers ({reason})", color)
+
+    def download_options(self, outtmpl, ffmpeg_path, format_spec='bestaudio/best'):
+        if not (ffmpeg_path and os.path.isfile(ffmpeg_path)):
+            ffmpeg_path = get_ffmpeg_path()
+        ffmpeg_location = os.path.dirname(ffmpeg_path) if ffmpeg_path else None
+
+        return {
+            'format': format_spec,
+            'quiet': True,
+            'no_warnings': True,
+            'outtmpl': outtmpl,
+            'ffmpeg_location': ffmpeg_location,
+            'noplaylist': True,
+            'continuedl': True,
+            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'logger': SILENT_LOGGER,
+            'progress_hooks': [self.progress_hook],
+        }
+
+    def search_stage(self, track):
+        try:
+            self.check_cancelled(track)
+            self.transition(track, "searching")
+            stored = track["store"].find_track(track["track_id"], track["variant"]) if track["store"] else None
+            if stored:
+                # Already in the library from another playlist or an earlier run.
+                track["video_id"], output_path, track["video_title"] = stored
+                self.finish_track(track, output_path)
+                return
+            with self.metrics.timed("search"):
+                track["cache_key"] = make_key(track["query"], track_id=track["track_id"])
+                resume_url = self.journal.video_url(track["jobs"][0].playlist_id, track["key"])
+                cached_url = resume_url or self.search_cache.get(track["cache_key"])
+                if resume_url:
+                    self.log(f"[Resume] Continuing: {track['query']}", "#5cb3ff")
+                    track["candidates"] = [{"url": resume_url, "title": track["query"]}]
+                    track["cached"] = True
+                elif cached_url:
+                    self.log(f"[Search] Cached result for: {track['query']}", "#5cb3ff")
+                    track["candidates"] = [{"url": cached_url, "title": track["query"]}]
+                    track["cached"] = True
+                else:
+                    track["candidates"] = self.search_candidates(track["query"], track["song"])
+            self.pipeline.submit("download", self.download_stage, track)
+        except JobCancelled:
+            self.track_done(track, "skipped")
+        except Exception as e:
+            self.track_failed(track, e, "search")
+
+    def download_stage(self, track):
+        try:
+            self.transition(track, "downloading")
+            self.current.track_key = track["key"]
+            ydl = self.ydl_pool.get("download", track["ydl_opts"])
+            with self.metrics.timed("download"):
+                info = self.resolve_and_download(ydl, track["candidates"], track, stream=track["stream"])
+                if info is None and track.get("cached"):
+                    self.metrics.record_retry("search", track["key"], "cached result failed")
+                    self.search_cache.delete(track["cache_key"])
+                    info = self.resolve_and_download(ydl, self.search_candidates(track["query"], track["song"]), track, stream=track["stream"])
+                if info is None:
+                    self.log(f"[Error] {track['query']}: No downloadable videos found", "red")
+                    self.fail_track(track, "download", "not_found", "No downloadable videos found")
+                    return
+                self.search_cache.set(track["cache_key"], info.get("webpage_url") or info.get("original_url"))
+                track["video_id"] = info.get("id")
+                track["video_title"] = info.get("title")
+                if info.get("stored_path"):
+                    self.finish_track(track, info["stored_path"])
                     return
 
-            if ffmpeg_path and os.path.isfile(ffmpeg_path):
-                ffmpeg_location = os.path.dirname(ffmpeg_path)
-            else:
-                ffmpeg_location = None
-
-            ydl_opts_download = {
-                'format': 'bestaudio/best',
-                'quiet': True,
-                'no_warnings': True,
-                'outtmpl': os.path.join(folder, '%(title)s.%(ext)s'),
-                'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}],
-                'ffmpeg_location': ffmpeg_location,
-                'noplaylist': True,
-                'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'logger': SilentLogger(),
-                'progress_hooks': [],
-            }
-            with yt_dlp.YoutubeDL(ydl_opts_download) as ydl:
-                ydl.download([video_url])
-            self.log(f"[Download] Finished: {query}", "#4eff6d")
+                if "requested_downloads" not in info:
+                    # Resolved for streaming: download and transcode in one pass.
+                    output_path = self.stream_audio(ydl, info, track)
+                    if output_path is not None:
+                        self.finish_track(track, output_path)
+                        return
+                    self.metrics.record_retry("download", track["key"], "stream fallback")
+                    info = self.resolve_and_download(ydl, [{"url": info["webpage_url"], "title": info.get("title")}], track)
+                    if info is None:
+                        self.log(f"[Error] {track['query']}: Download failed", "red")
+                        self.fail_track(track, "download", "not_found", "Download failed")
+                        return
+            if output_action(info.get("acodec"), track["output_format"], track["allowed_codecs"]) == "keep":
+                self.finish_track(track, info["requested_downloads"][0]["filepath"])
+                return
+            track["info"] = info
+            self.pipeline.submit("transcode", self.transcode_stage, track)
+        except JobCancelled:
+            self.track_done(track, "skipped")
         except Exception as e:
-            self.log(f"[Error] {query}: {e}", "red")
+            self.track_failed(track, e, "download")
         finally:
-            with self.lock:
-                self.completed_tracks += 1
-                progress_callback(self.completed_tracks, self.total_tracks)
+            self.current.track_key = None
+
+    def transcode_stage(self, track):
+        try:
+            self.check_cancelled(track)
+            self.transition(track, "transcoding")
+            ydl = self.ydl_pool.get("download", track["ydl_opts"])
+            with self.metrics.timed("transcode"):
+                output_path = self.extract_audio(ydl, track["info"], track)
+            self.finish_track(track, output_path)
+        except JobCancelled:
+            self.track_done(track, "skipped")
+        except Exception as e:
+            self.track_failed(track, e, "transcode")
+
+    def finish_track(self, track, output_path):
+        import yt_dlp
+
+        track["outputs"] = {}
+        store = track["store"]
+        if store and track.get("video_id"):
+            store.add(track["video_id"], track["variant"], output_path, track.get("video_title"), track["track_id"])
+            name = yt_dlp.utils.sanitize_filename(track.get("video_title") or track["video_id"]) + os.path.splitext(output_path)[1]
+        for i, job in enumerate(track["jobs"]):
+            if store and track.get("video_id"):
+                path = store.link(track["video_id"], track["variant"], job.folder, name)
+            else:
+                # The first playlist owns the file; the others get a link to it.
+                path = output_path if i == 0 else link_into(output_path, job.folder)
+            job.manifest.record(track["track_id"], path, track["song"])
+            track["outputs"][job.playlist_id] = path
+        try:
+            self.catalog.set_file(track["key"], next(iter(track["outputs"].values()), output_path), track.get("video_id"))
+        except sqlite3.Error as e:
+            self.log(f"[Catalog] Could not record {track['query']}: {e}", "yellow")
+        self.log(f"[Download] Finished: {track['query']}", "#4eff6d")
+        self.track_done(track, "done", output=next(iter(track["outputs"].values()), output_path))
+
+    def track_failed(self, track, error, stage):
+        self.release_video(track)
+        self.pipeline.record_error(stage, error)
+        # Start this worker from a clean session in case the error left the
+        # cached instances in a bad state.
+        self.ydl_pool.reset()
+        kind = classify(error)
+        policy = self.pipeline.retry_policy
+        track["attempts"] = track.get("attempts", 0) + 1
+        if policy.should_retry(kind, track["attempts"]) and not track["batch"].cancelled.is_set():
+            delay = policy.delay(kind, track["attempts"])
+            self.log(f"[Retry] {track['query']}: {kind} error, retrying {stage} in {delay:.0f}s "
+                     f"(attempt {track['attempts'] + 1}/{policy.max_attempts}): {error}", "yellow")
+            self.metrics.record_retry(stage, track["key"], str(error))
+            self.transition(track, "retrying", error=str(error), attempt=track["attempts"] + 1)
+            stage_fn = {"search": self.search_stage, "download": self.download_stage, "transcode": self.transcode_stage}[stage]
+            self.pipeline.submit_later(delay, stage, stage_fn, track, cancelled=track["batch"].cancelled.is_set)
+            return
+        self.log(f"[Error] {track['query']}: {error}", "red")
+        self.fail_track(track, stage, kind, str(error))
+
+    def fail_track(self, track, stage, kind, error):
+        song = track["song"]
+        track["batch"].record_failure(track, {
+            "id": song.get("id"),
+            "title": song.get("title"),
+            "artist": song.get("artist"),
+            "url": song.get("url", ""),
+            "stage": stage,
+            "kind": kind,
+            "error": error,
+            "attempts": track.get("attempts", 1),
+        })
+        self.track_done(track, "failed", error=error)
+
+    def track_done(self, track, state, **fields):
+        self.release_video(track)
+        self.transition(track, state, **fields)
+        track["result"] = dict(fields, state=state)
+        track["batch"].track_done(track)
+
+    def transition(self, track, state, video_url=None, **fields):
+        self.metrics.transition(track["key"], state, **fields)
+        outputs = track.get("outputs", {})
+        try:
+            for job in track.get("jobs", ()):
+                self.journal.record(job.playlist_id, track["key"], state, video_url=video_url,
+                                    output=outputs.get(job.playlist_id), error=fields.get("error"))
+        except sqlite3.Error as e:
+            self.log(f"[Journal] Could not record {track['query']}: {e}", "yellow")
+
+    def progress_hook(self, d):
+        # yt-dlp reports cumulative bytes per file; forward the deltas in
+        # roughly 1 MB steps so the metrics see live throughput.
+        pending = getattr(self.current, "pending_bytes", None)
+        if pending is None:
+            pending = self.current.pending_bytes = {}
+        filename = d.get("filename")
+        downloaded = d.get("downloaded_bytes") or 0
+        last_seen, unreported = pending.get(filename, (0, 0))
+        unreported += max(downloaded - last_seen, 0)
+        if d.get("status") != "downloading" or unreported >= BYTES_REPORT_SIZE:
+            self.add_bytes(unreported, getattr(self.current, "track_key", None))
+            unreported = 0
+        if d.get("status") == "downloading":
+            pending[filename] = (downloaded, unreported)
+        else:
+            pending.pop(filename, None)
+
+    def add_bytes(self, count, track_key=None):
+        self.metrics.add_bytes(count, track_key)
+        pipeline = self.pipeline
+        if pipeline is not None:
+            pipeline.add_bytes(count)
+
+    def count_bytes(self, chunks, track_key):
+        unreported = 0
+        for chunk in chunks:
+            unreported += len(chunk)
+            if unreported >= BYTES_REPORT_SIZE:
+                self.add_bytes(unreported, track_key)
+                unreported = 0
+            yield chunk
+        self.add_bytes(unreported, track_key)
+
+    def check_cancelled(self, track):
+        if track["batch"].cancelled.is_set():
+            raise JobCancelled()
+
+    def search_candidates(self, query, song=None):
+        self.log(f"[Search] Looking for: {query}", "#5cb3ff")
+        ydl_opts_search = {'quiet': True, 'extract_flat': True, 'default_search': 'ytsearch'}
+        ydl = self.ydl_pool.get("search", ydl_opts_search)
+        result = ydl.extract_info(f"ytsearch10:{query}", download=False)  # search up to 10 results
+        entries = [entry for entry in result.get('entries') or [] if entry]
+        if song is None:
+            return entries
+        ranked = rank_candidates(entries, song)
+        if len(ranked) < len(entries):
+            self.log(f"[Search] Discarded {len(entries) - len(ranked)} poor matches for: {query}", "#5cb3ff")
+        return ranked
+
+    def resolve_and_download(self, ydl, candidates, track, stream=False):
+        import yt_dlp
+
+        # One extraction per candidate: the unprocessed info dict is reused for
+        # format selection and download instead of probing and extracting again.
+        for index, entry in enumerate(candidates):
+            self.check_cancelled(track)
+            video_id = entry.get('id')
+            if self.search_cache.is_bad(video_id):
+                continue
+            try:
+                ie_result = ydl.extract_info(entry['url'], download=False, process=False)
+                video_id = ie_result.get('id', video_id)
+                if self.search_cache.is_bad(video_id):
+                    continue
+                if track["store"]:
+                    self.claim_video(track, video_id)
+                stored = track["store"].find(video_id, track["variant"]) if track["store"] else None
+                if stored:
+                    # Another Spotify track resolved to the same video earlier.
+                    self.release_video(track)
+                    return dict(ie_result, stored_path=stored[0])
+                if stream:
+                    info = ydl.process_ie_result(copy.deepcopy(ie_result), download=False)
+                    if can_stream(info):
+                        return info
+                # Journal the video before downloading so a restart picks the
+                # same one and yt-dlp can continue its .part file.
+                self.transition(track, "downloading", video_url=ie_result.get("webpage_url") or entry["url"])
+                return ydl.process_ie_result(ie_result, download=True)
+            except yt_dlp.utils.YoutubeDLError as e:
+                # process_ie_result runs outside yt-dlp's error wrapping, so a
+                # bad format list arrives as an ExtractorError, not a DownloadError.
+                if classify(e) != PERMANENT:
+                    # Network trouble or throttling, not a bad video: retry this
+                    # candidate later instead of settling for a worse match.
+                    track["candidates"] = candidates[index:]
+                    raise
+                self.release_video(track)
+                if "DRM protected" in str(e):
+                    self.log(f"[Skip] Video DRM protected: {entry.get('title')}", "yellow")
+                    self.search_cache.mark_bad(video_id, "drm")
+                else:
+                    self.log(f"[Skip] Video unavailable: {entry.get('title')}", "yellow")
+                    self.search_cache.mark_bad(video_id, "unavailable")
+                self.metrics.record_retry("download", track["key"], str(e))
+        return None
+
+    def claim_video(self, track, video_id):
+        # Only one track at a time downloads a video into the store; another
+        # track that resolved to it waits and then uses the stored file.
+        key = (track["store"].root, video_id, track["variant"])
+        if track.get("claim") == key:
+            return
+        self.release_video(track)
+        while True:
+            with self.claims_lock:
+                done = self.claims.get(key)
+                if done is None:
+                    self.claims[key] = threading.Event()
+                    track["claim"] = key
+                    return
+            while not done.wait(0.2):
+                self.check_cancelled(track)
+
+    def release_video(self, track):
+        key = track.pop("claim", None)
+        if key is None:
+            return
+        with self.claims_lock:
+            done = self.claims.pop(key)
+        done.set()
+
+    def transcoder(self, ydl):
+        # One pool per ffmpeg location, probed on first use and kept for the
+        # session. None when no working ffmpeg is found; callers then fall back
+        # to the yt-dlp postprocessor or the regular download.
+        import yt_dlp
+
+        location = ydl.params.get("ffmpeg_location")
+        with self.transcoders_lock:
+            if location not in self.transcoders:
+                ffmpeg = yt_dlp.postprocessor.FFmpegPostProcessor(ydl).executable
+                pipeline = self.pipeline
+                workers = pipeline.stages["transcode"].max_workers if pipeline else None
+                try:
+                    self.transcoders[location] = TranscodePool(ffmpeg, workers) if ffmpeg else None
+                except TranscodeError as e:
+                    self.log(f"[FFmpeg] {e}", "yellow")
+                    self.transcoders[location] = None
+                transcoder = self.transcoders[location]
+                if transcoder:
+                    self.log(f"[FFmpeg] Using {ffmpeg} (version {transcoder.capabilities['version']}, {transcoder.workers} parallel jobs)", "gray")
+            return self.transcoders[location]
+
+    def stream_audio(self, ydl, info, track):
+        import yt_dlp
+
+        base_path = os.path.splitext(ydl.prepare_filename(info))[0]
+        # yt-dlp creates the store's variant and shard directories itself, but
+        # the streamed file is written here.
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        action = output_action(info.get("acodec"), track["output_format"], track["allowed_codecs"])
+        chunks = self.count_bytes(iter_http_chunks(ydl.urlopen, yt_dlp.networking.Request, info), track["key"])
+        if action == "keep":
+            return write_stream(chunks, f"{base_path}.{info['ext']}")
+
+        transcoder = self.transcoder(ydl)
+        if transcoder is None:
+            return None
+        try:
+            codec = codec_name(info.get("acodec"))
+            if action == "remux" and codec in CODECS:
+                _, ext, muxer = CODECS[codec]
+                return transcoder.stream(chunks, f"{base_path}.{ext}", COPY_ARGS, muxer)
+            return transcoder.stream(chunks, base_path + ".mp3")
+        except TranscodeError as e:
+            self.log(f"[Stream] Falling back to file download for {info.get('title')}: {e}", "yellow")
+            return None
+
+    def extract_audio(self, ydl, info, track):
+        import yt_dlp
+
+        source = info["requested_downloads"][0]["filepath"]
+        transcoder = self.transcoder(ydl)
+        acodec = info.get("acodec")
+        if transcoder and not codec_name(acodec) and track["output_format"] in ("auto", "remux"):
+            # Only needed when yt-dlp did not report the codec.
+            probed = transcoder.prober.probe(source)
+            if probed and probed["codec"] in CODECS:
+                acodec = CODECS[probed["codec"]][0]
+        action = output_action(acodec, track["output_format"], track["allowed_codecs"])
+        if action == "keep":
+            return source
+        # Convert under a temporary name and rename into place, so a crash never
+        # leaves a truncated file under the final name.
+        base, ext = os.path.splitext(source)
+        work_path = f"{base}.converting{ext}"
+        os.replace(source, work_path)
+        info["filepath"] = work_path
+        codec = codec_name(acodec)
+        if transcoder and (action == "transcode" or codec in CODECS):
+            # ffmpeg is run directly: the codec is already known, so unlike the
+            # postprocessor this needs no ffprobe per track.
+            _, out_ext, muxer = CODECS[codec] if action == "remux" else CODECS["mp3"]
+            try:
+                output_path = transcoder.transcode(work_path, f"{base}.{out_ext}",
+                                                   COPY_ARGS if action == "remux" else None, muxer)
+            except BaseException:
+                if os.path.exists(work_path):
+                    os.replace(work_path, source)
+                info["filepath"] = source
+                raise
+            os.remove(work_path)
+            return output_path
+        # 'best' makes the postprocessor copy the audio stream into a matching
+        # container instead of re-encoding it.
+        preferred_codec = 'best' if action == "remux" else 'mp3'
+        pp = yt_dlp.postprocessor.FFmpegExtractAudioPP(ydl, preferredcodec=preferred_codec, preferredquality='192')
+        try:
+            files_to_delete, info = pp.run(info)
+        except BaseException:
+            # Put the download back so a retry can convert it again.
+            if os.path.exists(work_path):
+                os.replace(work_path, source)
+            info["filepath"] = source
+            raise
+        output_path = base + os.path.splitext(info["filepath"])[1]
+        os.replace(info["filepath"], output_path)
+        for path in files_to_delete + [work_path]:
+            if os.path.exists(path) and path != output_path:
+                os.remove(path)
+        return output_path
@@ -1,33 +1,199 @@
 import os
+import re
 import json
 import csv
-import yt_dlp
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sqlite3
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from search_cache import CACHE_DIR, CACHE_NAME, SearchCache, make_key
+from catalog import CATALOG_NAME, Catalog, catalog_key
+from ranking import rank_candidates
+from concurrency import AIMDController, DEFAULT_CEILING, DEFAULT_FLOOR
+from resolver import AsyncResolver, DEFAULT_CONCURRENCY, DEFAULT_HOST_RATE
+from ydl_pool import YoutubeDLPool
+
+STREAM_FORMATS = ("csv", "ndjson")
+# Input files each export mode reads, besides catalog: names.
+EXPORT_INPUTS = (".json", ".csv")
+STREAM_INPUTS = (".json", ".ndjson", ".jsonl", ".csv")
+# Input named "catalog:<playlist name or ID>" is read from the catalog.
+CATALOG_PREFIX = "catalog:"
+STREAM_CSV_HEADER = ["Index", "Title", "Artist", "Spotify ID", "YouTube URL"]
+
+
+def csv_track(row):
+    return {
+        "id": row.get("id"),
+        "title": row["title"],
+        "artist": row["artist"],
+        "spotify_url": row.get("url", ""),
+        "duration_ms": int(row["duration_ms"]) if row.get("duration_ms") else None,
+        "isrc": row.get("isrc")
+    }
+
+
+def iter_json_tracks(path, chunk_size=1 << 16):
+    # Yields the entries of the "tracks" array one at a time without loading
+    # the whole file. .ndjson/.jsonl files hold one track per line.
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".ndjson", ".jsonl")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        buffer = ""
+        while True:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            match = re.search(r'"tracks"\s*:\s*\[', buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            if not chunk:
+                return
+            buffer = buffer[-64:]
+
+        decoder = json.JSONDecoder()
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if buffer[pos:pos + 1] == "]":
+                return
+            try:
+                track, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The next track is cut off at the end of the buffer.
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield track
+            if pos > chunk_size:
+                buffer = buffer[pos:]
+                pos = 0
+
+
+def iter_tracks(path, catalog=None):
+    if path.startswith(CATALOG_PREFIX):
+        listing = catalog.find_playlist(path[len(CATALOG_PREFIX):])
+        if listing:
+            yield from catalog.iter_tracks(listing["playlist_id"])
+    elif path.endswith(".csv"):
+        with open(path, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield csv_track(row)
+    else:
+        yield from iter_json_tracks(path)
+
+
+def read_playlist_name(path, catalog=None):
+    if path.startswith(CATALOG_PREFIX):
+        listing = catalog.find_playlist(path[len(CATALOG_PREFIX):])
+        return listing["name"] if listing else path[len(CATALOG_PREFIX):]
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            head = f.read(1 << 16)
+        match = re.search(r'"playlist_name"\s*:\s*("(?:[^"\\]|\\.)*")', head)
+        if match:
+            return json.loads(match.group(1))
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def written_indices(output_path, export_type):
+    # Indices already in a partially written stream export. A line cut off by
+    # a crash is truncated so appending continues on a clean line.
+    if not os.path.exists(output_path):
+        return set()
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    written = set()
+    with open(output_path, "r", newline="", encoding="utf-8") as f:
+        if export_type == "csv":
+            rows = csv.reader(f)
+            next(rows, None)
+            for row in rows:
+                if len(row) == len(STREAM_CSV_HEADER) and row[0].isdigit():
+                    written.add(int(row[0]))
+        else:
+            for line in f:
+                try:
+                    written.add(json.loads(line)["index"])
+                except (ValueError, KeyError):
+                    continue
+    return written
+
 
 class Exporter:
-    def __init__(self, logger):
+    def __init__(self, logger, cache_dir=CACHE_DIR):
         self.logger = logger
+        self.search_cache = SearchCache(os.path.join(cache_dir, CACHE_NAME))
+        self.catalog = Catalog(os.path.join(cache_dir, CATALOG_NAME))
+        self.ydl_pool = YoutubeDLPool()
+        # "threads" resolves with a pool of blocking yt-dlp searches; "async"
+        # (opt-in) drives the same searches from one event loop (see
+        # resolver.py).
+        self.engine = "threads"
+        self.concurrency = DEFAULT_CONCURRENCY
+        self.host_rate = DEFAULT_HOST_RATE
 
     def log(self, message, color="white"):
         if self.logger:
             self.logger.log_signal.emit(message, color)
 
-    def get_first_youtube_url(self, query):
+    def search_entries(self, query, count):
+        # Flat ytsearch entries, from this thread's pooled YoutubeDL.
+        ydl_opts_search = {
+            'quiet': True,
+            'extract_flat': True,
+            'default_search': 'ytsearch'
+        }
+        ydl = self.ydl_pool.get("search", ydl_opts_search)
         try:
-            ydl_opts_search = {
-                'quiet': True,
-                'extract_flat': True,
-                'default_search': 'ytsearch'
-            }
-            with yt_dlp.YoutubeDL(ydl_opts_search) as ydl:
-                result = ydl.extract_info(f"ytsearch1:{query}", download=False)
-                video_info = result['entries'][0]
-            return video_info['url']
-        except Exception as e:
-            self.log(f"[Error URL] {query}: {e}", "red")
-            return None
+            result = ydl.extract_info(f"ytsearch{count}:{query}", download=False)
+        except Exception:
+            self.ydl_pool.reset("search")
+            raise
+        return [e for e in result.get('entries') or [] if e]
+
+    def get_first_youtube_url(self, query, track_id=None, song=None, controller=None):
+        cache_key = make_key(query, track_id=track_id)
+        cached_url = self.search_cache.get(cache_key)
+        if cached_url:
+            return cached_url
+        # Only real searches take a slot, so cache hits neither wait nor skew
+        # the controller's latency figures.
+        with controller.slot() if controller else nullcontext():
+            try:
+                if song is None:
+                    video_info = self.search_entries(query, 1)[0]
+                else:
+                    ranked = rank_candidates(self.search_entries(query, 5), song)
+                    if not ranked:
+                        self.log(f"[Error URL] {query}: no matching video", "red")
+                        return None
+                    video_info = ranked[0]
+                self.search_cache.set(cache_key, video_info['url'])
+                return video_info['url']
+            except Exception as e:
+                self.log(f"[Error URL] {query}: {e}", "red")
+                if controller:
+                    controller.record_error(e)
+                return None
+
+    def concurrency_changed(self, name, old, new, reason):
+        color = "yellow" if new < old else "gray"
+        self.log(f"[Concurrency] {name}: {old} -> {new} workers ({reason})", color)
 
-    def export_playlist(self, input_file, export_type="json", output_dir=".", max_workers=5, progress_callback=None):
+    def export_playlist(self, input_file, export_type="json", output_dir=".", max_workers=5, progress_callback=None,
+                        min_workers=DEFAULT_FLOOR, worker_ceiling=DEFAULT_CEILING, adaptive=True):
     # Detect file type
         if input_file.endswith(".json"):
             with open(input_file, "r", encoding="utf-8") as f:
@@ -40,11 +206,16 @@ class Exporter:
             with open(input_file, "r", encoding="utf-8") as f:
                 reader = csv.DictReader(f)
                 for row in reader:
-                    playlist["tracks"].append({
-                        "title": row["title"],
-                        "artist": row["artist"],
-                        "spotify_url": row.get("url", "")
-                    })
+                    playlist["tracks"].append(csv_track(row))
+        elif input_file.startswith(CATALOG_PREFIX):
+            listing = self.catalog.find_playlist(input_file[len(CATALOG_PREFIX):])
+            if listing is None:
+                self.log(f"[Error] No catalog playlist named {input_file[len(CATALOG_PREFIX):]}", "red")
+                return
+            playlist = {
+                "playlist_name": listing["name"],
+                "tracks": list(self.catalog.iter_tracks(listing["playlist_id"]))
+            }
         else:
             self.log(f"[Error] Unsupported file format: {input_file}", "red")
             return
@@ -58,12 +229,59 @@ class Exporter:
             "tracks": []
         }
 
-        total = len(playlist["tracks"])
+        if self.engine == "async":
+            self.resolve_async(playlist["tracks"], export_data, progress_callback)
+        else:
+            self.resolve_threaded(playlist["tracks"], export_data, max_workers, progress_callback,
+                                  min_workers, worker_ceiling, adaptive)
+        self.ydl_pool.close_all()
+
+        # Save JSON
+        if export_type == "json":
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(export_data, f, indent=4, ensure_ascii=False)
+
+        # Save CSV
+        elif export_type == "csv":
+            with open(output_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["Title", "Artist", "YouTube URL"])
+                for t in export_data["tracks"]:
+                    writer.writerow([t["title"], t["artist"], t["youtube_url"]])
+
+        self.log(f"[Export] Playlist exported in: {output_path}", "#00ffaa")
+        return output_path
+
+    def resolve_async(self, tracks, export_data, progress_callback):
+        # The event loop keeps up to `concurrency` searches in flight, paced
+        # per host by `host_rate`; max_workers only applies to the threads engine.
+        def resolved(track, youtube_url):
+            self.log(f"[Export] {track['title']} - {track['artist']}", "#4eff6d")
+
+        urls = self.async_resolver().run(tracks, progress_callback, resolved)
+        for track, youtube_url in zip(tracks, urls):
+            export_data["tracks"].append({
+                "title": track["title"],
+                "artist": track["artist"],
+                "youtube_url": youtube_url
+            })
+        self.record_videos(zip(tracks, urls))
+
+    def resolve_threaded(self, tracks, export_data, max_workers, progress_callback, min_workers, worker_ceiling,
+                         adaptive):
+        total = len(tracks)
         completed = 0
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resolved = []
+        controller = None
+        if adaptive:
+            # max_workers is the starting point; the controller moves between
+            # min_workers and worker_ceiling as throughput and errors change.
+            controller = AIMDController(min_workers, worker_ceiling, initial=max_workers, name="export",
+                                        on_change=self.concurrency_changed)
+        with ThreadPoolExecutor(max_workers=controller.ceiling if controller else max_workers) as executor:
             futures = {
-                executor.submit(self.get_first_youtube_url, f"{t['title']} {t['artist']}"): t
-                for t in playlist["tracks"]
+                executor.submit(self.get_first_youtube_url, f"{t['title']} {t['artist']}", t.get("id"), t, controller): t
+                for t in tracks
             }
 
             for future in as_completed(futures):
@@ -74,23 +292,137 @@ class Exporter:
                     "artist": track["artist"],
                     "youtube_url": youtube_url
                 })
+                resolved.append((track, youtube_url))
 
                 completed += 1
                 self.log(f"[Export] {track['title']} - {track['artist']}", "#4eff6d")
                 if progress_callback:
-                    progress_callback(completed, total) 
+                    progress_callback(completed, total)
+        self.record_videos(resolved)
 
-        # Save JSON
+    def async_resolver(self):
+        return AsyncResolver(self.search_cache, self.search_entries, self.log, self.concurrency, self.host_rate)
+
+    def record_videos(self, resolved):
+        # Resolved URLs go into the catalog for tracks it knows about. The
+        # export output is already written, so a catalog error only logs.
+        try:
+            self.catalog.set_videos([(url, catalog_key(track)) for track, url in resolved if url])
+        except sqlite3.Error as e:
+            self.log(f"[Catalog] Could not record export URLs: {e}", "yellow")
+
+    def stream_export(self, input_file, export_type="csv", output_dir=".", window=64, ordered=True, resume=True,
+                      max_workers=5, progress_callback=None, min_workers=DEFAULT_FLOOR, worker_ceiling=DEFAULT_CEILING,
+                      adaptive=True):
+        # Reads the input lazily, keeps at most `window` tracks between being
+        # read and being written, and appends each result to the output as soon
+        # as it (and, with `ordered`, everything before it) is resolved. Running
+        # it again on a partial output resumes where it stopped.
         if export_type == "json":
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(export_data, f, indent=4, ensure_ascii=False)
+            export_type = "ndjson"
+        if export_type not in STREAM_FORMATS:
+            self.log(f"[Error] Unsupported stream format: {export_type}", "red")
+            return None
+        if not input_file.startswith(CATALOG_PREFIX) and not input_file.endswith(STREAM_INPUTS):
+            self.log(f"[Error] Unsupported file format: {input_file}", "red")
+            return None
 
-        # Save CSV
-        elif export_type == "csv":
-            with open(output_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(["Title", "Artist", "YouTube URL"])
-                for t in export_data["tracks"]:
-                    writer.writerow([t["title"], t["artist"], t["youtube_url"]])
+        safe_name = read_playlist_name(input_file, self.catalog).replace(" ", "_")
+        output_path = os.path.join(output_dir, f"{safe_name}_ExportYT.{export_type}")
+        if not resume and os.path.exists(output_path):
+            os.remove(output_path)
+        written = written_indices(output_path, export_type)
+        if written:
+            self.log(f"[Export] Resuming {output_path}: {len(written)} tracks already exported", "#4eff6d")
+        total = sum(1 for _ in iter_tracks(input_file, self.catalog))
+        completed = len(written)
+        if progress_callback:
+            progress_callback(completed, total)
+
+        controller = None
+        if self.engine == "async":
+            resolver = self.async_resolver()
+            resolver.start()
+            lookup = resolver.submit
+        else:
+            if adaptive:
+                controller = AIMDController(min_workers, worker_ceiling, initial=max_workers, name="export",
+                                            on_change=self.concurrency_changed)
+            executor = ThreadPoolExecutor(max_workers=controller.ceiling if controller else max_workers)
+
+            def lookup(track):
+                return executor.submit(self.get_first_youtube_url, f"{track['title']} {track['artist']}",
+                                       track.get("id"), track, controller)
+        pending_tracks = ((i, t) for i, t in enumerate(iter_tracks(input_file, self.catalog)) if i not in written)
+
+        try:
+            self.write_stream(output_path, export_type, window, ordered, lookup, pending_tracks,
+                              completed, total, progress_callback)
+        finally:
+            if self.engine == "async":
+                resolver.stop()
+            else:
+                executor.shutdown()
+        self.ydl_pool.close_all()
 
         self.log(f"[Export] Playlist exported in: {output_path}", "#00ffaa")
+        return output_path
+
+    def write_stream(self, output_path, export_type, window, ordered, lookup, pending_tracks, completed, total,
+                     progress_callback):
+        # `lookup` starts resolving one track and returns a future of its URL.
+        in_flight = {}
+        order = deque()
+        finished = {}
+        with open(output_path, "a", newline="", encoding="utf-8") as out:
+            writer = csv.writer(out) if export_type == "csv" else None
+            if writer and out.tell() == 0:
+                writer.writerow(STREAM_CSV_HEADER)
+
+            resolved = []
+
+            def write(index, track, youtube_url):
+                resolved.append((track, youtube_url))
+                if writer:
+                    writer.writerow([index, track["title"], track["artist"], track.get("id") or "", youtube_url or ""])
+                else:
+                    out.write(json.dumps({
+                        "index": index,
+                        "id": track.get("id"),
+                        "title": track["title"],
+                        "artist": track["artist"],
+                        "youtube_url": youtube_url,
+                    }, ensure_ascii=False) + "\n")
+
+            exhausted = False
+            while True:
+                while not exhausted and len(in_flight) + len(finished) < window:
+                    item = next(pending_tracks, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    index, track = item
+                    in_flight[lookup(track)] = item
+                    if ordered:
+                        order.append(index)
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, track = in_flight.pop(future)
+                    if ordered:
+                        finished[index] = (index, track, future.result())
+                    else:
+                        write(index, track, future.result())
+                    completed += 1
+                    self.log(f"[Export] {track['title']} - {track['artist']}", "#4eff6d")
+                while order and order[0] in finished:
+                    write(*finished.pop(order.popleft()))
+                out.flush()
+                if len(resolved) >= window:
+                    self.record_videos(resolved)
+                    resolved.clear()
+                if progress_callback:
+                    progress_callback(completed, total)
+            self.record_videos(resolved)
@@ -47,4 +47,6 @@ def download_ffmpeg():
     return os.path.isfile(FFMPEG_PATH)
 
 def get_ffmpeg_path():
-    return FFMPEG_PATH if is_ffmpeg_downloaded() else None
+    # The bundled binary, else the first ffmpeg on PATH (the usual case on
+    # Linux and macOS), else None.
+    return FFMPEG_PATH if is_ffmpeg_downloaded() else shutil.which("ffmpeg")
@@ -0,0 +1,102 @@
+import os
+import glob
+import time
+from database import Database
+from search_cache import CACHE_DIR
+
+JOURNAL_NAME = "journal.sqlite3"
+DEFAULT_JOURNAL_PATH = os.path.join(CACHE_DIR, JOURNAL_NAME)
+# Left behind by an interrupted download or conversion.
+PARTIAL_PATTERNS = ("*.part", "*.part-Frag*", "*.ytdl", "*.converting.*")
+# Partials touched more recently than this may belong to a download that is
+# still running in another process.
+PARTIAL_GRACE = 60 * 60
+
+
+class JobJournal(Database):
+    # Durable record of every playlist job and the state of each of its tracks.
+    # `events` is an append-only log of transitions; `tracks` holds the latest
+    # state so a restarted job can skip finished tracks and go back to the video
+    # it was downloading.
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        super().__init__(path)
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, name TEXT, folder TEXT, status TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "job_id TEXT NOT NULL, track_key TEXT NOT NULL, state TEXT NOT NULL, video_url TEXT, "
+                "output TEXT, error TEXT, updated REAL NOT NULL, PRIMARY KEY (job_id, track_key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, track_key TEXT NOT NULL, "
+                "state TEXT NOT NULL, created REAL NOT NULL)"
+            )
+
+    def start_job(self, job_id, name, folder):
+        # Returns True when the previous run of this job never finished, in
+        # which case its track states are kept so it can be resumed.
+        with self.connection() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            resumed = row is not None and row[0] == "running"
+            if not resumed:
+                conn.execute("DELETE FROM tracks WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, name, folder, status, updated) VALUES (?, ?, ?, 'running', ?)",
+                (job_id, name, folder, time.time()),
+            )
+        return resumed
+
+    def finish_job(self, job_id):
+        with self.connection() as conn:
+            conn.execute("UPDATE jobs SET status = 'finished', updated = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def record(self, job_id, track_key, state, video_url=None, output=None, error=None):
+        now = time.time()
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO tracks (job_id, track_key, state, video_url, output, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (job_id, track_key) DO UPDATE SET "
+                "state = excluded.state, video_url = COALESCE(excluded.video_url, tracks.video_url), "
+                "output = COALESCE(excluded.output, tracks.output), error = excluded.error, updated = excluded.updated",
+                (job_id, track_key, state, video_url, output, error, now),
+            )
+            conn.execute(
+                "INSERT INTO events (job_id, track_key, state, created) VALUES (?, ?, ?, ?)",
+                (job_id, track_key, state, now),
+            )
+
+    def completed(self, job_id):
+        # {track_key: output path} for finished tracks whose file is still there.
+        rows = self.connection().execute(
+            "SELECT track_key, output FROM tracks WHERE job_id = ? AND state = 'done'", (job_id,)
+        ).fetchall()
+        return {key: output for key, output in rows if output and os.path.isfile(output)}
+
+    def video_url(self, job_id, track_key):
+        row = self.connection().execute(
+            "SELECT video_url FROM tracks WHERE job_id = ? AND track_key = ?", (job_id, track_key)
+        ).fetchone()
+        return row[0] if row else None
+
+
+def remove_partials(folder, recursive=False, older_than=None):
+    # With `older_than` (seconds), partials modified since then are kept.
+    removed = []
+    folders = [directory for directory, _, _ in os.walk(folder)] if recursive else [folder]
+    cutoff = time.time() - older_than if older_than is not None else None
+    for directory in folders:
+        for pattern in PARTIAL_PATTERNS:
+            for path in glob.glob(os.path.join(glob.escape(directory), pattern)):
+                try:
+                    if cutoff is not None and os.path.getmtime(path) > cutoff:
+                        continue
+                    os.remove(path)
+                    removed.append(path)
+                except OSError:
+                    pass
+    return removed
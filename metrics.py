@@ -0,0 +1,178 @@
+import time
+import queue
+import bisect
+import threading
+from contextlib import contextmanager
+
+TRACK_STATES = ("queued", "searching", "downloading", "transcoding", "retrying", "done", "failed", "skipped")
+FINAL_STATES = ("done", "failed", "skipped")
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Metrics:
+    # Thread-safe counters for the download engine. Workers only take a short
+    # lock; subscribers get events through their own bounded queues and events
+    # are dropped for a subscriber that falls behind rather than blocking.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.track_states = {}
+        self.state_counts = dict.fromkeys(TRACK_STATES, 0)
+        self.latency = {}
+        self.retries = {}
+        self.bytes_downloaded = 0
+        self.subscribers = []
+        self.dropped_events = 0
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time.monotonic()
+            self.track_states.clear()
+            self.state_counts = dict.fromkeys(TRACK_STATES, 0)
+            self.latency.clear()
+            self.retries.clear()
+            self.bytes_downloaded = 0
+
+    def subscribe(self, maxsize=10000):
+        events = queue.Queue(maxsize=maxsize)
+        with self.lock:
+            self.subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self.lock:
+            if events in self.subscribers:
+                self.subscribers.remove(events)
+
+    def publish(self, event):
+        event.setdefault("time", time.time())
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                with self.lock:
+                    self.dropped_events += 1
+
+    def transition(self, track_key, state, **fields):
+        with self.lock:
+            previous = self.track_states.get(track_key)
+            if previous is not None:
+                self.state_counts[previous] -= 1
+            self.track_states[track_key] = state
+            self.state_counts[state] += 1
+        self.publish(dict(fields, type="state", track=track_key, state=state, previous=previous))
+
+    def observe_latency(self, stage, seconds):
+        with self.lock:
+            histogram = self.latency.get(stage)
+            if histogram is None:
+                histogram = self.latency[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, stage):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe_latency(stage, time.monotonic() - started)
+
+    def add_bytes(self, count, track_key=None):
+        with self.lock:
+            self.bytes_downloaded += count
+        if track_key is not None:
+            self.publish({"type": "bytes", "track": track_key, "bytes": count})
+
+    def record_retry(self, stage, track_key=None, reason=""):
+        with self.lock:
+            self.retries[stage] = self.retries.get(stage, 0) + 1
+        self.publish({"type": "retry", "stage": stage, "track": track_key, "reason": reason})
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started_at
+            return {
+                "elapsed": elapsed,
+                "states": dict(self.state_counts),
+                "latency": {stage: h.snapshot() for stage, h in self.latency.items()},
+                "retries": dict(self.retries),
+                "bytes_downloaded": self.bytes_downloaded,
+                "bytes_per_second": self.bytes_downloaded / elapsed if elapsed else 0.0,
+                "dropped_events": self.dropped_events,
+            }
+
+    def prometheus_text(self):
+        with self.lock:
+            lines = [
+                "# TYPE spotify_downloader_tracks gauge",
+                *(f'spotify_downloader_tracks{{state="{state}"}} {count}' for state, count in self.state_counts.items()),
+                "# TYPE spotify_downloader_bytes_downloaded_total counter",
+                f"spotify_downloader_bytes_downloaded_total {self.bytes_downloaded}",
+                "# TYPE spotify_downloader_retries_total counter",
+                *(f'spotify_downloader_retries_total{{stage="{stage}"}} {count}' for stage, count in self.retries.items()),
+                "# TYPE spotify_downloader_stage_seconds histogram",
+            ]
+            for stage, histogram in self.latency.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'spotify_downloader_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'spotify_downloader_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'spotify_downloader_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'spotify_downloader_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(metrics, port, host="127.0.0.1"):
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
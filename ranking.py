@@ -0,0 +1,108 @@
+import re
+import unicodedata
+
+# Scores flat ytsearch entries against the Spotify track before anything is
+# downloaded. Only fields present in extract_flat results are used: title,
+# duration, channel/uploader, live_status and (sometimes) description.
+
+MAX_DURATION = 20 * 60
+DURATION_TOLERANCE = 0.25
+MIN_DURATION_TOLERANCE = 20
+
+# Words that mark a different recording unless the Spotify title has them too.
+VERSION_WORDS = {
+    "live": 0.35, "cover": 0.4, "karaoke": 0.6, "instrumental": 0.4, "remix": 0.3,
+    "acoustic": 0.25, "nightcore": 0.6, "sped": 0.5, "slowed": 0.5, "reverb": 0.4,
+    "8d": 0.5, "loop": 0.5, "hour": 0.5, "hours": 0.5, "reaction": 0.6, "tutorial": 0.6,
+    "lesson": 0.6, "piano": 0.25, "guitar": 0.25, "drum": 0.25, "bass": 0.2, "edit": 0.1,
+    "demo": 0.25, "concert": 0.35, "session": 0.15, "mashup": 0.4, "parody": 0.6,
+}
+OFFICIAL_WORDS = ("official audio", "official video", "official music video", "audio")
+NOISE_WORDS = {"official", "video", "audio", "music", "lyrics", "lyric", "hd", "hq", "4k", "ft", "feat", "featuring", "the", "a"}
+
+
+def tokens(text):
+    text = unicodedata.normalize("NFKD", text or "").lower()
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.findall(r"\w+", text)
+
+
+def similarity(expected, actual):
+    # Share of the expected tokens found in the candidate, ignoring filler words.
+    expected = set(expected) - NOISE_WORDS
+    if not expected:
+        return 0.0
+    return len(expected & set(actual)) / len(expected)
+
+
+def split_artists(artist):
+    return [a.strip() for a in (artist or "").split(",") if a.strip()]
+
+
+def score_candidate(entry, song):
+    # Returns None for candidates that must never be fetched, otherwise a score
+    # where higher is better.
+    if entry.get("live_status") in ("is_live", "is_upcoming"):
+        return None
+    duration = entry.get("duration")
+    expected = (song.get("duration_ms") or 0) / 1000
+    if duration:
+        if duration > MAX_DURATION and (not expected or duration > expected * 2):
+            return None
+        if expected:
+            # Outside twice the tolerance it is a different edit, a loop or a
+            # compilation, so it is not worth downloading at all.
+            delta = abs(duration - expected)
+            tolerance = max(MIN_DURATION_TOLERANCE, expected * DURATION_TOLERANCE)
+            if delta > tolerance * 2:
+                return None
+            duration_score = 1 - delta / (tolerance * 2)
+        else:
+            duration_score = 0.5
+    else:
+        duration_score = 0.3
+
+    title = entry.get("title") or ""
+    title_tokens = tokens(title)
+    channel = entry.get("channel") or entry.get("uploader") or ""
+    channel_tokens = tokens(channel)
+    song_title_tokens = tokens(song.get("title"))
+    artists = split_artists(song.get("artist"))
+
+    title_score = similarity(song_title_tokens, title_tokens)
+    if artists:
+        artist_score = max(similarity(tokens(a), title_tokens + channel_tokens) for a in artists)
+    else:
+        artist_score = 0.0
+
+    channel_score = 0.0
+    lowered_channel = channel.lower()
+    if lowered_channel.endswith(" - topic"):
+        channel_score = 1.0
+    elif "vevo" in lowered_channel:
+        channel_score = 0.8
+    elif artists and any(similarity(tokens(a), channel_tokens) == 1 for a in artists):
+        channel_score = 0.7
+    if any(word in title.lower() for word in OFFICIAL_WORDS):
+        channel_score = max(channel_score, 0.4)
+
+    penalty = 0.0
+    expected_words = set(song_title_tokens)
+    for word in set(title_tokens) - expected_words:
+        penalty += VERSION_WORDS.get(word, 0)
+
+    isrc = song.get("isrc")
+    isrc_bonus = 0.2 if isrc and isrc.lower() in (entry.get("description") or "").lower() else 0.0
+
+    return 0.35 * duration_score + 0.3 * title_score + 0.2 * artist_score + 0.15 * channel_score + isrc_bonus - penalty
+
+
+def rank_candidates(entries, song):
+    scored = []
+    for index, entry in enumerate(entries):
+        score = score_candidate(entry, song)
+        if score is not None:
+            # The search order breaks ties.
+            scored.append((-score, index, entry))
+    scored.sort(key=lambda item: item[:2])
+    return [entry for _, _, entry in scored]
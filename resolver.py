@@ -0,0 +1,157 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ranking import rank_candidates
+from retry import THROTTLED, RetryPolicy, classify
+from search_cache import make_key
+
+# Export-only jobs spend nearly all their time waiting on YouTube search. The
+# async engine drives every lookup from one event loop: cache reads and writes,
+# pacing and backoff happen on the loop, and only the search itself (yt-dlp's
+# ytsearch, with its proxy, cookie and client handling) runs on a thread.
+
+SEARCH_HOST = "www.youtube.com"
+DEFAULT_CONCURRENCY = 32
+DEFAULT_HOST_RATE = 50.0
+MAX_ATTEMPTS = 4
+SEARCH_CANDIDATES = 5
+# Threads the search cache is read and written on, off the event loop.
+CACHE_WORKERS = 4
+
+
+class HostRateLimiter:
+    # Token bucket per host. A throttled response pauses the whole host, so
+    # every pending lookup backs off together instead of each retrying alone.
+    def __init__(self, rate=DEFAULT_HOST_RATE, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.buckets = {}
+        self.paused_until = {}
+
+    async def acquire(self, host):
+        while True:
+            now = time.monotonic()
+            paused = self.paused_until.get(host, 0) - now
+            if paused > 0:
+                await asyncio.sleep(paused)
+                continue
+            tokens, updated = self.buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self.buckets[host] = (tokens - 1, now)
+                return
+            self.buckets[host] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+    def pause(self, host, seconds):
+        self.paused_until[host] = max(self.paused_until.get(host, 0), time.monotonic() + seconds)
+
+
+class AsyncResolver:
+    # Resolves many tracks to YouTube URLs from one event loop. `search(query,
+    # count)` is the blocking yt-dlp search returning flat entries; up to
+    # `concurrency` of them run at once on a thread pool, paced to `host_rate`
+    # per second. Cache hits never reach the search; the SQLite cache itself is
+    # read and written on a small thread pool so it never blocks the loop.
+    def __init__(self, search_cache, search, log, concurrency=DEFAULT_CONCURRENCY, host_rate=DEFAULT_HOST_RATE,
+                 retry_policy=None):
+        self.search_cache = search_cache
+        self.search_entries = search
+        self.log = log
+        self.concurrency = max(1, int(concurrency))
+        self.host_rate = host_rate
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=MAX_ATTEMPTS)
+
+    def run(self, tracks, progress_callback=None, on_resolved=None):
+        # Blocking entry point: URLs (or None) in the order of `tracks`.
+        return asyncio.run(self.resolve_all(tracks, progress_callback, on_resolved))
+
+    def start(self):
+        # Runs the loop on its own thread for callers that hand in lookups one
+        # at a time through submit(); stop() shuts it down.
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="resolver", daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.open(), self.loop).result()
+
+    def submit(self, track):
+        # concurrent.futures.Future of the track's URL (or None).
+        query = f"{track['title']} {track['artist']}"
+        return asyncio.run_coroutine_threadsafe(self.resolve(query, track.get("id"), track), self.loop)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def open(self):
+        self.limiter = HostRateLimiter(self.host_rate)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="search")
+        self.cache_executor = ThreadPoolExecutor(max_workers=CACHE_WORKERS)
+
+    async def close(self):
+        self.executor.shutdown(wait=True)
+        self.cache_executor.shutdown(wait=True)
+
+    async def resolve_all(self, tracks, progress_callback=None, on_resolved=None):
+        await self.open()
+        total = len(tracks)
+        results = [None] * total
+        completed = 0
+
+        async def resolve_one(index, track):
+            nonlocal completed
+            results[index] = await self.resolve(f"{track['title']} {track['artist']}", track.get("id"), track)
+            completed += 1
+            if on_resolved:
+                on_resolved(track, results[index])
+            if progress_callback:
+                progress_callback(completed, total)
+
+        try:
+            await asyncio.gather(*(resolve_one(index, track) for index, track in enumerate(tracks)))
+        finally:
+            await self.close()
+        return results
+
+    async def resolve(self, query, track_id=None, song=None):
+        loop = asyncio.get_running_loop()
+        cache_key = make_key(query, track_id=track_id)
+        cached_url = await loop.run_in_executor(self.cache_executor, self.search_cache.get, cache_key)
+        if cached_url:
+            return cached_url
+        async with self.semaphore:
+            try:
+                entries = await self.search(query, 1 if song is None else SEARCH_CANDIDATES)
+            except Exception as e:
+                self.log(f"[Error URL] {query}: {e}", "red")
+                return None
+        if song is None:
+            ranked = entries[:1]
+        else:
+            ranked = rank_candidates(entries, song)
+        if not ranked:
+            self.log(f"[Error URL] {query}: no matching video", "red")
+            return None
+        await loop.run_in_executor(self.cache_executor, self.search_cache.set, cache_key, ranked[0]["url"])
+        return ranked[0]["url"]
+
+    async def search(self, query, count):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            await self.limiter.acquire(SEARCH_HOST)
+            attempt += 1
+            try:
+                return await loop.run_in_executor(self.executor, self.search_entries, query, count)
+            except Exception as e:
+                kind = classify(e)
+                if not self.retry_policy.should_retry(kind, attempt):
+                    raise
+                delay = self.retry_policy.delay(kind, attempt)
+                if kind == THROTTLED:
+                    self.limiter.pause(SEARCH_HOST, delay)
+                await asyncio.sleep(delay)
@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+TRANSIENT = "transient"
+THROTTLED = "throttled"
+PERMANENT = "permanent"
+
+# Checked in this order; the first list that matches decides.
+PERMANENT_MARKERS = (
+    "Video unavailable", "Private video", "This video has been removed", "DRM protected",
+    "confirm your age", "members-only", "Join this channel", "not available in your country",
+    "blocked it in your country", "copyright", "account associated with this video has been terminated",
+    "Unsupported URL", "Requested format is not available", "HTTP Error 404", "HTTP Error 410",
+)
+THROTTLED_MARKERS = (
+    "HTTP Error 429", "Too Many Requests", "Sign in to confirm", "rate-limit", "rate limit",
+)
+TRANSIENT_MARKERS = (
+    "timed out", "Timeout", "Connection reset", "Connection aborted", "Connection refused",
+    "Remote end closed", "IncompleteRead", "Temporary failure", "Name or service not known",
+    "EOF occurred", "HTTP Error 5", "Unable to download webpage", "Unable to download API page",
+    "Got error", "giving up after", "urlopen error", "unable to download video data",
+)
+
+FAILURE_REPORT_NAME = "failed_tracks.json"
+
+
+def classify(error):
+    # Sorts an exception from yt-dlp, requests or the transcode step into
+    # transient (retry soon), throttled (retry much later) or permanent.
+    # Neither library is imported here: if one is not loaded yet, the error
+    # cannot have come from it.
+    requests = sys.modules.get("requests")
+    yt_dlp = sys.modules.get("yt_dlp")
+    if requests is not None:
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            if status == 429:
+                return THROTTLED
+            return TRANSIENT if status >= 500 else PERMANENT
+        if isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+            return TRANSIENT
+    message = str(error)
+    for kind, markers in ((PERMANENT, PERMANENT_MARKERS), (THROTTLED, THROTTLED_MARKERS), (TRANSIENT, TRANSIENT_MARKERS)):
+        if any(marker in message for marker in markers):
+            return kind
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    if yt_dlp is not None and isinstance(error, yt_dlp.utils.DownloadError):
+        return TRANSIENT
+    # Disk full, permissions, a broken ffmpeg: retrying will not help.
+    return PERMANENT
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=4, base_delay=2.0, max_delay=120.0, throttle_delay=30.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.throttle_delay = throttle_delay
+
+    def should_retry(self, kind, attempt):
+        # `attempt` is the number of attempts made so far.
+        return kind != PERMANENT and attempt < self.max_attempts
+
+    def delay(self, kind, attempt):
+        # Jittered exponential backoff; throttling starts from a much
+        # longer base so the whole pipeline backs off together.
+        base = self.throttle_delay if kind == THROTTLED else self.base_delay
+        return random.uniform(base / 2, min(self.max_delay, base * 2 ** (attempt - 1)))
+
+
+class RetryQueue:
+    # Holds tasks until their backoff expires, then hands them back with
+    # `callback()`. One thread serves every pending retry, so a waiting track
+    # never occupies a worker. Tasks whose `cancelled()` turns true are released
+    # early.
+    def __init__(self, name="retry"):
+        self.name = name
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def schedule(self, delay, callback, cancelled=None):
+        with self.condition:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), callback, cancelled))
+            self.condition.notify()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.heap)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                due = []
+                while not self.stopped:
+                    now = time.monotonic()
+                    due = [item for item in self.heap if item[0] <= now or (item[3] and item[3]())]
+                    if due:
+                        break
+                    # Poll while tasks are pending so cancelled ones are noticed.
+                    self.condition.wait(min(self.heap[0][0] - now, 0.2) if self.heap else None)
+                if self.stopped:
+                    return
+                self.heap = [item for item in self.heap if item not in due]
+                heapq.heapify(self.heap)
+            for _, _, callback, _ in sorted(due, key=lambda item: item[:2]):
+                callback()
+
+    def shutdown(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def write_failure_report(folder, failures):
+    # Written next to the audio files; removed again once nothing fails.
+    path = os.path.join(folder, FAILURE_REPORT_NAME)
+    if not failures:
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"total_failed": len(failures), "tracks": failures}, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+    return path
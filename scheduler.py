@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+import traceback
+
+
+# The task the current worker thread is running: [scheduler, started, elapsed].
+current = threading.local()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def end_task():
+    # Stops the clock on the task running in this thread, once. Called when it
+    # hands its work to the next stage: the time it then spends waiting for
+    # room in that stage's queue is backpressure, not this stage's latency.
+    task = getattr(current, "task", None)
+    if task is None or task[2] is not None:
+        return
+    scheduler, started, _ = task
+    task[2] = time.monotonic() - started
+    if scheduler.controller is not None:
+        scheduler.controller.record(task[2])
+
+
+class Scheduler:
+    # Persistent worker pool fed by a bounded queue; the download pipeline runs
+    # one per stage. With a controller (see concurrency.AIMDController) one
+    # thread is started per slot up to its ceiling and the controller decides
+    # how many of them may run at once.
+    def __init__(self, max_workers=5, queue_size=None, name="scheduler", controller=None):
+        self.name = name
+        self.controller = controller
+        if controller is not None:
+            max_workers = controller.ceiling
+        self.max_workers = max(1, int(max_workers))
+        self.tasks = queue.Queue(maxsize=queue_size or self.max_workers * 2)
+        self.workers = []
+        self.stats_lock = threading.Lock()
+        self.started_at = None
+        self.processed = 0
+        self.busy_time = 0.0
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _worker(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                fn, args, kwargs = task
+                if self.controller is not None:
+                    self.controller.acquire()
+                current.task = [self, time.monotonic(), None]
+                try:
+                    fn(*args, **kwargs)
+                except JobCancelled:
+                    pass
+                except Exception:
+                    traceback.print_exc()
+                finally:
+                    end_task()
+                    elapsed = current.task[2]
+                    current.task = None
+                    if self.controller is not None:
+                        self.controller.release()
+                with self.stats_lock:
+                    self.processed += 1
+                    self.busy_time += elapsed
+            finally:
+                self.tasks.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        # Blocks while the queue is full so producers never run far ahead of the
+        # workers.
+        end_task()
+        self.tasks.put((fn, args, kwargs))
+
+    def stats(self):
+        with self.stats_lock:
+            processed = self.processed
+            busy_time = self.busy_time
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        workers = self.controller.limit if self.controller is not None else self.max_workers
+        stats = {
+            "workers": workers,
+            "queue_depth": self.tasks.qsize(),
+            "processed": processed,
+            "throughput": processed / elapsed if elapsed else 0.0,
+            "utilization": busy_time / (elapsed * workers) if elapsed else 0.0,
+        }
+        if self.controller is not None:
+            stats["concurrency"] = self.controller.stats()
+        return stats
+
+    def shutdown(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
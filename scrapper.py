@@ -0,0 +1,146 @@
+import os
+import re
+import csv
+import json
+import threading
+from catalog import CATALOG_NAME, Catalog
+from search_cache import CACHE_DIR
+from spotify_api import SpotifyClient, parse_spotify_id, track_record
+
+SCRAPPER_DIR = "Scrapper"
+CSV_FIELDS = ["id", "title", "artist", "url", "duration_ms", "isrc"]
+LIKED_NAME = "Liked Songs"
+
+
+def parse_source(value):
+    # ("liked", None), ("album", id) or ("playlist", id) for a URL, URI or ID.
+    value = value.strip()
+    if value.lower() in ("liked", "saved", "me") or "collection/tracks" in value or value.endswith(":collection"):
+        return "liked", None
+    if "album/" in value or value.startswith("spotify:album:"):
+        return "album", parse_spotify_id(value, "album")
+    return "playlist", parse_spotify_id(value, "playlist")
+
+
+def safe_filename(name):
+    return re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", name).strip(" .") or "playlist"
+
+
+class JsonTrackWriter:
+    # Writes the same document as json.dump would, one track at a time. The
+    # count goes after the array because it is only known at the end.
+    def __init__(self, f, source, source_id, name):
+        self.f = f
+        self.count = 0
+        header = json.dumps({"playlist_id": source_id, "playlist_name": name, "source": source}, ensure_ascii=False)
+        f.write(header[:-1] + ', "tracks": [')
+
+    def write(self, record):
+        self.f.write(("," if self.count else "") + "\n    " + json.dumps(record, ensure_ascii=False))
+        self.count += 1
+
+    def close(self):
+        self.f.write(f'\n], "total_tracks": {self.count}}}\n')
+
+
+class CsvTrackWriter:
+    def __init__(self, f, source, source_id, name):
+        self.writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        self.writer.writeheader()
+        self.count = 0
+
+    def write(self, record):
+        self.writer.writerow(record)
+        self.count += 1
+
+    def close(self):
+        pass
+
+
+WRITERS = {"json": JsonTrackWriter, "csv": CsvTrackWriter}
+
+
+class SpotifyScrapper:
+    # Saves the track listing of a playlist, an album or the user's liked songs
+    # to Scrapper/<name>.json|.csv for the exporter. Pages are fetched
+    # concurrently over one pooled session and each page is written out as it
+    # arrives, so a 10k-track playlist never sits in memory at once. The same
+    # pages are upserted into the catalog.
+    def __init__(self, logger, cache_dir=CACHE_DIR):
+        self.logger = logger
+        self.catalog = Catalog(os.path.join(cache_dir, CATALOG_NAME))
+
+    def log(self, message, color="white"):
+        self.logger.log_signal.emit(message, color)
+
+    def start_scrap(self, config, save_as="json", finished_callback=None):
+        def run():
+            self.scrap(config, save_as)
+            if finished_callback:
+                finished_callback()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def scrap(self, config, save_as="json", output_dir=SCRAPPER_DIR):
+        if save_as not in WRITERS:
+            self.log(f"[Error] Unsupported scrap format: {save_as}", "red")
+            return None
+        market = config.get("market") or None
+        spotify = SpotifyClient(config.get("client_id"), config.get("client_secret"),
+                                access_token=config.get("access_token"), max_workers=config.get("max_threads", 8))
+        try:
+            source, source_id = parse_source(config.get("playlist_url") or "")
+            if source == "liked" and not config.get("access_token"):
+                self.log("[Error] Liked songs need a user access token (access_token)", "red")
+                return None
+            snapshot_id = None
+            if source == "playlist":
+                playlist = spotify.get_playlist(source_id, fields="name,snapshot_id")
+                name, snapshot_id = playlist["name"], playlist.get("snapshot_id")
+                pages = spotify.iter_playlist_tracks(source_id, market)
+            elif source == "album":
+                name = spotify.get_album(source_id, market)["name"]
+                pages = spotify.iter_album_tracks(source_id, market)
+            else:
+                source_id = "liked"
+                name = LIKED_NAME
+                pages = spotify.iter_saved_tracks(market)
+            name = name.strip()
+            self.catalog.begin_playlist(source_id, name, source, snapshot_id)
+
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, f"{safe_filename(name)}.{save_as}")
+            self.log(f"[Scrap] Saving {source} {name} to {path}", "#5cb3ff")
+            count = self.write_pages(path, save_as, pages, source, source_id, name)
+            self.log(f"[Scrap] Saved {count} tracks to {path}", "#00ffaa")
+            return path
+        except Exception as e:
+            self.log(f"[Error] Scrap failed: {e}", "red")
+            return None
+        finally:
+            spotify.close()
+
+    def write_pages(self, path, save_as, pages, source, source_id, name):
+        # Written under a temporary name so a failed scrap never leaves a
+        # truncated file where the exporter would pick it up.
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", newline="" if save_as == "csv" else None, encoding="utf-8") as f:
+                writer = WRITERS[save_as](f, source, source_id, name)
+                for page in pages:
+                    # Podcast episodes and unavailable entries have no artists.
+                    records = [track_record(track) for track in page if track.get("artists")]
+                    self.catalog.add_tracks(source_id, records, writer.count)
+                    for record in records:
+                        writer.write(record)
+                    self.log(f"[Scrap] {writer.count} tracks...", "gray")
+                writer.close()
+            os.replace(tmp_path, path)
+            self.catalog.finish_playlist(source_id, writer.count)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return writer.count
@@ -0,0 +1,93 @@
+import os
+import re
+import time
+from database import Database
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+CACHE_NAME = "search_cache.sqlite3"
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, CACHE_NAME)
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 100000
+
+
+def make_key(title="", artist="", track_id=None):
+    if track_id:
+        return f"spotify:{track_id}"
+    text = f"{title} {artist}".lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return "query:" + " ".join(text.split())
+
+
+class SearchCache(Database):
+    # Maps a normalized "title + artist" key (or a Spotify track ID) to the
+    # resolved YouTube URL.
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_results ("
+                "key TEXT PRIMARY KEY, url TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS search_results_created ON search_results (created)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bad_videos ("
+                "video_id TEXT PRIMARY KEY, reason TEXT, created REAL NOT NULL)"
+            )
+        self.prune()
+
+    def get(self, key):
+        row = self.connection().execute(
+            "SELECT url, created FROM search_results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, created = row
+        if self.ttl and time.time() - created > self.ttl:
+            return None
+        return url
+
+    def set(self, key, url):
+        if not url:
+            return
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, url, created) VALUES (?, ?, ?)",
+                (key, url, time.time()),
+            )
+
+    def delete(self, key):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM search_results WHERE key = ?", (key,))
+
+    def is_bad(self, video_id):
+        if not video_id:
+            return False
+        row = self.connection().execute(
+            "SELECT created FROM bad_videos WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        return row is not None and not (self.ttl and time.time() - row[0] > self.ttl)
+
+    def mark_bad(self, video_id, reason=""):
+        if not video_id:
+            return
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO bad_videos (video_id, reason, created) VALUES (?, ?, ?)",
+                (video_id, reason, time.time()),
+            )
+
+    def prune(self):
+        # Drop expired entries, then the oldest ones beyond max_entries.
+        with self.connection() as conn:
+            if self.ttl:
+                conn.execute("DELETE FROM search_results WHERE created < ?", (time.time() - self.ttl,))
+                conn.execute("DELETE FROM bad_videos WHERE created < ?", (time.time() - self.ttl,))
+            if self.max_entries:
+                conn.execute(
+                    "DELETE FROM search_results WHERE key IN ("
+                    "SELECT key FROM search_results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
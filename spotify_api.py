@@ -0,0 +1,182 @@
+import time
+import base64
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+API_URL = "https://api.spotify.com/v1"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+PAGE_SIZE = 100
+# Album and library listings are capped at 50 per page, as is /tracks?ids=.
+SMALL_PAGE_SIZE = 50
+MAX_RETRIES = 5
+
+
+class SpotifyError(Exception):
+    pass
+
+
+def parse_spotify_id(value, kind="playlist"):
+    # Accepts an open.spotify.com URL, a spotify:<kind>:<id> URI or a bare ID.
+    if f"{kind}/" in value:
+        return value.split(f"{kind}/")[1].split("?")[0].split("/")[0]
+    if value.startswith(f"spotify:{kind}:"):
+        return value.split(":")[-1]
+    return value
+
+
+def track_record(track):
+    return {
+        "id": track.get("id"),
+        "title": track["name"],
+        "artist": ", ".join(a["name"] for a in track["artists"]),
+        "url": track.get("external_urls", {}).get("spotify", ""),
+        "duration_ms": track.get("duration_ms"),
+        "isrc": (track.get("external_ids") or {}).get("isrc"),
+    }
+
+
+class SpotifyClient:
+    # Client-credentials tokens are cached per client ID for the lifetime of the
+    # process and refreshed shortly before they expire.
+    _tokens = {}
+    _tokens_lock = threading.Lock()
+
+    def __init__(self, client_id=None, client_secret=None, access_token=None, max_workers=8,
+                 api_url=API_URL, token_url=TOKEN_URL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token = access_token
+        self.max_workers = max(1, int(max_workers))
+        self.api_url = api_url.rstrip("/")
+        self.token_url = token_url
+        # requests is imported on first use to keep it out of app startup.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def token(self, force_refresh=False):
+        if self.access_token:
+            return self.access_token
+        key = (self.token_url, self.client_id)
+        with self._tokens_lock:
+            cached = self._tokens.get(key)
+            if cached and not force_refresh and cached[1] - 60 > time.time():
+                return cached[0]
+            auth_str = f"{self.client_id}:{self.client_secret}"
+            b64_auth_str = base64.b64encode(auth_str.encode()).decode()
+            response = self.session.post(
+                self.token_url,
+                headers={"Authorization": f"Basic {b64_auth_str}"},
+                data={"grant_type": "client_credentials"},
+            )
+            response.raise_for_status()
+            data = response.json()
+            self._tokens[key] = (data["access_token"], time.time() + data.get("expires_in", 3600))
+            return data["access_token"]
+
+    def get(self, path, params=None):
+        import requests
+
+        url = path if path.startswith("http") else f"{self.api_url}/{path.lstrip('/')}"
+        refreshed = False
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                response = self.session.get(
+                    url, params=params, headers={"Authorization": f"Bearer {self.token()}"}, timeout=30
+                )
+            except requests.ConnectionError:
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
+                continue
+
+            if response.status_code == 401 and not refreshed and not self.access_token:
+                self.token(force_refresh=True)
+                refreshed = True
+                continue
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == MAX_RETRIES:
+                    break
+                retry_after = response.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else 0.5 * 2 ** attempt
+                time.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json()
+        response.raise_for_status()
+        raise SpotifyError(f"Giving up on {url} after {MAX_RETRIES} retries")
+
+    def iter_pages(self, path, params=None, page_size=PAGE_SIZE, transform=None):
+        # The first page tells us the total; the remaining offsets are fetched in
+        # parallel and yielded in order. At most `max_workers` pages are in
+        # flight or waiting to be consumed, so memory does not grow with the
+        # size of the listing. `transform(items)` runs on the worker threads.
+        transform = transform or (lambda items: items)
+        params = dict(params or {}, limit=page_size, offset=0)
+        first = self.get(path, params)
+        yield transform(first["items"])
+        total = first.get("total") or 0
+        offsets = iter(range(page_size, total, page_size))
+
+        def fetch(offset):
+            return transform(self.get(path, dict(params, offset=offset))["items"])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for offset in offsets:
+                pending.append(executor.submit(fetch, offset))
+                if len(pending) >= self.max_workers:
+                    break
+            while pending:
+                items = pending.popleft().result()
+                offset = next(offsets, None)
+                if offset is not None:
+                    pending.append(executor.submit(fetch, offset))
+                yield items
+
+    def get_playlist(self, playlist_id, market=None, fields=None):
+        params = {}
+        if market:
+            params["market"] = market
+        if fields:
+            params["fields"] = fields
+        return self.get(f"playlists/{playlist_id}", params)
+
+    def iter_playlist_tracks(self, playlist_id, market=None):
+        params = {"market": market} if market else None
+        for items in self.iter_pages(f"playlists/{playlist_id}/tracks", params):
+            yield [item["track"] for item in items if item.get("track")]
+
+    def get_album(self, album_id, market=None):
+        return self.get(f"albums/{album_id}", {"market": market} if market else None)
+
+    def get_tracks(self, track_ids, market=None):
+        # Full track objects (with ISRCs) for up to 50 IDs.
+        params = {"ids": ",".join(track_ids)}
+        if market:
+            params["market"] = market
+        return [track for track in self.get("tracks", params)["tracks"] if track]
+
+    def iter_album_tracks(self, album_id, market=None):
+        # Album listings only hold simplified tracks, so each page is swapped
+        # for the full objects to get durations and ISRCs.
+        params = {"market": market} if market else None
+
+        def enrich(items):
+            return self.get_tracks([item["id"] for item in items if item.get("id")], market)
+
+        yield from self.iter_pages(f"albums/{album_id}/tracks", params, SMALL_PAGE_SIZE, enrich)
+
+    def iter_saved_tracks(self, market=None):
+        # Needs a user access token with the user-library-read scope.
+        params = {"market": market} if market else None
+        for items in self.iter_pages("me/tracks", params, SMALL_PAGE_SIZE):
+            yield [item["track"] for item in items if item.get("track")]
@@ -0,0 +1,205 @@
+import os
+import re
+import shutil
+import time
+from database import Database
+
+DEFAULT_STORE_DIR = ".library"
+LINK_MODES = ("hardlink", "symlink", "m3u")
+INDEX_NAME = "index.sqlite3"
+M3U_NAME = "playlist.m3u8"
+# Files in objects/ that no index row points at (an interrupted download) are
+# only collected once they are this old; indexed files get a shorter grace so a
+# running download can link them first.
+ORPHAN_GRACE = 24 * 3600
+LINK_GRACE = 3600
+
+
+class AudioStore(Database):
+    # Content-addressed library: one canonical file per YouTube video and output
+    # format under objects/, plus an index that maps Spotify track IDs to those
+    # files. Playlist folders only hold links to the store (or an M3U listing
+    # it), so a track shared by many playlists is downloaded, converted and
+    # stored once. Every link is recorded so unreferenced files can be collected.
+    def __init__(self, root=DEFAULT_STORE_DIR, link_mode="hardlink"):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"link_mode must be one of {', '.join(LINK_MODES)}")
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.link_mode = link_mode
+        os.makedirs(self.objects_dir, exist_ok=True)
+        super().__init__(os.path.join(self.root, INDEX_NAME))
+        with self.connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS objects ("
+                "video_id TEXT NOT NULL, variant TEXT NOT NULL, path TEXT NOT NULL, title TEXT, "
+                "size INTEGER, created REAL NOT NULL, PRIMARY KEY (video_id, variant))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "track_id TEXT NOT NULL, variant TEXT NOT NULL, video_id TEXT NOT NULL, "
+                "PRIMARY KEY (track_id, variant))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS links ("
+                "link_path TEXT PRIMARY KEY, video_id TEXT NOT NULL, variant TEXT NOT NULL, mode TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS playlists (m3u_path TEXT PRIMARY KEY)")
+
+    def output_template(self, variant):
+        # yt-dlp output template that downloads straight into the store. Every
+        # variant has its own directory, so a kept original and the download
+        # an mp3 is converted from never share a file.
+        return os.path.join(self.objects_dir, re.sub(r"[^\w.-]", "_", variant), "%(id).2s", "%(id)s.%(ext)s")
+
+    def find(self, video_id, variant):
+        row = self.connection().execute(
+            "SELECT path, title FROM objects WHERE video_id = ? AND variant = ?", (video_id, variant)
+        ).fetchone()
+        if row is None or not os.path.isfile(row[0]):
+            return None
+        return row
+
+    def find_track(self, track_id, variant):
+        if not track_id:
+            return None
+        row = self.connection().execute(
+            "SELECT video_id FROM tracks WHERE track_id = ? AND variant = ?", (track_id, variant)
+        ).fetchone()
+        if row is None:
+            return None
+        found = self.find(row[0], variant)
+        return (row[0], *found) if found else None
+
+    def add(self, video_id, variant, path, title=None, track_id=None):
+        path = os.path.abspath(path)
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO objects (video_id, variant, path, title, size, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, variant, path, title, os.path.getsize(path), time.time()),
+            )
+            if track_id:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tracks (track_id, variant, video_id) VALUES (?, ?, ?)",
+                    (track_id, variant, video_id),
+                )
+        return path
+
+    def link(self, video_id, variant, folder, name):
+        # Puts the stored file into a playlist folder under a readable name and
+        # returns the path the playlist should use. In m3u mode nothing is
+        # created and the store path itself is returned.
+        source, _ = self.find(video_id, variant)
+        if self.link_mode == "m3u":
+            return source
+        os.makedirs(folder, exist_ok=True)
+        link_path = os.path.join(folder, name)
+        if os.path.lexists(link_path) and not self._same(source, link_path):
+            # Another video with the same title already has this name.
+            stem, ext = os.path.splitext(name)
+            link_path = os.path.join(folder, f"{stem} [{video_id}]{ext}")
+        mode = self._place(source, link_path)
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO links (link_path, video_id, variant, mode) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(link_path), video_id, variant, mode),
+            )
+        return link_path
+
+    def _same(self, source, link_path):
+        return os.path.isfile(link_path) and os.path.samefile(source, link_path)
+
+    def _place(self, source, link_path):
+        if os.path.lexists(link_path):
+            if self._same(source, link_path):
+                return "symlink" if os.path.islink(link_path) else "hardlink"
+            os.remove(link_path)
+        if self.link_mode == "symlink":
+            try:
+                os.symlink(os.path.relpath(source, os.path.dirname(link_path)), link_path)
+                return "symlink"
+            except OSError:
+                pass
+        try:
+            os.link(source, link_path)
+            return "hardlink"
+        except OSError:
+            shutil.copy2(source, link_path)
+            return "copy"
+
+    def write_m3u(self, folder, paths):
+        # Paths are written relative to the playlist folder so the folder and
+        # the store can be moved together. The store keeps every file an M3U
+        # lists alive until that M3U is deleted.
+        path = os.path.join(folder, M3U_NAME)
+        tmp_path = path + ".tmp"
+        os.makedirs(folder, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("#EXTM3U\n")
+            for entry in paths:
+                f.write(os.path.relpath(entry, folder) + "\n")
+        os.replace(tmp_path, path)
+        with self.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO playlists (m3u_path) VALUES (?)", (os.path.abspath(path),))
+        return path
+
+    def referenced_by_m3u(self):
+        # Returns the store files listed in existing M3Us and the M3Us that are gone.
+        referenced, missing = set(), []
+        for (m3u_path,) in self.connection().execute("SELECT m3u_path FROM playlists").fetchall():
+            if not os.path.isfile(m3u_path):
+                missing.append(m3u_path)
+                continue
+            folder = os.path.dirname(m3u_path)
+            with open(m3u_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        referenced.add(os.path.normpath(os.path.join(folder, line)))
+        return referenced, missing
+
+    def gc(self, dry_run=False):
+        # Drops links whose file was deleted, then every stored file nothing
+        # links to any more. Returns (files removed, bytes freed).
+        conn = self.connection()
+        live = set()
+        dead_links = []
+        for link_path, video_id, variant in conn.execute("SELECT link_path, video_id, variant FROM links").fetchall():
+            if os.path.lexists(link_path):
+                live.add((video_id, variant))
+            else:
+                dead_links.append(link_path)
+        referenced, missing_m3u = self.referenced_by_m3u()
+
+        removed, freed = [], 0
+        indexed = set()
+        recent = time.time() - LINK_GRACE
+        rows = conn.execute("SELECT video_id, variant, path, size, created FROM objects").fetchall()
+        for video_id, variant, path, size, created in rows:
+            indexed.add(os.path.normpath(path))
+            if (video_id, variant) in live or os.path.normpath(path) in referenced or created > recent:
+                continue
+            removed.append((video_id, variant, path))
+            freed += size or 0
+
+        orphans = []
+        cutoff = time.time() - ORPHAN_GRACE
+        for directory, _, files in os.walk(self.objects_dir):
+            for name in files:
+                path = os.path.normpath(os.path.join(directory, name))
+                if path not in indexed and os.path.getmtime(path) < cutoff:
+                    orphans.append(path)
+                    freed += os.path.getsize(path)
+
+        if dry_run:
+            return len(removed) + len(orphans), freed
+        with conn:
+            conn.executemany("DELETE FROM links WHERE link_path = ?", [(p,) for p in dead_links])
+            conn.executemany("DELETE FROM playlists WHERE m3u_path = ?", [(p,) for p in missing_m3u])
+            for video_id, variant, path in removed:
+                conn.execute("DELETE FROM objects WHERE video_id = ? AND variant = ?", (video_id, variant))
+                conn.execute("DELETE FROM tracks WHERE video_id = ? AND variant = ?", (video_id, variant))
+        for path in [path for _, _, path in removed] + orphans:
+            if os.path.exists(path):
+                os.remove(path)
+        return len(removed) + len(orphans), freed
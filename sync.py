@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_NAME = ".sync_manifest.json"
+
+
+def file_sha1(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SyncManifest:
+    # Per-playlist record of what has already been downloaded, keyed by Spotify
+    # track ID and stored next to the audio files.
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        # Saves share one temporary file, so they go one at a time.
+        self.save_lock = threading.Lock()
+        self.snapshot_id = None
+        self.tracks = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.snapshot_id = data.get("snapshot_id")
+        self.tracks = data.get("tracks", {})
+
+    def save(self):
+        with self.lock:
+            data = {"snapshot_id": self.snapshot_id, "tracks": dict(self.tracks)}
+        tmp_path = self.path + ".tmp"
+        with self.save_lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def is_synced(self, track_id):
+        entry = self.tracks.get(track_id) if track_id else None
+        if not entry:
+            return False
+        path = os.path.join(self.folder, entry["file"])
+        return os.path.isfile(path) and os.path.getsize(path) == entry["size"]
+
+    def is_complete(self, snapshot_id):
+        # Same snapshot and every recorded file still on disk: nothing to do, not
+        # even fetching the track list.
+        return (
+            snapshot_id is not None
+            and snapshot_id == self.snapshot_id
+            and all(self.is_synced(track_id) for track_id in self.tracks)
+        )
+
+    def missing(self, tracks):
+        return [t for t in tracks if not self.is_synced(t.get("id"))]
+
+    def removed(self, tracks):
+        current = {t.get("id") for t in tracks}
+        return [track_id for track_id in self.tracks if track_id not in current]
+
+    def record(self, track_id, path, song=None):
+        if not track_id or not path or not os.path.isfile(path):
+            return
+        entry = {
+            "file": os.path.relpath(path, self.folder),
+            "size": os.path.getsize(path),
+            "sha1": file_sha1(path),
+        }
+        if song:
+            entry["title"] = song.get("title")
+            entry["artist"] = song.get("artist")
+        with self.lock:
+            self.tracks[track_id] = entry
+
+    def prune(self, track_ids):
+        removed_files = []
+        for track_id in track_ids:
+            with self.lock:
+                entry = self.tracks.pop(track_id, None)
+            if not entry:
+                continue
+            path = os.path.join(self.folder, entry["file"])
+            # Files outside the folder (the shared audio store) are left to
+            # the store's garbage collector.
+            if entry["file"].startswith(os.pardir):
+                continue
+            if os.path.isfile(path):
+                os.remove(path)
+                removed_files.append(path)
+        return removed_files
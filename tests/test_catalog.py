@@ -0,0 +1,20 @@
+from catalog import Catalog
+
+
+class FakeSpotify:
+    def iter_playlist_tracks(self, playlist_id, market=None):
+        yield [
+            {"id": "t0", "name": "Song", "artists": [{"name": "Artist"}], "duration_ms": 180000},
+            {"id": "e0", "name": "Episode", "type": "episode", "duration_ms": 3600000},
+            {"id": None, "name": "Unavailable", "artists": []},
+        ]
+
+
+def test_fetch_playlist_skips_items_without_artists(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.sqlite3"))
+
+    tracks, cached = catalog.fetch_playlist(FakeSpotify(), "p1", "Mix", "s1")
+
+    assert not cached
+    assert [track["id"] for track in tracks] == ["t0"]
+    assert [track["id"] for track in catalog.iter_tracks("p1")] == ["t0"]
@@ -0,0 +1,89 @@
+import concurrency
+from concurrency import AIMDController
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_controller(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(concurrency.time, "monotonic", clock)
+    changes = []
+    controller = AIMDController(name="download", on_change=lambda *change: changes.append(change), **kwargs)
+    return controller, clock, changes
+
+
+def run_window(controller, clock, latency=1.0, seconds=1.0, errors=0):
+    # Completes one window of tasks spread over `seconds`.
+    size = max(controller.limit, concurrency.MIN_WINDOW)
+    for _ in range(errors):
+        controller.record_error(RuntimeError("Connection reset by peer"))
+    for _ in range(size):
+        clock.now += seconds / size
+        controller.record(latency)
+
+
+def test_steady_windows_add_one_slot_up_to_the_ceiling(monkeypatch):
+    controller, clock, changes = make_controller(monkeypatch, floor=2, ceiling=4)
+
+    for _ in range(4):
+        run_window(controller, clock)
+
+    assert controller.limit == 4
+    assert changes == [("download", 2, 3, "increase"), ("download", 3, 4, "increase")]
+
+
+def test_throttling_halves_the_limit_once_per_cooldown(monkeypatch):
+    controller, clock, changes = make_controller(monkeypatch, floor=2, ceiling=32, initial=16, cooldown=5.0)
+
+    controller.record_error(RuntimeError("HTTP Error 429: Too Many Requests"))
+    controller.record_error(RuntimeError("HTTP Error 429: Too Many Requests"))
+    clock.now += 5.0
+    controller.record_error(RuntimeError("Sign in to confirm you're not a bot"))
+
+    assert controller.limit == 4
+    assert changes == [("download", 16, 8, "throttled"), ("download", 8, 4, "throttled")]
+    assert controller.stats()["throttled"] == 3
+
+
+def test_limit_never_drops_below_the_floor(monkeypatch):
+    controller, clock, changes = make_controller(monkeypatch, floor=3, ceiling=8, initial=4, cooldown=0.0)
+
+    for _ in range(3):
+        controller.record_error(RuntimeError("HTTP Error 429"))
+
+    assert controller.limit == 3
+    assert changes == [("download", 4, 3, "throttled")]
+
+
+def test_window_with_mostly_errors_shrinks(monkeypatch):
+    controller, clock, changes = make_controller(monkeypatch, floor=2, ceiling=32, initial=8)
+
+    run_window(controller, clock, errors=5)
+
+    assert controller.limit == 4
+    assert changes == [("download", 8, 4, "errors")]
+
+
+def test_slower_window_with_inflated_latency_shrinks(monkeypatch):
+    controller, clock, changes = make_controller(monkeypatch, floor=2, ceiling=32, initial=8)
+
+    run_window(controller, clock, latency=1.0, seconds=1.0)
+    run_window(controller, clock, latency=3.0, seconds=2.0)
+
+    assert changes == [("download", 8, 9, "increase"), ("download", 9, 4, "latency")]
+
+
+def test_throughput_drop_without_latency_change_holds_the_limit(monkeypatch):
+    controller, clock, changes = make_controller(monkeypatch, floor=2, ceiling=32, initial=4)
+
+    run_window(controller, clock, seconds=1.0)
+    run_window(controller, clock, seconds=2.0)
+
+    assert controller.limit == 5
+    assert changes == [("download", 4, 5, "increase")]
@@ -0,0 +1,152 @@
+import threading
+
+import distributed
+from distributed import REPORT_BATCH, CoordinatorError, DistributedWorker, TaskQueue
+from journal import JobJournal
+
+
+class FakeClient:
+    url = "http://coordinator"
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def call(self, path, payload=None):
+        if self.fail:
+            raise CoordinatorError(f"{self.url}{path}: invalid response")
+        self.calls.append((path, payload))
+        return {}
+
+
+class FakeDownloader:
+    def __init__(self):
+        self.messages = []
+
+    def log(self, message, color="white"):
+        self.messages.append(message)
+
+
+def finished_track(key):
+    return {"key": key, "result": {"state": "done"}, "outputs": {"p1": f"/music/{key}.mp3"}}
+
+
+def test_results_are_queued_and_posted_in_batches():
+    client = FakeClient()
+    worker = DistributedWorker(FakeDownloader(), client, {}, worker_id="w1")
+    for i in range(REPORT_BATCH + 1):
+        worker.report(finished_track(f"t{i}"))
+
+    assert client.calls == []
+    client.fail = True
+    assert not worker.flush()
+    assert len(worker.results) == REPORT_BATCH + 1
+
+    client.fail = False
+    assert worker.flush()
+    assert [len(payload["results"]) for _, payload in client.calls] == [REPORT_BATCH, 1]
+    assert worker.results == []
+    assert worker.completed == REPORT_BATCH + 1
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_queue(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(distributed.time, "time", clock)
+    queue = TaskQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=60, **kwargs)
+    queue.add_playlist("p1", "Mix", [{"id": "t1", "title": "Song", "artist": "Artist"}])
+    return queue, clock
+
+
+def test_expired_lease_is_leased_again(tmp_path, monkeypatch):
+    queue, clock = make_queue(tmp_path, monkeypatch)
+    (first,) = queue.lease("w1", 10)
+    assert queue.lease("w2", 10) == []
+
+    clock.now += 61
+    (second,) = queue.lease("w2", 10)
+
+    assert (first["key"], first["attempt"]) == ("t1", 1)
+    assert (second["key"], second["attempt"]) == ("t1", 2)
+    assert queue.heartbeat("w1", ["t1"]) == ["t1"]
+    assert queue.heartbeat("w2", ["t1"]) == []
+
+
+def test_late_completion_from_a_stale_lease_is_rejected(tmp_path, monkeypatch):
+    queue, clock = make_queue(tmp_path, monkeypatch)
+    queue.lease("w1", 10)
+    clock.now += 61
+    queue.lease("w2", 10)
+
+    assert queue.complete("w1", [{"key": "t1", "state": "done", "output": "/w1/Song.mp3", "attempt": 1}]) == 0
+    assert queue.complete("w2", [{"key": "t1", "state": "done", "output": "/w2/Song.mp3", "attempt": 2}]) == 1
+    assert queue.status()["states"]["done"] == 1
+
+
+def test_stale_lease_is_rejected_when_the_same_worker_leases_again(tmp_path, monkeypatch):
+    queue, clock = make_queue(tmp_path, monkeypatch)
+    queue.lease("w1", 10)
+    clock.now += 61
+    (task,) = queue.lease("w1", 10)
+
+    assert queue.complete("w1", [{"key": "t1", "state": "failed", "error": "timed out", "attempt": 1}]) == 0
+    assert queue.complete("w1", [{"key": "t1", "state": "done", "attempt": task["attempt"]}]) == 1
+    assert queue.failures() == []
+
+
+def test_lease_expiring_past_max_attempts_fails_the_track(tmp_path, monkeypatch):
+    queue, clock = make_queue(tmp_path, monkeypatch, max_attempts=2)
+    for _ in range(2):
+        queue.lease("w1", 10)
+        clock.now += 61
+
+    assert queue.lease("w1", 10) == []
+    (failure,) = queue.failures()
+    assert (failure["id"], failure["attempts"], failure["error"]) == ("t1", 2, "lease expired")
+
+
+class PipelineDownloader(FakeDownloader):
+    # Finishes every track of a batch at once, as run_batch would.
+    def __init__(self, tmp_path):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.batches = []
+        self.journal = JobJournal(str(tmp_path / "journal.sqlite3"))
+
+    def make_track(self, song, job, config):
+        return {"key": song["id"], "song": song}
+
+    def track_key(self, song):
+        return song["id"]
+
+    def run_batch(self, batch, config):
+        for track in batch.tracks.values():
+            track["result"] = {"state": "done"}
+            batch.track_done(track)
+
+
+def test_leased_tracks_run_under_a_journal_job_and_report_their_attempt(tmp_path):
+    downloader = PipelineDownloader(tmp_path)
+    worker = DistributedWorker(downloader, FakeClient(), {}, worker_id="w1", output_dir=str(tmp_path))
+    tasks = [{"key": f"t{i}", "song": {"id": f"t{i}"}, "attempt": 2,
+              "playlists": [{"playlist_id": "p1", "name": "Mix"}]} for i in range(2)]
+
+    started = []
+    start_job = downloader.journal.start_job
+    downloader.journal.start_job = lambda *args: started.append(args) or start_job(*args)
+
+    worker.run_tasks(tasks[:1])
+    worker.run_tasks(tasks[1:])
+
+    assert started == [("p1", "Mix", str(tmp_path / "Mix"))]
+    # Still running, so the next run of this playlist resumes it.
+    assert start_job("p1", "Mix", str(tmp_path / "Mix"))
+    assert [(r["key"], r["attempt"]) for r in worker.results] == [("t0", 2), ("t1", 2)]
+    assert worker.in_flight == {}
@@ -0,0 +1,155 @@
+import pytest
+from yt_dlp.utils import DownloadError, ExtractorError
+
+from batch import Batch
+from console import ConsoleLogger
+from downloader import DownloadPipeline, SpotifyDownloader
+from retry import RetryPolicy
+
+
+class FakeYDL:
+    # Candidate "bad" has only image formats, which yt-dlp reports while
+    # processing the extracted info; "flaky" always times out.
+    def __init__(self, params=None):
+        self.params = params or {}
+        self.extracted = []
+        self.downloaded = []
+
+    def extract_info(self, url, download=False, process=True):
+        self.extracted.append(url.rsplit("=", 1)[1])
+        return {"id": url.rsplit("=", 1)[1], "webpage_url": url, "title": url}
+
+    def process_ie_result(self, ie_result, download=True):
+        if ie_result["id"] == "bad":
+            raise ExtractorError("Requested format is not available", expected=True)
+        if ie_result["id"] == "flaky":
+            raise DownloadError("Unable to download webpage: The read operation timed out")
+        self.downloaded.append(ie_result["id"])
+        return dict(ie_result, requested_downloads=[{"filepath": f"/music/{ie_result['id']}.webm"}])
+
+
+    def close(self):
+        pass
+
+
+def make_track(**fields):
+    return dict({"key": "t1", "query": "Song Artist", "store": None, "variant": "mp3", "batch": Batch()}, **fields)
+
+
+def candidate(video_id):
+    return {"id": video_id, "url": f"https://yt/watch?v={video_id}"}
+
+
+def test_format_error_falls_through_to_next_candidate(tmp_path):
+    downloader = SpotifyDownloader(ConsoleLogger(quiet=True), cache_dir=str(tmp_path))
+    ydl = FakeYDL()
+    candidates = [candidate("bad"), candidate("good")]
+
+    info = downloader.resolve_and_download(ydl, candidates, make_track())
+
+    assert info["id"] == "good"
+    assert ydl.downloaded == ["good"]
+    assert downloader.search_cache.is_bad("bad")
+
+
+def test_prune_collects_store_garbage_only_when_syncing(tmp_path):
+    downloader = SpotifyDownloader(ConsoleLogger(quiet=True), cache_dir=str(tmp_path))
+    collected = []
+    downloader.collect_garbage = collected.append
+
+    for sync in (False, True):
+        config = {"access_token": "token", "prune": True, "sync": sync}
+        downloader.download_batch(config, [], lambda done, total: None, lambda: None)
+
+    assert len(collected) == 1
+    assert collected[0]["sync"] is True
+
+
+def test_interrupt_cancels_the_batch_before_releasing_the_pipeline(tmp_path):
+    downloader = SpotifyDownloader(ConsoleLogger(quiet=True), cache_dir=str(tmp_path))
+    batch = Batch()
+    cancelled_at_release = []
+    release_pipeline = downloader.release_pipeline
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    def release():
+        cancelled_at_release.append(batch.cancelled.is_set())
+        release_pipeline()
+
+    batch.wait = interrupted
+    downloader.release_pipeline = release
+
+    with pytest.raises(KeyboardInterrupt):
+        downloader.run_batch(batch, {})
+
+    assert cancelled_at_release == [True]
+    assert downloader.pipeline is None
+
+
+def test_transient_error_requeues_from_the_same_candidate_then_gives_up(tmp_path):
+    downloader = SpotifyDownloader(ConsoleLogger(quiet=True), cache_dir=str(tmp_path))
+    ydl = FakeYDL()
+    downloader.ydl_pool.factory = lambda opts: ydl
+    downloader.pipeline = DownloadPipeline(retry_policy=RetryPolicy(max_attempts=2))
+    requeued = []
+    downloader.pipeline.submit_later = lambda delay, stage, fn, track, cancelled=None: requeued.append(stage)
+    song = {"id": "t1", "title": "Song", "artist": "Artist"}
+    track = make_track(song=song, jobs=[], stream=False, ydl_opts={}, cache_key="song artist",
+                       candidates=[candidate("bad"), candidate("flaky"), candidate("good")])
+
+    downloader.download_stage(track)
+
+    # The unavailable video is dropped for good; the timed-out one is retried
+    # before settling for the worse match after it.
+    assert requeued == ["download"]
+    assert track["attempts"] == 1
+    assert [entry["id"] for entry in track["candidates"]] == ["flaky", "good"]
+    assert downloader.search_cache.is_bad("bad")
+
+    downloader.download_stage(track)
+
+    assert requeued == ["download"]
+    assert ydl.extracted == ["bad", "flaky", "flaky"]
+    assert ydl.downloaded == []
+    assert track["result"]["state"] == "failed"
+    (jobs, failure), = track["batch"].failures
+    assert (failure["stage"], failure["kind"], failure["attempts"]) == ("download", "transient", 2)
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+class StreamingYDL:
+    def __init__(self, params):
+        self.params = params
+
+    def prepare_filename(self, info):
+        return self.params["outtmpl"] % info
+
+    def urlopen(self, request):
+        return FakeResponse(b"opus" * 1000)
+
+
+def test_stream_into_a_new_store_shard(tmp_path):
+    downloader = SpotifyDownloader(ConsoleLogger(quiet=True), cache_dir=str(tmp_path))
+    store = downloader.store_for({"store_dir": str(tmp_path / "library")})
+    ydl = StreamingYDL({"outtmpl": store.output_template("keep")})
+    info = {"id": "dQw4w9WgXcQ", "ext": "webm", "acodec": "opus", "url": "https://media/abc"}
+    track = make_track(store=store, variant="keep", output_format="keep", allowed_codecs=("opus",))
+
+    path = downloader.stream_audio(ydl, info, track)
+
+    assert path == str(tmp_path / "library" / "objects" / "keep" / "dQ" / "dQw4w9WgXcQ.webm")
+    with open(path, "rb") as f:
+        assert f.read() == b"opus" * 1000
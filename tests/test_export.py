@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from export import iter_json_tracks
+
+TRACKS = [
+    {"title": "Déjà Vu", "artist": "Beyoncé, Jay-Z", "duration_ms": 240000, "isrc": "USSM10603618"},
+    {"title": "] , { \"tricky\" : [", "artist": "Brackets", "tags": [[1, 2], {"x": []}]},
+    {"title": "日本語", "artist": "アーティスト", "duration_ms": None},
+]
+
+
+def write_playlist(path, tracks, indent=None):
+    # "tracks" comes after a long field, so the key itself straddles chunks.
+    data = {"name": "Mix", "description": "x" * 300, "tracks": tracks}
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=indent), encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_tracks_parse_across_chunk_boundaries(tmp_path, chunk_size, indent):
+    path = write_playlist(tmp_path / "mix.json", TRACKS, indent)
+
+    assert list(iter_json_tracks(path, chunk_size=chunk_size)) == TRACKS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_empty_tracks_array(tmp_path, chunk_size):
+    path = write_playlist(tmp_path / "mix.json", [], indent=2)
+
+    assert list(iter_json_tracks(path, chunk_size=chunk_size)) == []
+
+
+def test_missing_tracks_key_yields_nothing(tmp_path):
+    path = tmp_path / "mix.json"
+    path.write_text(json.dumps({"name": "Mix", "items": TRACKS}), encoding="utf-8")
+
+    assert list(iter_json_tracks(str(path), chunk_size=16)) == []
+
+
+def test_truncated_file_raises_after_the_complete_tracks(tmp_path):
+    path = tmp_path / "mix.json"
+    text = json.dumps({"tracks": TRACKS}, ensure_ascii=False)
+    path.write_text(text[:text.index("日本語")], encoding="utf-8")
+    tracks = iter_json_tracks(str(path), chunk_size=8)
+
+    assert [next(tracks), next(tracks)] == TRACKS[:2]
+    with pytest.raises(json.JSONDecodeError):
+        next(tracks)
+
+
+def test_ndjson_reads_one_track_per_line(tmp_path):
+    path = tmp_path / "mix.ndjson"
+    path.write_text("\n".join(json.dumps(track) for track in TRACKS) + "\n\n", encoding="utf-8")
+
+    assert list(iter_json_tracks(str(path))) == TRACKS
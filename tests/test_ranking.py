@@ -0,0 +1,89 @@
+import pytest
+
+from ranking import rank_candidates, score_candidate
+
+SONG = {"title": "Blinding Lights", "artist": "The Weeknd", "duration_ms": 200000, "isrc": "USUG11904206"}
+
+
+def entry(title, duration=200, channel="Someone", **extra):
+    return dict({"title": title, "duration": duration, "channel": channel}, **extra)
+
+
+def test_exact_topic_upload_scores_every_component():
+    score = score_candidate(entry("Blinding Lights", channel="The Weeknd - Topic"), SONG)
+
+    # duration, title, artist and channel all match in full
+    assert score == pytest.approx(0.35 + 0.3 + 0.2 + 0.15)
+
+
+def test_live_and_upcoming_streams_are_rejected():
+    assert score_candidate(entry("Blinding Lights", live_status="is_live"), SONG) is None
+    assert score_candidate(entry("Blinding Lights", live_status="is_upcoming"), SONG) is None
+    assert score_candidate(entry("Blinding Lights", live_status="was_live"), SONG) is not None
+
+
+def test_duration_threshold_is_twice_the_tolerance():
+    # 25% of 200s is 50s, so anything more than 100s away is a different edit.
+    assert score_candidate(entry("Blinding Lights", duration=300), SONG) is not None
+    assert score_candidate(entry("Blinding Lights", duration=301), SONG) is None
+    assert score_candidate(entry("Blinding Lights", duration=99), SONG) is None
+
+
+def test_short_tracks_get_the_minimum_tolerance():
+    song = dict(SONG, duration_ms=30000)
+
+    # 25% of 30s is below the 20s floor, so the threshold is 40s.
+    assert score_candidate(entry("Blinding Lights", duration=70), song) is not None
+    assert score_candidate(entry("Blinding Lights", duration=71), song) is None
+
+
+def test_long_uploads_are_rejected_without_a_matching_duration():
+    assert score_candidate(entry("Blinding Lights 1 hour", duration=3600), dict(SONG, duration_ms=None)) is None
+    assert score_candidate(entry("Blinding Lights", duration=None), SONG) is not None
+
+
+def test_duration_score_falls_off_linearly():
+    exact = score_candidate(entry("Blinding Lights"), SONG)
+    off = score_candidate(entry("Blinding Lights", duration=250), SONG)
+
+    # 50s out of a 100s window loses half of the duration weight.
+    assert exact - off == pytest.approx(0.35 * 0.5)
+
+
+def test_version_words_are_penalized_unless_in_the_title():
+    original = score_candidate(entry("The Weeknd - Blinding Lights"), SONG)
+    cover = score_candidate(entry("The Weeknd - Blinding Lights (Piano Cover)"), SONG)
+    live = score_candidate(entry("Blinding Lights (Live)"), dict(SONG, title="Blinding Lights - Live"))
+
+    assert original - cover == pytest.approx(0.25 + 0.4)
+    assert live > score_candidate(entry("Blinding Lights (Live)"), SONG)
+
+
+def test_isrc_in_description_adds_a_bonus():
+    plain = score_candidate(entry("Blinding Lights"), SONG)
+    tagged = score_candidate(entry("Blinding Lights", description="ISRC: usug11904206"), SONG)
+
+    assert tagged - plain == pytest.approx(0.2)
+
+
+def test_rank_candidates_orders_by_score_and_drops_rejected():
+    entries = [
+        entry("Blinding Lights (Slowed + Reverb)", channel="Edits"),
+        entry("Blinding Lights 10 hours", duration=36000),
+        entry("The Weeknd - Blinding Lights (Official Audio)", channel="TheWeekndVEVO"),
+        entry("Blinding Lights", channel="The Weeknd - Topic"),
+    ]
+
+    ranked = rank_candidates(entries, SONG)
+
+    assert [e["title"] for e in ranked] == [
+        "Blinding Lights",
+        "The Weeknd - Blinding Lights (Official Audio)",
+        "Blinding Lights (Slowed + Reverb)",
+    ]
+
+
+def test_ties_keep_the_search_order():
+    entries = [entry("Blinding Lights", channel="A"), entry("Blinding Lights", channel="B")]
+
+    assert [e["channel"] for e in rank_candidates(entries, SONG)] == ["A", "B"]
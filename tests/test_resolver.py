@@ -0,0 +1,91 @@
+import threading
+
+from yt_dlp.utils import DownloadError
+
+from resolver import AsyncResolver
+from retry import RetryPolicy
+from search_cache import SearchCache
+
+SONG = {"id": "t1", "title": "Song", "artist": "Artist", "duration_ms": 180000}
+
+
+def entry(video_id, title, channel="Someone"):
+    return {"id": video_id, "url": f"https://www.youtube.com/watch?v={video_id}", "title": title,
+            "duration": 180, "channel": channel}
+
+
+class FakeSearch:
+    # Blocking search returning canned entries; `failures` are raised first.
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def __call__(self, query, count):
+        with self.lock:
+            self.queries.append((query, count))
+            if self.failures:
+                raise self.failures.pop(0)
+        slug = query.replace(" ", "_")
+        return [entry(f"{slug}_cover", f"{query} (Piano Cover)"), entry(slug, query, "Artist - Topic")][:count]
+
+
+def make_resolver(tmp_path, search, **kwargs):
+    logged = []
+    policy = RetryPolicy(max_attempts=3, base_delay=0.0, throttle_delay=0.01)
+    resolver = AsyncResolver(SearchCache(str(tmp_path / "cache.sqlite3")), search, lambda *m: logged.append(m),
+                             retry_policy=policy, **kwargs)
+    return resolver, logged
+
+
+def test_results_keep_track_order_and_use_the_ranked_match(tmp_path):
+    search = FakeSearch()
+    resolver, logged = make_resolver(tmp_path, search, concurrency=4)
+    tracks = [dict(SONG, id=f"t{i}", title=f"Song {i}") for i in range(20)]
+
+    urls = resolver.run(tracks)
+
+    assert urls == [f"https://www.youtube.com/watch?v=Song_{i}_Artist" for i in range(20)]
+    assert {count for _, count in search.queries} == {5}
+    assert logged == []
+
+
+def test_cached_tracks_skip_the_search(tmp_path):
+    search = FakeSearch()
+    resolver, _ = make_resolver(tmp_path, search)
+    first = resolver.run([SONG])
+    search.queries.clear()
+
+    assert resolver.run([SONG]) == first
+    assert search.queries == []
+
+
+def test_throttled_search_is_retried(tmp_path):
+    search = FakeSearch([DownloadError("HTTP Error 429: Too Many Requests")])
+    resolver, logged = make_resolver(tmp_path, search)
+
+    assert resolver.run([SONG]) == ["https://www.youtube.com/watch?v=Song_Artist"]
+    assert len(search.queries) == 2
+    assert logged == []
+
+
+def test_permanent_error_is_not_retried(tmp_path):
+    search = FakeSearch([DownloadError("ERROR: Unsupported URL: ytsearch5")])
+    resolver, logged = make_resolver(tmp_path, search)
+
+    assert resolver.run([SONG]) == [None]
+    assert len(search.queries) == 1
+    assert logged[0][1] == "red"
+
+
+def test_submit_resolves_on_the_background_loop(tmp_path):
+    search = FakeSearch()
+    resolver, _ = make_resolver(tmp_path, search)
+    resolver.start()
+    try:
+        futures = [resolver.submit(dict(SONG, id=f"t{i}", title=f"Song {i}")) for i in range(3)]
+        urls = [future.result(timeout=5) for future in futures]
+    finally:
+        resolver.stop()
+
+    assert urls == [f"https://www.youtube.com/watch?v=Song_{i}_Artist" for i in range(3)]
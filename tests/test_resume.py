@@ -0,0 +1,92 @@
+import os
+import time
+
+from console import ConsoleLogger
+from downloader import SpotifyDownloader
+from journal import remove_partials
+from sync import SyncManifest
+
+
+class FakeSpotify:
+    def __init__(self, count):
+        self.count = count
+
+    def get_playlist(self, playlist_id, fields=None):
+        return {"name": "Mix", "snapshot_id": "s1"}
+
+    def iter_playlist_tracks(self, playlist_id, market=None):
+        yield [
+            {"id": f"t{i}", "name": f"S{i}", "artists": [{"name": "Artist"}], "duration_ms": 180000}
+            for i in range(self.count)
+        ]
+
+
+def test_resume_with_sync_and_prune_keeps_finished_tracks(tmp_path, monkeypatch):
+    # An interrupted job finished t0 and t1; resuming it with sync + prune must
+    # keep their files and only schedule the rest.
+    monkeypatch.chdir(tmp_path)
+    downloader = SpotifyDownloader(ConsoleLogger(quiet=True), cache_dir=str(tmp_path / "cache"))
+    os.makedirs("Mix")
+    manifest = SyncManifest("Mix")
+    downloader.journal.start_job("p1", "Mix", "Mix")
+    for i in range(2):
+        path = os.path.join("Mix", f"S{i}.mp3")
+        with open(path, "wb") as f:
+            f.write(b"audio")
+        manifest.record(f"t{i}", path)
+        downloader.journal.record("p1", f"t{i}", "done", output=path)
+    manifest.save()
+
+    job = downloader.fetch_job(FakeSpotify(4), "p1", {"sync": True, "prune": True})
+
+    assert [song["id"] for song in job.tracks] == ["t2", "t3"]
+    assert [song["id"] for song in job.all_tracks] == ["t0", "t1", "t2", "t3"]
+    assert os.path.isfile(os.path.join("Mix", "S0.mp3"))
+    assert os.path.isfile(os.path.join("Mix", "S1.mp3"))
+    assert set(job.manifest.tracks) == {"t0", "t1"}
+
+
+def test_prune_removes_tracks_dropped_from_the_playlist(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    downloader = SpotifyDownloader(ConsoleLogger(quiet=True), cache_dir=str(tmp_path / "cache"))
+    os.makedirs("Mix")
+    manifest = SyncManifest("Mix")
+    for i in (0, 5):
+        path = os.path.join("Mix", f"S{i}.mp3")
+        with open(path, "wb") as f:
+            f.write(b"audio")
+        manifest.record(f"t{i}", path)
+    manifest.save()
+
+    job = downloader.fetch_job(FakeSpotify(2), "p1", {"sync": True, "prune": True})
+
+    assert [song["id"] for song in job.tracks] == ["t1"]
+    assert os.path.isfile(os.path.join("Mix", "S0.mp3"))
+    assert not os.path.exists(os.path.join("Mix", "S5.mp3"))
+
+
+def test_remove_partials_sweeps_store_objects(tmp_path):
+    objects = tmp_path / "objects" / "ab"
+    objects.mkdir(parents=True)
+    for name in ("abc.webm.part", "abc.converting.webm", "abc.mp3"):
+        (objects / name).write_bytes(b"x")
+
+    assert remove_partials(str(tmp_path / "objects")) == []
+    removed = remove_partials(str(tmp_path / "objects"), recursive=True)
+
+    assert sorted(os.path.basename(path) for path in removed) == ["abc.converting.webm", "abc.webm.part"]
+    assert os.listdir(objects) == ["abc.mp3"]
+
+
+def test_remove_partials_keeps_recent_files_within_the_grace_period(tmp_path):
+    objects = tmp_path / "objects" / "ab"
+    objects.mkdir(parents=True)
+    for name in ("old.webm.part", "live.webm.part"):
+        (objects / name).write_bytes(b"x")
+    stale = time.time() - 7200
+    os.utime(objects / "old.webm.part", (stale, stale))
+
+    removed = remove_partials(str(tmp_path / "objects"), recursive=True, older_than=3600)
+
+    assert [os.path.basename(path) for path in removed] == ["old.webm.part"]
+    assert os.listdir(objects) == ["live.webm.part"]
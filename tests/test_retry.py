@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+import requests
+from yt_dlp.utils import DownloadError, ExtractorError
+
+import retry
+from retry import PERMANENT, THROTTLED, TRANSIENT, RetryPolicy, RetryQueue, classify
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+@pytest.mark.parametrize("message, kind", [
+    ("ERROR: [youtube] abc: Video unavailable", PERMANENT),
+    ("ERROR: [youtube] abc: Private video", PERMANENT),
+    ("ERROR: abc: Requested format is not available", PERMANENT),
+    ("HTTP Error 404: Not Found", PERMANENT),
+    ("HTTP Error 429: Too Many Requests", THROTTLED),
+    ("Sign in to confirm you're not a bot", THROTTLED),
+    ("Unable to download webpage: The read operation timed out", TRANSIENT),
+    ("HTTP Error 503: Service Unavailable", TRANSIENT),
+    ("Connection reset by peer", TRANSIENT),
+])
+def test_classify_by_message(message, kind):
+    assert classify(DownloadError(message)) == kind
+
+
+def test_permanent_markers_take_precedence():
+    # "Sign in to confirm your age" is an age gate, not a bot check.
+    assert classify(DownloadError("Sign in to confirm your age")) == PERMANENT
+
+
+def test_classify_by_status_and_type():
+    assert classify(http_error(429)) == THROTTLED
+    assert classify(http_error(502)) == TRANSIENT
+    assert classify(http_error(403)) == PERMANENT
+    assert classify(requests.ConnectionError("down")) == TRANSIENT
+    assert classify(TimeoutError()) == TRANSIENT
+    # Unrecognised yt-dlp download errors are worth another try; anything else
+    # (an extractor bug, a full disk) is not.
+    assert classify(DownloadError("something odd")) == TRANSIENT
+    assert classify(ExtractorError("something odd")) == PERMANENT
+    assert classify(OSError(28, "No space left on device")) == PERMANENT
+
+
+def test_policy_retries_until_max_attempts_unless_permanent():
+    policy = RetryPolicy(max_attempts=3)
+
+    assert policy.should_retry(TRANSIENT, 1)
+    assert policy.should_retry(THROTTLED, 2)
+    assert not policy.should_retry(TRANSIENT, 3)
+    assert not policy.should_retry(PERMANENT, 1)
+
+
+def test_policy_backoff_is_jittered_exponential_and_capped(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: bounds.append((low, high)) or high)
+    policy = RetryPolicy(base_delay=2.0, max_delay=20.0, throttle_delay=30.0)
+
+    delays = [policy.delay(TRANSIENT, attempt) for attempt in (1, 2, 3, 4, 5)]
+
+    assert delays == [2.0, 4.0, 8.0, 16.0, 20.0]
+    assert all(low == 1.0 for low, _ in bounds)
+    assert policy.delay(THROTTLED, 1) == 20.0
+    assert bounds[-1] == (15.0, 20.0)
+
+
+def test_retry_queue_hands_back_due_tasks_in_order():
+    queue = RetryQueue()
+    done = threading.Event()
+    order = []
+
+    def callback(name):
+        order.append(name)
+        if len(order) == 3:
+            done.set()
+
+    queue.schedule(0, lambda: callback("a"))
+    queue.schedule(0, lambda: callback("b"))
+    queue.schedule(0, lambda: callback("c"))
+    queue.start()
+    try:
+        assert done.wait(5)
+    finally:
+        queue.shutdown()
+
+    assert order == ["a", "b", "c"]
+    assert len(queue) == 0
+
+
+def test_retry_queue_releases_cancelled_tasks_early():
+    queue = RetryQueue()
+    cancelled = threading.Event()
+    released = threading.Event()
+    queue.start()
+    try:
+        queue.schedule(3600, released.set, cancelled.is_set)
+        queue.schedule(3600, lambda: None)
+        cancelled.set()
+        assert released.wait(5)
+    finally:
+        queue.shutdown()
+
+    assert len(queue) == 1
@@ -0,0 +1,86 @@
+import queue
+
+import scheduler
+from scheduler import Scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingController:
+    ceiling = 1
+    limit = 1
+
+    def __init__(self):
+        self.latencies = []
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+    def record(self, latency):
+        self.latencies.append(latency)
+
+
+class FullQueue(queue.Queue):
+    # Stands in for a downstream queue that only takes the task after the
+    # producer has waited `wait` seconds for room.
+    def __init__(self, clock, wait):
+        super().__init__()
+        self.clock = clock
+        self.wait = wait
+
+    def put(self, item, block=True, timeout=None):
+        self.clock.now += self.wait
+        super().put(item, block, timeout)
+
+
+def test_backpressure_is_not_recorded_as_stage_latency(monkeypatch):
+    # The upstream task works for 2s, then waits 10s for room downstream; its
+    # recorded latency must not include that wait.
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    downstream = Scheduler(name="downstream")
+    downstream.tasks = FullQueue(clock, wait=10.0)
+    controller = RecordingController()
+    upstream = Scheduler(name="upstream", controller=controller)
+
+    def work():
+        clock.now += 2.0
+        downstream.submit(lambda: None)
+
+    upstream.start()
+    upstream.submit(work)
+    upstream.shutdown()
+
+    assert controller.latencies == [2.0]
+    assert downstream.tasks.qsize() == 1
+    assert upstream.processed == 1
+
+
+def test_latency_is_recorded_once_per_task(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    controller = RecordingController()
+    stage = Scheduler(name="stage", controller=controller)
+    other = Scheduler(name="other")
+
+    def work():
+        clock.now += 1.0
+        other.submit(lambda: None)
+        clock.now += 5.0
+        other.submit(lambda: None)
+
+    stage.start()
+    stage.submit(work)
+    stage.submit(lambda: None)
+    stage.shutdown()
+
+    assert controller.latencies == [1.0, 0.0]
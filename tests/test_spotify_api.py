@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+import spotify_api
+from spotify_api import SpotifyClient
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class PagedSession:
+    # Serves a listing of `total` numbered items. The page at offset 100 is held
+    # back until the page after it has been served, so pages finish out of order.
+    def __init__(self, total):
+        self.total = total
+        self.offsets = []
+        self.lock = threading.Lock()
+        self.second_served = threading.Event()
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        offset, limit = params["offset"], params["limit"]
+        with self.lock:
+            self.offsets.append(offset)
+        if offset == limit:
+            assert self.second_served.wait(5)
+        elif offset == 2 * limit:
+            self.second_served.set()
+        items = list(range(offset, min(offset + limit, self.total)))
+        return FakeResponse(data={"items": items, "total": self.total})
+
+
+class ScriptedSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def make_client(session, max_workers=4):
+    client = SpotifyClient(access_token="token", max_workers=max_workers)
+    client.close()
+    client.session = session
+    return client
+
+
+def test_iter_pages_yields_pages_in_offset_order():
+    session = PagedSession(total=450)
+    client = make_client(session)
+
+    pages = list(client.iter_pages("playlists/abc/tracks"))
+
+    assert [page[0] for page in pages] == [0, 100, 200, 300, 400]
+    assert [item for page in pages for item in page] == list(range(450))
+    assert sorted(session.offsets) == [0, 100, 200, 300, 400]
+
+
+def test_iter_pages_applies_transform_per_page():
+    client = make_client(PagedSession(total=120), max_workers=2)
+
+    pages = list(client.iter_pages("albums/abc/tracks", page_size=50, transform=len))
+
+    assert pages == [50, 50, 20]
+
+
+def test_get_waits_for_retry_after_on_429(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(spotify_api.time, "sleep", sleeps.append)
+    session = ScriptedSession([
+        FakeResponse(429, headers={"Retry-After": "3"}),
+        FakeResponse(429),
+        FakeResponse(data={"items": [], "total": 0}),
+    ])
+    client = make_client(session)
+
+    assert client.get("playlists/abc") == {"items": [], "total": 0}
+    # Retry-After when the server sends one, exponential backoff otherwise.
+    assert sleeps == [3.0, 1.0]
+    assert session.calls == 3
+
+
+def test_get_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(spotify_api.time, "sleep", lambda delay: None)
+    session = ScriptedSession([FakeResponse(429)] * (spotify_api.MAX_RETRIES + 1))
+    client = make_client(session)
+
+    with pytest.raises(RuntimeError, match="HTTP 429"):
+        client.get("playlists/abc")
+    assert session.calls == spotify_api.MAX_RETRIES + 1
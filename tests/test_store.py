@@ -0,0 +1,17 @@
+import os
+
+from store import AudioStore
+
+
+def test_variants_download_to_separate_objects(tmp_path):
+    store = AudioStore(str(tmp_path / "library"))
+    info = {"id": "dQw4w9WgXcQ", "ext": "webm"}
+
+    keep = store.output_template("keep") % info
+    mp3 = store.output_template("mp3") % info
+    auto = store.output_template("auto:opus,aac") % info
+
+    assert len({keep, mp3, auto}) == 3
+    for path in (keep, mp3, auto):
+        assert os.path.dirname(os.path.dirname(os.path.dirname(path))) == store.objects_dir
+        assert path.endswith(os.path.join("dQ", "dQw4w9WgXcQ.webm"))
@@ -0,0 +1,42 @@
+import yt_dlp
+
+from ydl_pool import YoutubeDLPool
+
+
+class FakeYDL:
+    def __init__(self, params):
+        self.params = params
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_output_template_changes_reuse_the_instance():
+    pool = YoutubeDLPool(factory=FakeYDL)
+    first = pool.get("download", {"format": "bestaudio", "outtmpl": "/a/%(title)s.%(ext)s"})
+    second = pool.get("download", {"format": "bestaudio", "outtmpl": "/b/%(title)s.%(ext)s"})
+
+    assert second is first
+    assert first.params["outtmpl"] == "/b/%(title)s.%(ext)s"
+    assert pool.instances == [first]
+
+
+def test_other_option_changes_rebuild_the_instance():
+    pool = YoutubeDLPool(factory=FakeYDL)
+    first = pool.get("download", {"format": "bestaudio", "outtmpl": "/a/%(title)s.%(ext)s"})
+    second = pool.get("download", {"format": "bestaudio[acodec=opus]", "outtmpl": "/a/%(title)s.%(ext)s"})
+
+    assert second is not first
+    assert first.closed
+    assert pool.instances == [second]
+
+
+def test_output_template_applies_to_youtube_dl():
+    pool = YoutubeDLPool()
+    pool.get("download", {"quiet": True, "outtmpl": "/a/%(id)s.%(ext)s"})
+    ydl = pool.get("download", {"quiet": True, "outtmpl": "/b/%(id)s.%(ext)s"})
+
+    assert isinstance(ydl, yt_dlp.YoutubeDL)
+    assert ydl.prepare_filename({"id": "abc", "ext": "webm"}) == "/b/abc.webm"
+    pool.close_all()
@@ -0,0 +1,204 @@
+import os
+import queue
+import time
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, QTimer
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import QAbstractItemView, QHeaderView, QTableView
+
+COLUMNS = ("Track", "State", "Attempts", "Size", "Speed", "File")
+STATE_COLORS = {
+    "queued": "gray",
+    "searching": "#5cb3ff",
+    "downloading": "#ffca4e",
+    "transcoding": "#ff6de3",
+    "retrying": "yellow",
+    "done": "#4eff6d",
+    "failed": "red",
+    "skipped": "gray",
+}
+# Events handled per timer tick; the rest wait for the next tick so a burst
+# never blocks the GUI thread for long.
+MAX_EVENTS_PER_TICK = 20000
+
+
+def format_size(count):
+    if not count:
+        return ""
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+
+class TrackRow:
+    __slots__ = ("key", "title", "state", "attempts", "bytes", "started", "finished", "output", "error")
+
+    def __init__(self, key, title):
+        self.key = key
+        self.title = title
+        self.state = "queued"
+        self.attempts = 1
+        self.bytes = 0
+        self.started = None
+        self.finished = None
+        self.output = ""
+        self.error = ""
+
+    def speed(self):
+        # Average since the download started, frozen once the track finishes.
+        if not self.started or not self.bytes:
+            return 0.0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+
+class TrackTableModel(QAbstractTableModel):
+    # One row per track, fed in batches by TrackFeed. Rows are plain objects in
+    # a list plus a key -> row index, and every batch ends in one insert and one
+    # dataChanged for the rows it touched, so the view only repaints what is
+    # on screen.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.index_of = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return row.title
+            if column == 1:
+                return row.state
+            if column == 2:
+                return str(row.attempts)
+            if column == 3:
+                return format_size(row.bytes)
+            if column == 4:
+                speed = row.speed()
+                return f"{format_size(speed)}/s" if speed else ""
+            return os.path.basename(row.output)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            if column == 1 and row.error:
+                return row.error
+            if column == 5 and row.output:
+                return row.output
+        if role == Qt.ItemDataRole.ForegroundRole and column == 1:
+            return QColor(STATE_COLORS.get(row.state, "white"))
+        if role == Qt.ItemDataRole.TextAlignmentRole and column in (2, 3, 4):
+            return int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        return None
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.index_of = {}
+        self.endResetModel()
+
+    def apply(self, events):
+        new_rows = []
+        changed = set()
+        for event in events:
+            key = event.get("track")
+            if key is None:
+                continue
+            row_index = self.index_of.get(key)
+            if row_index is None:
+                row = TrackRow(key, event.get("query") or key)
+                self.index_of[key] = len(self.rows) + len(new_rows)
+                new_rows.append(row)
+            elif row_index < len(self.rows):
+                row = self.rows[row_index]
+                changed.add(row_index)
+            else:
+                row = new_rows[row_index - len(self.rows)]
+            self.update_row(row, event)
+
+        if new_rows:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_rows) - 1)
+            self.rows.extend(new_rows)
+            self.endInsertRows()
+        if changed:
+            self.dataChanged.emit(self.index(min(changed), 0), self.index(max(changed), len(COLUMNS) - 1))
+
+    def update_row(self, row, event):
+        kind = event["type"]
+        if kind == "bytes":
+            row.bytes += event["bytes"]
+        elif kind == "state":
+            state = event["state"]
+            row.state = state
+            if event.get("query"):
+                row.title = event["query"]
+            if state == "downloading" and row.started is None:
+                row.started = event["time"]
+            elif state == "retrying":
+                row.attempts = event.get("attempt", row.attempts + 1)
+                row.error = event.get("error", "")
+            elif state in ("done", "failed", "skipped"):
+                row.finished = event["time"]
+                row.output = event.get("output") or row.output
+                row.error = event.get("error", row.error)
+
+
+class TrackFeed(QObject):
+    # Drains a metrics subscription on the GUI thread. Workers only put events
+    # on the queue; the model sees them in one batch per tick.
+    def __init__(self, metrics, model, interval_ms=100, maxsize=200000, parent=None):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.model = model
+        self.events = metrics.subscribe(maxsize=maxsize)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(interval_ms)
+
+    def flush(self):
+        events = []
+        try:
+            while len(events) < MAX_EVENTS_PER_TICK:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        if events:
+            self.model.apply(events)
+
+    def close(self):
+        self.timer.stop()
+        self.metrics.unsubscribe(self.events)
+
+
+def make_track_view(model, parent=None):
+    view = QTableView(parent)
+    view.setModel(model)
+    view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+    view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+    view.setWordWrap(False)
+    view.setAlternatingRowColors(True)
+    # Fixed row heights and column widths mean the view never measures rows
+    # that are off screen.
+    vertical = view.verticalHeader()
+    vertical.setVisible(False)
+    vertical.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+    vertical.setDefaultSectionSize(22)
+    horizontal = view.horizontalHeader()
+    horizontal.setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+    horizontal.setStretchLastSection(True)
+    for column, width in enumerate((280, 90, 70, 80, 90)):
+        view.setColumnWidth(column, width)
+    return view
@@ -0,0 +1,321 @@
+import os
+import re
+import time
+import threading
+import subprocess
+from functools import lru_cache
+
+STREAMABLE_PROTOCOLS = ("http", "https")
+READ_SIZE = 256 * 1024
+MP3_ARGS = ("-codec:a", "libmp3lame", "-b:a", "192k")
+COPY_ARGS = ("-codec:a", "copy")
+# MP3 encoders in order of preference; builds without libmp3lame may have shine.
+MP3_ENCODERS = ("libmp3lame", "libshine")
+PROBE_BATCH_SIZE = 32
+
+# Output policies:
+#   mp3   - always transcode to MP3 (the default)
+#   keep  - keep the downloaded file as-is
+#   remux - copy the audio stream into a plain audio container, never re-encode
+#   auto  - remux when the source codec is in the allowed set, otherwise MP3
+OUTPUT_POLICIES = ("mp3", "keep", "remux", "auto")
+DEFAULT_ALLOWED_CODECS = ("opus", "aac", "mp3")
+
+# codec name -> (acodec prefix reported by yt-dlp, file extension, ffmpeg muxer)
+CODECS = {
+    "opus": ("opus", "opus", "opus"),
+    "aac": ("mp4a", "m4a", "ipod"),
+    "mp3": ("mp3", "mp3", "mp3"),
+    "vorbis": ("vorbis", "ogg", "ogg"),
+    "flac": ("flac", "flac", "flac"),
+}
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def codec_name(acodec):
+    for name, (prefix, _, _) in CODECS.items():
+        if (acodec or "").startswith(prefix):
+            return name
+    return None
+
+
+def format_selector(policy="mp3", allowed_codecs=DEFAULT_ALLOWED_CODECS):
+    # Under "auto", prefer streams that will not need a re-encode.
+    if policy == "auto":
+        preferred = [f"bestaudio[acodec^={CODECS[c][0]}]" for c in allowed_codecs if c in CODECS]
+        return "/".join(preferred + ["bestaudio/best"])
+    return "bestaudio/best"
+
+
+def output_action(acodec, policy="mp3", allowed_codecs=DEFAULT_ALLOWED_CODECS):
+    if policy in ("keep", "remux"):
+        return policy
+    if policy == "auto" and codec_name(acodec) in allowed_codecs:
+        return "remux"
+    return "transcode"
+
+
+def can_stream(info):
+    # Single-file HTTP(S) formats can be piped straight into ffmpeg; HLS/DASH
+    # fragments go through the regular yt-dlp download.
+    return (
+        info.get("protocol") in STREAMABLE_PROTOCOLS
+        and bool(info.get("url"))
+        and not info.get("fragments")
+    )
+
+
+def iter_http_chunks(urlopen, make_request, info):
+    # Yields the selected format's bytes. When the extractor asks for ranged
+    # requests (YouTube throttles long single responses) the file is fetched in
+    # http_chunk_size pieces.
+    url = info["url"]
+    headers = dict(info.get("http_headers") or {})
+    range_size = (info.get("downloader_options") or {}).get("http_chunk_size")
+
+    if not range_size:
+        response = urlopen(make_request(url, headers=headers))
+        try:
+            for chunk in iter(lambda: response.read(READ_SIZE), b""):
+                yield chunk
+        finally:
+            response.close()
+        return
+
+    start = 0
+    while True:
+        range_headers = dict(headers, Range=f"bytes={start}-{start + range_size - 1}")
+        response = urlopen(make_request(url, headers=range_headers))
+        received = 0
+        try:
+            for chunk in iter(lambda: response.read(READ_SIZE), b""):
+                received += len(chunk)
+                yield chunk
+        finally:
+            response.close()
+        if received < range_size:
+            return
+        start += received
+
+
+def write_stream(chunks, output_path):
+    tmp_path = output_path + ".part"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def stream_transcode(chunks, output_path, ffmpeg="ffmpeg", codec_args=MP3_ARGS, output_format="mp3", threads=None):
+    # Pipes the source bytes into ffmpeg's stdin so only the final file touches
+    # the disk. The output is written next to the target and renamed into place.
+    tmp_path = output_path + ".part"
+    thread_args = ("-threads", str(threads)) if threads else ()
+    cmd = [
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-y", *thread_args,
+        "-i", "pipe:0", "-vn", *codec_args, *thread_args, "-f", output_format, tmp_path,
+    ]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for chunk in chunks:
+            proc.stdin.write(chunk)
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    stderr = proc.stderr.read().decode("utf-8", "replace").strip()
+    if proc.wait() != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise TranscodeError(stderr or f"ffmpeg exited with code {proc.returncode}")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def file_transcode(source, output_path, ffmpeg="ffmpeg", codec_args=MP3_ARGS, output_format="mp3", threads=None):
+    tmp_path = output_path + ".part"
+    thread_args = ("-threads", str(threads)) if threads else ()
+    cmd = [
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-y", "-nostdin", *thread_args,
+        "-i", source, "-vn", *codec_args, *thread_args, "-f", output_format, tmp_path,
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        stderr = result.stderr.decode("utf-8", "replace").strip()
+        raise TranscodeError(stderr or f"ffmpeg exited with code {result.returncode}")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+@lru_cache(maxsize=None)
+def probe_ffmpeg(ffmpeg):
+    # Runs once per executable and session. Returns {"path", "version",
+    # "encoders"} where encoders maps each encoder name to its flag column
+    # from `ffmpeg -encoders` ("A....D"; F/S mark frame/slice threading), or
+    # None when the executable does not run.
+    try:
+        version = subprocess.run([ffmpeg, "-hide_banner", "-version"], capture_output=True, text=True,
+                                 timeout=10, check=True).stdout
+        listing = subprocess.run([ffmpeg, "-hide_banner", "-encoders"], capture_output=True, text=True,
+                                 timeout=10, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.match(r"\S+ version (\S+)", version)
+    encoders = {}
+    lines = listing.splitlines()
+    start = lines.index(" ------") + 1 if " ------" in lines else len(lines)
+    for line in lines[start:]:
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6:
+            encoders[parts[1]] = parts[0]
+    return {"path": ffmpeg, "version": match.group(1) if match else None, "encoders": encoders}
+
+
+def parse_probe_output(output):
+    # {input index: {"codec", "duration"}} from the input summary ffmpeg prints
+    # for every -i it opens.
+    results = {}
+    current = None
+    for line in output.splitlines():
+        match = re.match(r"Input #(\d+),", line)
+        if match:
+            current = results.setdefault(int(match.group(1)), {"codec": None, "duration": None})
+            continue
+        if current is None:
+            continue
+        match = re.match(r"\s+Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", line)
+        if match:
+            hours, minutes, seconds = match.groups()
+            current["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+            continue
+        match = re.match(r"\s+Stream #\d+:\d+\S*: Audio: (\w+)", line)
+        if match and current["codec"] is None:
+            current["codec"] = match.group(1)
+    return results
+
+
+def probe_audio_files(paths, ffmpeg="ffmpeg", batch_size=PROBE_BATCH_SIZE):
+    # {path: {"codec", "duration"} or None}. ffprobe takes one input per run,
+    # but ffmpeg opens any number of -i inputs and describes each before it
+    # complains about the missing output, so one process covers a whole batch.
+    # A file ffmpeg cannot open stops the run there; it is recorded as None
+    # and the rest of the batch is probed again.
+    results = {}
+    pending = list(dict.fromkeys(paths))
+    while pending:
+        batch = pending[:batch_size]
+        cmd = [ffmpeg, "-hide_banner", "-nostdin"]
+        for path in batch:
+            cmd += ["-i", path]
+        try:
+            output = subprocess.run(cmd, capture_output=True, text=True, errors="replace", timeout=60).stderr
+        except (OSError, subprocess.SubprocessError):
+            results.update((path, None) for path in pending)
+            return results
+        parsed = parse_probe_output(output)
+        opened = 0
+        while opened in parsed and opened < len(batch):
+            results[batch[opened]] = parsed[opened]
+            opened += 1
+        if opened < len(batch):
+            results[batch[opened]] = None
+            opened += 1
+        pending = pending[opened:]
+    return results
+
+
+class AudioProber:
+    # Coalesces probe() calls made around the same time by different workers
+    # into one probe_audio_files() run. The first caller waits `linger` seconds
+    # for others to join, probes the lot and hands out the results.
+    def __init__(self, ffmpeg, linger=0.02, batch_size=PROBE_BATCH_SIZE):
+        self.ffmpeg = ffmpeg
+        self.linger = linger
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+
+    def probe(self, path):
+        slot = {"done": threading.Event(), "result": None}
+        with self.lock:
+            self.pending.append((path, slot))
+            leader = len(self.pending) == 1
+        if leader:
+            time.sleep(self.linger)
+            with self.lock:
+                batch, self.pending = self.pending, []
+            results = {}
+            try:
+                results = probe_audio_files([p for p, _ in batch], self.ffmpeg, self.batch_size)
+            finally:
+                for p, waiting in batch:
+                    waiting["result"] = results.get(p)
+                    waiting["done"].set()
+        slot["done"].wait()
+        return slot["result"]
+
+
+class TranscodePool:
+    # Runs ffmpeg jobs for the whole session against one probed executable.
+    # At most `workers` file transcodes run at once (one per core by default),
+    # and each job gets `-threads` so that workers x threads stays within the
+    # cores: encoders ffmpeg can thread get cores // workers, the rest (most
+    # audio encoders, and stream copies) one thread.
+    def __init__(self, ffmpeg, workers=None, capabilities=None):
+        self.ffmpeg = ffmpeg
+        self.capabilities = capabilities or probe_ffmpeg(ffmpeg)
+        if self.capabilities is None:
+            raise TranscodeError(f"ffmpeg does not run: {ffmpeg}")
+        self.cores = os.cpu_count() or 2
+        self.workers = max(1, min(workers or self.cores, self.cores))
+        self.slots = threading.BoundedSemaphore(self.workers)
+        self.prober = AudioProber(ffmpeg)
+
+    def mp3_args(self):
+        encoders = self.capabilities["encoders"]
+        encoder = next((name for name in MP3_ENCODERS if name in encoders), None)
+        if encoder is None:
+            raise TranscodeError(f"ffmpeg {self.capabilities['version']} has no MP3 encoder")
+        return ("-codec:a", encoder, "-b:a", "192k")
+
+    def threads_for(self, codec_args):
+        encoder = codec_args[codec_args.index("-codec:a") + 1] if "-codec:a" in codec_args else None
+        flags = self.capabilities["encoders"].get(encoder, "")
+        if len(flags) == 6 and (flags[1] == "F" or flags[2] == "S"):
+            return max(1, self.cores // self.workers)
+        return 1
+
+    def transcode(self, source, output_path, codec_args=None, output_format="mp3"):
+        codec_args = codec_args or self.mp3_args()
+        with self.slots:
+            return file_transcode(source, output_path, self.ffmpeg, codec_args, output_format,
+                                  self.threads_for(codec_args))
+
+    def stream(self, chunks, output_path, codec_args=None, output_format="mp3"):
+        # Not counted against the slots: a streaming ffmpeg mostly waits on the
+        # network, and holding a slot for it would starve file transcodes.
+        codec_args = codec_args or self.mp3_args()
+        return stream_transcode(chunks, output_path, self.ffmpeg, codec_args, output_format,
+                                self.threads_for(codec_args))
@@ -1,14 +1,11 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QTextEdit,
-    QFileDialog, QTabWidget, QScrollArea, QProgressBar, QCheckBox, QMessageBox, QHBoxLayout
+    QFileDialog, QTabWidget, QScrollArea, QProgressBar, QCheckBox, QMessageBox, QHBoxLayout, QComboBox, QSplitter
 )
-from PyQt6.QtCore import QThread, pyqtSignal, QObject, QSettings
-from datetime import datetime
-from downloader import SpotifyDownloader
+from PyQt6.QtCore import QThread, pyqtSignal, QObject, QSettings, Qt
 from utils import get_styles, get_tab_styles, get_help_text
-from scrapper import SpotifyScrapper
-import ffmpeg_manager
-from export import Exporter
+from ui_log import FileLog, LogView, ProgressCoalescer
+from track_table import TrackFeed, TrackTableModel, make_track_view
 import glob
 import os
 
@@ -53,6 +50,8 @@ class ExportWorker(QThread):
 
 
 class SpotifyDownloaderUI(QWidget):
+    download_done = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.logger = Logger()
@@ -105,6 +104,19 @@ class SpotifyDownloaderUI(QWidget):
         self.use_bundled_ffmpeg_checkbox.toggled.connect(toggle_ffmpeg_widgets)
         toggle_ffmpeg_widgets(self.use_bundled_ffmpeg_checkbox.isChecked())
 
+        output_label = QLabel("OUTPUT FORMAT:")
+        output_label.setStyleSheet("font-weight: bold; margin-top: 8px; margin-bottom: 2px;")
+        config_layout.addWidget(output_label)
+        self.output_format_combo = QComboBox()
+        self.output_format_combo.addItem("MP3 (always transcode)", "mp3")
+        self.output_format_combo.addItem("Transcode only if not Opus/AAC/MP3", "auto")
+        self.output_format_combo.addItem("Remux without re-encoding", "remux")
+        self.output_format_combo.addItem("Keep original file", "keep")
+        config_layout.addWidget(self.output_format_combo)
+
+        self.streaming_checkbox = QCheckBox("Stream audio straight into ffmpeg (no temporary files)")
+        config_layout.addWidget(self.streaming_checkbox)
+
         check_ffmpeg_btn = QPushButton("Verify / Download ffmpeg")
         check_ffmpeg_btn.clicked.connect(self.check_or_download_ffmpeg)
         config_layout.addWidget(check_ffmpeg_btn)
@@ -112,7 +124,10 @@ class SpotifyDownloaderUI(QWidget):
         self.load_settings()
 
         # ================= EXPORT TAB =================
-        self.exporter = Exporter(self.logger)
+        # The engines (and yt_dlp/requests behind them) are loaded on first
+        # use, so the window shows without waiting for them.
+        self._exporter = None
+        self._downloader = None
         export_tab = QWidget()
         export_layout = QVBoxLayout()
 
@@ -138,12 +153,23 @@ class SpotifyDownloaderUI(QWidget):
         playlist_tab = QWidget()
         playlist_layout = QVBoxLayout()
 
-        self.playlist_link_input = self.create_input(playlist_layout, "Playlist URL:")
+        self.playlist_link_input = self.create_input(playlist_layout, "Playlist URL (separate several with spaces):")
+
+        sync_layout = QHBoxLayout()
+        self.sync_checkbox = QCheckBox("Sync (only download new tracks)")
+        self.prune_checkbox = QCheckBox("Remove tracks deleted from the playlist")
+        sync_layout.addWidget(self.sync_checkbox)
+        sync_layout.addWidget(self.prune_checkbox)
+        playlist_layout.addLayout(sync_layout)
 
         download_btn = QPushButton("Start Download")
         download_btn.clicked.connect(self.start_download)
         playlist_layout.addWidget(download_btn)
 
+        cancel_btn = QPushButton("Cancel Download")
+        cancel_btn.clicked.connect(self.downloader_cancel)
+        playlist_layout.addWidget(cancel_btn)
+
         scrap_layout = QHBoxLayout()
         scrap_json_btn = QPushButton("Scrap JSON")
         scrap_csv_btn = QPushButton("Scrap CSV")
@@ -157,9 +183,21 @@ class SpotifyDownloaderUI(QWidget):
         self.progress_bar.setVisible(False)
         playlist_layout.addWidget(self.progress_bar)
 
+        self.metrics_label = QLabel()
+        playlist_layout.addWidget(self.metrics_label)
+
+        # Per-track status is the main view; the log sits below it.
+        self.track_model = TrackTableModel(self)
+        self.track_feed = None
+        self.track_view = make_track_view(self.track_model)
         self.log_area = QTextEdit()
         self.log_area.setReadOnly(True)
-        playlist_layout.addWidget(self.log_area)
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        splitter.addWidget(self.track_view)
+        splitter.addWidget(self.log_area)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
+        playlist_layout.addWidget(splitter)
         playlist_tab.setLayout(playlist_layout)
 
         # ================= HELP TAB =================
@@ -187,9 +225,29 @@ class SpotifyDownloaderUI(QWidget):
         main_layout.addWidget(self.tabs)
         self.setLayout(main_layout)
 
-        self.downloader = SpotifyDownloader(self.logger)
+        self.file_log = FileLog("debug.log")
+        self.log_view = LogView([self.log_area, self.export_log], self.file_log, parent=self)
+        self.download_progress = ProgressCoalescer(self.update_progress, parent=self)
+        self.download_done.connect(self.download_finished)
         self.logger.log_signal.connect(self.append_log)
 
+    @property
+    def downloader(self):
+        if self._downloader is None:
+            from downloader import SpotifyDownloader
+
+            self._downloader = SpotifyDownloader(self.logger)
+            self.track_feed = TrackFeed(self._downloader.metrics, self.track_model, parent=self)
+        return self._downloader
+
+    @property
+    def exporter(self):
+        if self._exporter is None:
+            from export import Exporter
+
+            self._exporter = Exporter(self.logger)
+        return self._exporter
+
     # ================= UTILIDADES =================
     def create_input(self, layout, label_text, default_value="", echo_mode=QLineEdit.EchoMode.Normal):
         label = QLabel(label_text)
@@ -202,12 +260,7 @@ class SpotifyDownloaderUI(QWidget):
         return line_edit
 
     def append_log(self, message, color="white"):
-        timestamp = datetime.now().strftime("[%H:%M:%S]")
-        formatted = f'<span style="color: gray;">{timestamp}</span> <span style="color: {color};">{message}</span>'
-        self.log_area.append(formatted)
-        self.export_log.append(formatted)
-        with open("debug.log", "a", encoding="utf-8") as log_file:
-            log_file.write(f"{timestamp} {message}\n")
+        self.log_view.append(message, color)
 
     def select_ffmpeg_path(self):
         path, _ = QFileDialog.getOpenFileName(self, "Select FFMPEG", "", "Executable (*.exe)")
@@ -215,9 +268,14 @@ class SpotifyDownloaderUI(QWidget):
             self.ffmpeg_path_input.setText(path)
 
     def check_or_download_ffmpeg(self):
+        import ffmpeg_manager
+
         if ffmpeg_manager.is_ffmpeg_downloaded():
             QMessageBox.information(self, "FFmpeg", f"FFmpeg is already downloaded at:\n{ffmpeg_manager.get_ffmpeg_path()}")
             self.append_log(f"[FFmpeg] Already downloaded at:\n{ffmpeg_manager.get_ffmpeg_path()}", "#ffca4e")
+        elif ffmpeg_manager.get_ffmpeg_path():
+            QMessageBox.information(self, "FFmpeg", f"Using the system FFmpeg at:\n{ffmpeg_manager.get_ffmpeg_path()}")
+            self.append_log(f"[FFmpeg] Using the system FFmpeg at:\n{ffmpeg_manager.get_ffmpeg_path()}", "#ffca4e")
         else:
             self.append_log("[FFmpeg] Not found. Downloading...", "#ffca4e")
             success = ffmpeg_manager.download_ffmpeg()
@@ -236,6 +294,8 @@ class SpotifyDownloaderUI(QWidget):
 
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
+        if not self.downloader.batches:
+            self.track_model.clear()
 
         config = {
             "client_id": self.client_id_input.text().strip(),
@@ -243,16 +303,39 @@ class SpotifyDownloaderUI(QWidget):
             "playlist_url": playlist_url,
             "market": self.market_input.text().strip(),
             "ffmpeg_path": self.ffmpeg_path_input.text().strip(),
+            "streaming": self.streaming_checkbox.isChecked(),
+            "output_format": self.output_format_combo.currentData(),
+            "sync": self.sync_checkbox.isChecked(),
+            "prune": self.prune_checkbox.isChecked(),
         }
 
-        self.downloader.start_download(config, self.update_progress, self.download_finished)
+        playlist_urls = playlist_url.replace(",", " ").split()
+        if len(playlist_urls) > 1:
+            self.downloader.start_batch(config, playlist_urls, self.download_progress.update, self.download_done.emit)
+        else:
+            self.downloader.start_download(config, self.download_progress.update, self.download_done.emit)
+
+    def downloader_cancel(self):
+        if self._downloader is not None:
+            self._downloader.cancel()
 
     def update_progress(self, completed, total):
         if total > 0:
             percentage = int((completed / total) * 100)
             self.progress_bar.setValue(percentage)
+        self.update_metrics_label()
+
+    def update_metrics_label(self):
+        snapshot = self.downloader.metrics.snapshot()
+        states = snapshot["states"]
+        self.metrics_label.setText(
+            f"Done {states['done']} · Failed {states['failed']} · Skipped {states['skipped']} · "
+            f"Searching {states['searching']} · Downloading {states['downloading']} · Transcoding {states['transcoding']} · "
+            f"{snapshot['bytes_per_second'] / 1024 / 1024:.2f} MB/s"
+        )
 
     def download_finished(self):
+        self.download_progress.flush()
         self.append_log("[Finish] Playlist download completed.", "#00ffaa")
         self.progress_bar.setVisible(False)
 
@@ -269,6 +352,8 @@ class SpotifyDownloaderUI(QWidget):
             "market": self.market_input.text().strip(),
         }
 
+        from scrapper import SpotifyScrapper
+
         scrapper = SpotifyScrapper(self.logger)
         scrapper.start_scrap(config, save_as=save_as)
 
@@ -309,13 +394,22 @@ class SpotifyDownloaderUI(QWidget):
         self.client_secret_input.setText(self.settings.value("client_secret", ""))
         self.market_input.setText(self.settings.value("market", "ES"))
         self.ffmpeg_path_input.setText(self.settings.value("ffmpeg_path", ""))
+        self.streaming_checkbox.setChecked(self.settings.value("streaming", False, type=bool))
+        index = self.output_format_combo.findData(self.settings.value("output_format", "mp3"))
+        self.output_format_combo.setCurrentIndex(max(index, 0))
 
     def save_settings(self):
         self.settings.setValue("client_id", self.client_id_input.text())
         self.settings.setValue("client_secret", self.client_secret_input.text())
         self.settings.setValue("market", self.market_input.text())
         self.settings.setValue("ffmpeg_path", self.ffmpeg_path_input.text())
+        self.settings.setValue("streaming", self.streaming_checkbox.isChecked())
+        self.settings.setValue("output_format", self.output_format_combo.currentData())
 
     def closeEvent(self, event):
         self.save_settings()
+        if self.track_feed is not None:
+            self.track_feed.close()
+        self.log_view.flush()
+        self.file_log.close()
         event.accept()
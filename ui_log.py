@@ -0,0 +1,99 @@
+import html
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+from PyQt6.QtCore import QObject, QTimer
+from PyQt6.QtGui import QTextCursor
+
+
+class FileLog:
+    # debug.log is written by a QueueListener thread through one buffered,
+    # rotating handler instead of reopening the file for every message.
+    def __init__(self, path="debug.log", max_bytes=5 * 1024 * 1024, backup_count=3):
+        self.queue = SimpleQueue()
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.listener = QueueListener(self.queue, handler)
+        self.listener.start()
+        self.logger = logging.getLogger(f"spotify_downloader.file.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(QueueHandler(self.queue))
+
+    def write(self, line):
+        self.logger.info(line)
+
+    def close(self):
+        self.listener.stop()
+
+
+class LogView(QObject):
+    # Collects log lines from any thread and appends them to the widgets in one
+    # batch per timer tick. Each widget keeps at most `max_lines` blocks.
+    def __init__(self, widgets, file_log=None, interval_ms=100, max_lines=5000, parent=None):
+        super().__init__(parent)
+        self.widgets = widgets
+        self.file_log = file_log
+        self.pending = deque(maxlen=max_lines)
+        self.lock = threading.Lock()
+        for widget in widgets:
+            widget.document().setMaximumBlockCount(max_lines)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(interval_ms)
+
+    def append(self, message, color="white"):
+        timestamp = datetime.now().strftime("[%H:%M:%S]")
+        formatted = f'<span style="color: gray;">{timestamp}</span> <span style="color: {color};">{html.escape(message)}</span>'
+        with self.lock:
+            self.pending.append(formatted)
+        if self.file_log:
+            self.file_log.write(f"{timestamp} {message}")
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            lines = list(self.pending)
+            self.pending.clear()
+        for widget in self.widgets:
+            # One edit block per flush keeps it to a single layout pass.
+            scrollbar = widget.verticalScrollBar()
+            at_bottom = scrollbar.value() == scrollbar.maximum()
+            document = widget.document()
+            cursor = QTextCursor(document)
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.beginEditBlock()
+            for line in lines:
+                if not document.isEmpty():
+                    cursor.insertBlock()
+                cursor.insertHtml(line)
+            cursor.endEditBlock()
+            if at_bottom:
+                scrollbar.setValue(scrollbar.maximum())
+
+
+class ProgressCoalescer(QObject):
+    # Workers call update() from any thread; the latest value is applied on the
+    # GUI thread at most `fps` times per second.
+    def __init__(self, apply, fps=20, parent=None):
+        super().__init__(parent)
+        self.apply = apply
+        self.latest = None
+        self.lock = threading.Lock()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(max(1, int(1000 / fps)))
+
+    def update(self, *args):
+        with self.lock:
+            self.latest = args
+
+    def flush(self):
+        with self.lock:
+            latest, self.latest = self.latest, None
+        if latest is not None:
+            self.apply(*latest)
@@ -0,0 +1,82 @@
+import threading
+
+# Options that vary per track and are applied to the existing instance instead
+# of rebuilding it (the output folder differs between playlists).
+PER_CALL_OPTIONS = ("outtmpl",)
+
+
+class YoutubeDLPool:
+    # Keeps one YoutubeDL per thread and per purpose ("search", "download") so a
+    # worker reuses the same extractors, cookie jar and keep-alive connections
+    # across tracks. An instance is rebuilt when its options other than
+    # PER_CALL_OPTIONS change or after reset() is called for it. yt_dlp is only imported when the first
+    # instance is built, since loading its extractors is slow.
+    def __init__(self, factory=None):
+        self.factory = factory
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.instances = []
+
+    def _slots(self):
+        slots = getattr(self.local, "slots", None)
+        if slots is None:
+            slots = self.local.slots = {}
+        return slots
+
+    def get(self, name, opts):
+        slots = self._slots()
+        slot = slots.get(name)
+        shared = {key: value for key, value in opts.items() if key not in PER_CALL_OPTIONS}
+        if slot is not None and slot[0] == shared:
+            ydl = slot[1]
+            for key in PER_CALL_OPTIONS:
+                if key in opts:
+                    self._apply(ydl, key, opts[key])
+            return ydl
+        if slot is not None:
+            self.reset(name)
+        if self.factory is None:
+            import yt_dlp
+
+            self.factory = yt_dlp.YoutubeDL
+        ydl = self.factory(dict(opts))
+        slots[name] = (shared, ydl)
+        with self.lock:
+            self.instances.append(ydl)
+        return ydl
+
+    def _apply(self, ydl, key, value):
+        current = ydl.params.get(key)
+        if isinstance(current, dict) and not isinstance(value, dict):
+            # YoutubeDL normalizes outtmpl to {"default": ..., "chapter": ...}.
+            current["default"] = value
+        else:
+            ydl.params[key] = value
+
+    def reset(self, name=None):
+        slots = self._slots()
+        names = [name] if name else list(slots)
+        for key in names:
+            slot = slots.pop(key, None)
+            if slot is not None:
+                self._close(slot[1])
+
+    def _close(self, ydl):
+        with self.lock:
+            if ydl in self.instances:
+                self.instances.remove(ydl)
+        try:
+            ydl.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        # Only call this once the worker threads are idle.
+        with self.lock:
+            instances, self.instances = self.instances, []
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception:
+                pass
+        self.local = threading.local()